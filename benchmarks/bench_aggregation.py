@@ -0,0 +1,48 @@
+"""
+MODULE:       bench_aggregation
+PURPOSE:      measure the values per second the WindowAggregator takes in
+              and the time to get the window summaries.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import random
+import time
+
+from libardurep import aggregation
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sensors", type=int, default=20)
+    parser.add_argument("--samples", type=int, default=200000)
+    parser.add_argument("--rate", type=float, default=1000.0, \
+                                help="values per second and sensor")
+    args = parser.parse_args()
+    rand = random.Random(1)
+    values = [rand.gauss(20, 5) for i in range(args.samples)]
+    for name, options in (("tumbling 60s", {"length": 60}), \
+                            ("sliding 1h/1min", {"length": 3600, \
+                                                        "step": 60})):
+        a = aggregation.WindowAggregator(**options)
+        start = time.perf_counter()
+        for i in range(args.samples):
+            a.add("sensor_%d" % (i % args.sensors), \
+                    1500000000.0 + i / (args.rate * args.sensors), values[i])
+        elapsed = time.perf_counter() - start
+        now = 1500000000.0 + args.samples / (args.rate * args.sensors)
+        start = time.perf_counter()
+        a.get_entries(now)
+        report = time.perf_counter() - start
+        bins = sum([len(p.sketch.positive) + len(p.sketch.negative) \
+                        for k in a.panes for p in a.panes[k]])
+        print("%-16s values/s: %8.0f  report ms: %7.2f  panes: %5d  " \
+                "sketch bins: %6d" % (name, args.samples / elapsed, \
+                    report * 1000, sum([len(p) for p in a.panes.values()]), \
+                                                                    bins))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+MODULE:       bench_alerting
+PURPOSE:      measure the time to check the thresholds of many sensors with
+              the AlertEngine (by default, and always on its arrays)
+              compared to a plain loop over the records.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import random
+import time
+
+from libardurep import alerting, datastore
+
+def loop(data, state, hysteresis):
+    """
+    The same threshold rule, one sensor after the other
+    """
+    events = []
+    for k in data:
+        r = data[k]
+        limit = r.threshold
+        if state.get(k):
+            limit -= hysteresis
+        over = r.value > limit
+        if over != state.get(k, False):
+            state[k] = over
+            events.append((k, over))
+    return events
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sensors", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--changed", type=float, default=1.0, \
+                        help="fraction of the sensors updated per round")
+    args = parser.parse_args()
+    rand = random.Random(1)
+    frames = [[{"id": "sensor_%d" % s, "value": rand.uniform(0, 100), \
+                            "threshold": 90} for s in range(args.sensors)]]
+    for i in range(args.rounds - 1):
+        frames.append([{"id": "sensor_%d" % s, \
+                        "value": rand.uniform(0, 100), "threshold": 90} \
+                            for s in range(args.sensors) \
+                                            if rand.random() < args.changed])
+    store = datastore.DataStore()
+    engines = {
+        "arrays": alerting.AlertEngine(store, default_hysteresis=2.0, \
+                                                                max_loop=0),
+        "engine": alerting.AlertEngine(store, default_hysteresis=2.0)
+    }
+    engine = engines["arrays"]
+    state = {}
+    names = ["loop", "engine", "arrays"]
+    timings = dict([(k, 0.0) for k in names])
+    events = dict([(k, 0) for k in names])
+    for i, f in enumerate(frames):
+        store.register_records(f)
+        # take turns to be the first to touch the new records
+        for k in names[i % 3:] + names[:i % 3]:
+            start = time.perf_counter()
+            if k in engines:
+                events[k] += len(engines[k].evaluate())
+            else:
+                events[k] += len(loop(store.data, state, 2.0))
+            if i > 0:
+                # the first round only sets up the sensors
+                timings[k] += time.perf_counter() - start
+    for k in names:
+        print("%-8s ms/round: %8.3f  events: %7d" % \
+                    (k, timings[k] * 1000 / (args.rounds - 1), events[k]))
+    # the vectorized check alone, without copying the records in
+    idx = engine.update(store.data)
+    start = time.perf_counter()
+    for i in range(args.rounds):
+        engine.check(idx)
+    print("%-8s ms/round: %8.3f" % ("check", \
+                    (time.perf_counter() - start) * 1000 / args.rounds))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+MODULE:       bench_archive
+PURPOSE:      compare the binary archive with the JSON tuples written by
+              DataReporter.log_file(), writing them report by report the
+              way the reporter does and scanning one sensor.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from libardurep import archive, datareporter, datastore
+
+def report(url, samples, sensors):
+    """
+    Register a record per sensor and log them, report by report
+    """
+    store = datastore.DataStore()
+    reporter = datareporter.DataReporter(store, url)
+    ids = ["sensor_%d" % k for k in range(sensors)]
+    start = time.perf_counter()
+    for i in range(samples // sensors):
+        store.register_records([{"id": s, "value": float(i)} \
+                                            for s in ids], 1500000000.0 + i)
+        reporter.log()
+    reporter.close()
+    return time.perf_counter() - start
+
+def write_json(path, samples, sensors):
+    """
+    The JSON tuples log_file() appends
+    """
+    return report("file://" + path, samples, sensors)
+
+def scan_json(path, sensor_id):
+    start = time.perf_counter()
+    total = 0.0
+    with open(path) as fh:
+        d = json.JSONDecoder()
+        buf = fh.read()
+        pos = 0
+        while pos < len(buf):
+            # the tuples are indented and separated by ",\n"
+            while pos < len(buf) and buf[pos] in ", \n":
+                pos += 1
+            if pos == len(buf):
+                break
+            o, pos = d.raw_decode(buf, pos)
+            if o["id"] == sensor_id:
+                total += o["value"]
+    return time.perf_counter() - start, total
+
+def write_archive(path, samples, sensors):
+    """
+    The snapshots log_archive() appends
+    """
+    return report("archive://" + path, samples, sensors)
+
+def write_archive_bulk(path, samples, sensors):
+    """
+    Samples appended one by one, written every 'chunk_size' samples
+    """
+    start = time.perf_counter()
+    w = archive.ArchiveWriter(path)
+    for i in range(samples):
+        w.append("sensor_%d" % (i % sensors), 1500000000.0 + i, float(i))
+    w.close()
+    return time.perf_counter() - start
+
+def open_archive(path):
+    """
+    Time to open the archive and the blocks per sensor
+    """
+    start = time.perf_counter()
+    r = archive.ArchiveReader(path)
+    s = time.perf_counter() - start
+    blocks = len(r.chunks("sensor_0"))
+    r.close()
+    return s, blocks
+
+def scan_archive(path, sensor_id):
+    start = time.perf_counter()
+    r = archive.ArchiveReader(path)
+    times, values = r.get(sensor_id)
+    total = float(values.sum())
+    del times, values
+    r.close()
+    return time.perf_counter() - start, total
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=int, default=200000, \
+                        help="number of samples (e.g. 100000000 for the " \
+                                                            "big picture)")
+    parser.add_argument("--sensors", type=int, default=10)
+    parser.add_argument("--skip-json", action="store_true", \
+                                help="only measure the archive")
+    args = parser.parse_args()
+    d = tempfile.mkdtemp()
+    try:
+        formats = [("archive", write_archive, scan_archive, "a"), \
+                ("append", write_archive_bulk, scan_archive, "b")]
+        if not args.skip_json:
+            formats.append(("json tuples", write_json, scan_json, "j"))
+        for name, write, scan, f in formats:
+            path = os.path.join(d, f)
+            w = write(path, args.samples, args.sensors)
+            s, total = scan(path, "sensor_0")
+            print("%-12s write samples/s: %10.0f  scan sensor_0: %8.3fs  " \
+                    "bytes/sample: %5.1f" % (name, args.samples / w, s, \
+                                    os.path.getsize(path) / args.samples))
+            if scan is scan_archive:
+                o, blocks = open_archive(path)
+                print("%-12s open: %8.3fs  blocks of sensor_0: %d" % \
+                                                        ("", o, blocks))
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+MODULE:       bench_asyncreader
+PURPOSE:      compare the CPU time and memory used per device by one
+              SerialReader thread per device and one AsyncReaderManager.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import os
+import threading
+import time
+
+from libardurep import asyncreader, datastore, serialreader
+
+def rss():
+    """
+    Get the resident set size of this process in kB
+    """
+    with open("/proc/self/status") as fh:
+        for l in fh:
+            if l.startswith("VmRSS:"):
+                return int(l.split()[1])
+    return 0
+
+def feed(masters, rate, duration):
+    """
+    Send a frame to every pseudo terminal 'rate' times per second
+    """
+    frame = b'[\r\n  {"id":"temperature","value":21.5,"unit":"C"},\r\n' + \
+            b'  {"id":"humidity","value":65,"unit":"%"}\r\n]\r\n'
+    end = time.time() + duration
+    sent = 0
+    while time.time() < end:
+        for m in masters:
+            os.write(m, frame)
+        sent += len(masters)
+        time.sleep(1.0 / rate)
+    return sent
+
+class CountingStore(datastore.DataStore):
+    def __init__(self):
+        datastore.DataStore.__init__(self)
+        self.frames = 0
+
+    def register_records(self, records):
+        self.frames += 1
+        datastore.DataStore.register_records(self, records)
+
+def measure(mode, devices, rate, duration):
+    ptys = [os.openpty() for i in range(devices)]
+    names = [os.ttyname(s) for m, s in ptys]
+    store = CountingStore()
+    rss_before = rss()
+    cpu_before = time.process_time()
+    if mode == "async":
+        manager = asyncreader.AsyncReaderManager()
+        for n in names:
+            manager.add_reader(n, 9600, store, 0)
+        manager.start()
+        halt = manager.stop
+    else:
+        readers = [serialreader.SerialReader(n, 9600, store, 0, timeout=1, \
+                            blocking=(mode == "blocking")) for n in names]
+        for r in readers:
+            r.start()
+        def halt():
+            for r in readers:
+                r.halt()
+            for r in readers:
+                r.join()
+    sent = feed([m for m, s in ptys], rate, duration)
+    # give the readers a chance to catch up
+    time.sleep(0.5)
+    rss_after = rss()
+    threads = threading.active_count()
+    cpu = time.process_time() - cpu_before
+    halt()
+    for m, s in ptys:
+        os.close(m)
+        os.close(s)
+    print("%-8s devices: %3d  threads: %3d  frames: %6d/%-6d  " \
+            "cpu/device: %7.2f ms/s  rss/device: %6.1f kB" % \
+            (mode, devices, threads, store.frames, sent, \
+            1000 * cpu / duration / devices, \
+            float(rss_after - rss_before) / devices))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--devices", type=int, default=30)
+    parser.add_argument("--rate", type=float, default=2, \
+                        help="frames per second and device")
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+    for mode in ("polling", "blocking", "async"):
+        measure(mode, args.devices, args.rate, args.duration)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+MODULE:       bench_codec
+PURPOSE:      compare the JSON codecs decoding frames into the DataStore and
+              encoding them again, by the number of sensors per frame.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import time
+
+from benchmarks.emulator import FrameGenerator
+from libardurep import codec, datastore, frameparser
+
+def measure(c, sensors, entries):
+    """
+    Get the frames per second decoded (register_json), parsed from the
+    serial lines (FrameParser) and encoded (get_json of fresh records)
+    """
+    rounds = max(1, entries // sensors)
+    g = FrameGenerator(sensors)
+    frames = [g.text(i) for i in range(rounds)]
+    store = datastore.DataStore(codec=c)
+    start = time.perf_counter()
+    for f in frames:
+        store.register_json(f)
+    decode = rounds / (time.perf_counter() - start)
+    lines = [b"".join(g.lines(i)) for i in range(rounds)]
+    parser = frameparser.FrameParser(codec=c)
+    start = time.perf_counter()
+    for l in lines:
+        parser.feed(l)
+    parse = rounds / (time.perf_counter() - start)
+    records = [g.entries(i) for i in range(rounds)]
+    encode_time = 0.0
+    for r in records:
+        store.register_records(r)
+        start = time.perf_counter()
+        store.get_json()
+        encode_time += time.perf_counter() - start
+    return decode, parse, rounds / encode_time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--entries", type=int, default=50000, \
+                                    help="sensor entries per measurement")
+    args = parser.parse_args()
+    codecs = [("json", True)]
+    for name in ("orjson", "ujson"):
+        try:
+            codec.get_codec(name)
+        except ImportError:
+            print("%s is not installed" % name)
+            continue
+        codecs.append((name, True))
+        codecs.append((name, False))
+    print("%-18s %8s %14s %14s %14s" % ("codec", "sensors", "decode/s", \
+                                                    "parse/s", "encode/s"))
+    for sensors in (1, 10, 100, 1000):
+        for name, compatible in codecs:
+            c = codec.get_codec(name, compatible)
+            decode, parse, encode = measure(c, sensors, args.entries)
+            print("%-18s %8d %14.0f %14.0f %14.0f" % (name + \
+                        ("" if compatible else " (fast)"), sensors, decode, \
+                                                            parse, encode))
+
+if __name__ == "__main__":
+    main()
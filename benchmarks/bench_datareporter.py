@@ -0,0 +1,58 @@
+"""
+MODULE:       bench_datareporter
+PURPOSE:      measure the reports per second sent via HTTP POST to a local
+              stand-in for the collecting web server.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import requests
+import time
+
+from benchmarks.bench_suite import start_collector
+from benchmarks.emulator import FrameGenerator
+from libardurep import datastore, datareporter
+
+class UnpooledReporter(datareporter.DataReporter):
+    """
+    Reporter posting the way it was done before the session was pooled
+    """
+
+    def log_post(self, url=None, credentials=None, do_verify_certificate=True):
+        headers = {"Content-Type": "application/json"}
+        requests.post(url or self.url, headers=headers, \
+                    data=self.store.get_json(), verify=do_verify_certificate)
+
+def measure(name, reporter, server, reports):
+    posts = server.posts
+    start = time.perf_counter()
+    for i in range(reports):
+        reporter.log()
+    reporter.close()
+    elapsed = time.perf_counter() - start
+    print("%-14s reports/s: %8.1f  POST requests: %5d" % \
+                    (name, reports / elapsed, server.posts - posts))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reports", type=int, default=500)
+    parser.add_argument("--sensors", type=int, default=20)
+    parser.add_argument("--batch", type=int, default=10)
+    args = parser.parse_args()
+    server, url = start_collector()
+    store = datastore.DataStore()
+    store.register_records(FrameGenerator(args.sensors).entries(0))
+    measure("requests.post", UnpooledReporter(store, url), server, \
+                                                                args.reports)
+    measure("session", datareporter.DataReporter(store, url), server, \
+                                                                args.reports)
+    measure("session+batch", datareporter.DataReporter(store, url, \
+                        batch_size=args.batch), server, args.reports)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
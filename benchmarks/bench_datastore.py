@@ -0,0 +1,81 @@
+"""
+MODULE:       bench_datastore
+PURPOSE:      measure the throughput of a data store shared by writer and
+              reader threads.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import threading
+import time
+
+from benchmarks.emulator import FrameGenerator
+from libardurep import datastore
+
+def measure(concurrent, writers, readers, sensors, duration):
+    store = datastore.DataStore(concurrent=concurrent)
+    # the decoded frames every writer is going to register
+    frames = []
+    for w in range(writers):
+        g = FrameGenerator(sensors, seed=w, prefix="w%d_" % w)
+        frames.append([g.entries(i) for i in range(100)])
+    counts = {"frames": 0, "snapshots": 0, "errors": 0}
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def count(key, n):
+        with lock:
+            counts[key] += n
+
+    def write(w):
+        n = 0
+        while not done.is_set():
+            store.register_records(frames[w][n % 100])
+            n += 1
+        count("frames", n)
+
+    def read():
+        n = 0
+        e = 0
+        while not done.is_set():
+            try:
+                store.get_json()
+                n += 1
+            except RuntimeError:
+                e += 1
+        count("snapshots", n)
+        count("errors", e)
+
+    threads = [threading.Thread(target=write, args=(w,)) \
+                                    for w in range(writers)] + \
+                [threading.Thread(target=read) for r in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    done.set()
+    for t in threads:
+        t.join()
+    print("concurrent: %-5s writers: %2d readers: %2d sensors: %4d  " \
+            "frames/s: %8.0f  get_json/s: %7.0f  errors: %d" % \
+            (concurrent, writers, readers, sensors, \
+            counts["frames"] / duration, counts["snapshots"] / duration, \
+            counts["errors"]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--sensors", type=int, default=20, \
+                                                help="sensors per frame")
+    parser.add_argument("--duration", type=float, default=3)
+    args = parser.parse_args()
+    for concurrent in (False, True):
+        measure(concurrent, args.writers, args.readers, args.sensors, \
+                                                            args.duration)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+MODULE:       bench_delta
+PURPOSE:      compare the bytes reported per hour in full and delta mode
+              on a simulated greenhouse controller.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import math
+import random
+
+from libardurep import datastore, delta
+
+class Greenhouse(object):
+    """
+    Temperatures and humidities drifting slowly with some sensor noise,
+    light levels and switches changing now and then
+    """
+
+    def __init__(self, sensors, seed=1):
+        self.random = random.Random(seed)
+        self.sensors = sensors
+
+    def frame(self, t):
+        r = self.random
+        entries = []
+        for i in range(self.sensors):
+            kind = i % 4
+            if kind == 0:
+                v = round(21 + 3 * math.sin(t / 7200.0 + i) + \
+                                                    r.gauss(0, 0.03), 2)
+                entries.append({"id": "temp_%d" % i, "value": v, "unit": "C"})
+            elif kind == 1:
+                v = round(60 + 10 * math.sin(t / 5400.0 + i) + \
+                                                    r.gauss(0, 0.3), 1)
+                entries.append({"id": "humidity_%d" % i, "value": v, \
+                                                                "unit": "%"})
+            elif kind == 2:
+                v = int(500 + 400 * math.sin(t / 3600.0 + i) + \
+                                                            r.gauss(0, 3))
+                entries.append({"id": "light_%d" % i, "value": v, \
+                                                            "unit": "lux"})
+            else:
+                # toggles about every half hour
+                v = "on" if int(t / 1800.0 + i) % 2 else "off"
+                entries.append({"id": "pump_%d" % i, "value": v})
+        return entries
+
+def run(name, sensors, hours, frame_interval, report_interval, options):
+    store = datastore.DataStore()
+    source = Greenhouse(sensors)
+    d = None if options is None else delta.DeltaReport(store, **options)
+    total = 0
+    reports = 0
+    t = 0
+    while t < hours * 3600:
+        store.register_records(source.frame(t))
+        if t % report_interval == 0:
+            if d is None:
+                j = store.get_json()
+            else:
+                j = d.get_json(now=t)
+            if j != "[]":
+                total += len(j.encode("UTF-8"))
+                reports += 1
+        t += frame_interval
+    print("%-28s bytes/hour: %9.0f  reports/hour: %5.0f" % \
+                                    (name, total / hours, reports / hours))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sensors", type=int, default=24)
+    parser.add_argument("--hours", type=int, default=24)
+    parser.add_argument("--frame-interval", type=int, default=2)
+    parser.add_argument("--report-interval", type=int, default=10)
+    args = parser.parse_args()
+    deadband = {}
+    for i in range(args.sensors):
+        deadband["temp_%d" % i] = 0.1
+        deadband["humidity_%d" % i] = 1.0
+        deadband["light_%d" % i] = 10
+    for name, options in (
+            ("full", None),
+            ("delta", {}),
+            ("delta deadband", {"deadband": deadband}),
+            ("delta deadband keyframe/15m", {"deadband": deadband, \
+                                                "keyframe_interval": 900})):
+        run(name, args.sensors, args.hours, args.frame_interval, \
+                                            args.report_interval, options)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+MODULE:       bench_extract
+PURPOSE:      compare the compiled input -> record -> output mapping of
+              the data store with looking up the keys for every record.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import timeit
+
+from benchmarks.emulator import FrameGenerator
+from libardurep import datastore
+from libardurep.record import MISSING
+
+class LookupStore(datastore.DataStore):
+    """
+    Data store mapping the keys the way it was done before they were
+    compiled, everything else (ingest, publishing) is the same
+    """
+
+    def compile_mapping(self):
+        datastore.DataStore.compile_mapping(self)
+        self.extract = self.lookup_extract
+        self.translate = self.lookup_translate
+
+    def lookup_extract(self, v, timestamp, now=None):
+        r = self.record_type(v[self.id_key], v[self.value_key])
+        if self.unit_key in v:
+            r.unit = v[self.unit_key]
+        if self.threshold_key in v:
+            r.threshold = v[self.threshold_key]
+        if self.other_keys:
+            o = tuple([v.get(k, MISSING) for k in self.other_keys])
+            for e in o:
+                if e is not MISSING:
+                    r.other = o
+                    break
+        if self.sensor_time_key in v:
+            r.sensor_time = v[self.sensor_time_key]
+        r.time = timestamp
+        r.received = now
+        return r
+
+    def lookup_translate(self, r):
+        t = {}
+        for l, v in r.items():
+            t[self.translation_keys.get(l, l)] = v
+        return t
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", \
+                                                default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    with open("./schemas/meta-schema.json", "r") as fh:
+        m = fh.read()
+    with open("./examples/extended-input-schema.json", "r") as fh:
+        s = fh.read()
+    with open("./schemas/default-schema.json", "r") as fh:
+        o = fh.read()
+    print("%8s %12s %12s %12s %12s" % ("sensors", "lookup in", \
+                            "compiled in", "lookup out", "compiled out"))
+    for n in args.sizes:
+        frame = FrameGenerator(n, "extended").entries(0)
+        stores = [LookupStore(s, m, o, m), datastore.DataStore(s, m, o, m)]
+        best = [None] * 4
+        # alternate, so both share the same conditions
+        for i in range(args.rounds):
+            for j, store in enumerate(stores):
+                for k, f in enumerate((lambda: store.register_records(frame), \
+                                            store.get_translated_data)):
+                    t = timeit.timeit(f, number=args.repeat) / args.repeat
+                    if best[2 * k + j] is None or t < best[2 * k + j]:
+                        best[2 * k + j] = t
+        print("%8d %9.1f us %9.1f us %9.1f us %9.1f us" % \
+                (n, 1e6 * best[0], 1e6 * best[1], 1e6 * best[2], \
+                                                            1e6 * best[3]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+MODULE:       bench_filesink
+PURPOSE:      measure the sustained reports per second written to a local
+              file by DataReporter.log_file().
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from libardurep import datastore, datareporter
+
+def measure(name, store, path, reports, options):
+    """
+    Write the reports, to a file sink unless the options are None
+    """
+    reporter = datareporter.DataReporter(store, "file://" + path)
+    if options is not None:
+        reporter.open_file_sink(**options)
+    start = time.perf_counter()
+    for i in range(reports):
+        reporter.log()
+    reporter.close()
+    elapsed = time.perf_counter() - start
+    size = sum([os.path.getsize(os.path.join(os.path.dirname(path), f)) \
+                                for f in os.listdir(os.path.dirname(path))])
+    print("%-22s reports/s: %9.0f  bytes/report: %6d" % \
+                                (name, reports / elapsed, size // reports))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--reports", type=int, default=5000)
+    parser.add_argument("--sensors", type=int, default=20)
+    args = parser.parse_args()
+    store = datastore.DataStore()
+    store.register_records([{"id": "sensor_%d" % i, "value": i, \
+                                "unit": "C"} for i in range(args.sensors)])
+    for name, options in (("open/append", None), \
+                            ("sink", {}), \
+                            ("sink fsync/100", {"fsync_every": 100}), \
+                            ("sink fsync/1", {"fsync_every": 1}), \
+                            ("sink rotate 1MB gzip", {"max_bytes": 2 ** 20, \
+                                                    "compress": "gzip"})):
+        d = tempfile.mkdtemp()
+        try:
+            measure(name, store, os.path.join(d, "log"), args.reports, \
+                                                                    options)
+        finally:
+            shutil.rmtree(d)
+
+if __name__ == "__main__":
+    main()
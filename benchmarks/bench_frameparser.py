@@ -0,0 +1,75 @@
+"""
+MODULE:       bench_frameparser
+PURPOSE:      compare the incremental frame parser with assembling the
+              frame as a string and decoding it as a whole.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from benchmarks.emulator import FrameGenerator
+from libardurep import frameparser
+
+def concatenate(lines):
+    """
+    The way the serial reader used to build and decode a frame
+    """
+    data = ""
+    for l in lines:
+        l = l[:-2].decode("UTF-8")
+        if (l == "["):
+            data = "["
+        elif (l == "]") and (len(data) > 4) and (data[0] == "["):
+            data = data + "]"
+            return json.loads(data)
+        elif (l[0:3] == "  {"):
+            data = data + " " + l
+
+def stream(lines):
+    """
+    The incremental parser
+    """
+    parser = frameparser.FrameParser()
+    for l in lines:
+        records = parser.feed_line(l)
+        if records is not None:
+            return records
+
+def measure(f, lines, repeat):
+    # time it without tracing the memory, which slows down every
+    # allocation
+    start = time.perf_counter()
+    for i in range(repeat):
+        records = f(lines)
+    elapsed = (time.perf_counter() - start) / repeat
+    tracemalloc.start()
+    f(lines)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return records, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", \
+                                        default=[10, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print("%8s %16s %16s %14s %14s" % ("sensors", "concat (ms)", \
+                        "stream (ms)", "concat peak", "stream peak"))
+    for n in args.sizes:
+        lines = FrameGenerator(n).lines(0)
+        a, ta, ma = measure(concatenate, lines, args.repeat)
+        b, tb, mb = measure(stream, lines, args.repeat)
+        assert a == b
+        print("%8d %16.3f %16.3f %12d kB %12d kB" % \
+                        (n, 1000 * ta, 1000 * tb, ma // 1024, mb // 1024))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+MODULE:       bench_imports
+PURPOSE:      measure the time and memory it takes to import the modules of
+              libardurep in a new interpreter, as a short-lived program has
+              to.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import subprocess
+import sys
+
+STATEMENTS = (
+    "from libardurep import datastore",
+    "from libardurep import datastore, datareporter",
+    "from libardurep import datastore, datareporter, serialreader",
+)
+
+# reports the resident set size in kB after the imports
+RSS = "\nfor l in open('/proc/self/status'):\n" \
+      "    if l.startswith('VmRSS:'): print(l.split()[1])"
+
+def measure(statement):
+    """
+    Get the cumulative import time (-X importtime) of the top level
+    modules imported by 'statement' in microseconds, and the resident
+    set size in kB afterwards
+    """
+    p = subprocess.Popen([sys.executable, "-X", "importtime", "-c", \
+                    statement + RSS], stdout=subprocess.PIPE, \
+                    stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    total = 0
+    for l in err.decode("UTF-8").splitlines():
+        f = l[len("import time:"):].split("|")
+        # only the libardurep modules imported by the statement itself
+        if len(f) == 3 and f[2].startswith(" libardurep"):
+            total += int(f[1])
+    return total, int(out or 0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of libardurep")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+    for s in STATEMENTS:
+        results = [measure(s) for i in range(args.rounds)]
+        print("%-62s %7.1f ms  RSS: %6d kB" % (s, \
+                            min([t for t, r in results]) / 1000.0, \
+                            min([r for t, r in results])))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+MODULE:       bench_ingest
+PURPOSE:      measure what the samples of a sensor sending a thousand times
+              per second cost with and without an ingest policy.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+
+The sensor is emulated on a clock of its own (a sample every millisecond)
+so the measurement does not depend on sleeping. Every sample comes in a
+frame of its own, as the lines of the serial line, and is registered
+either as decoded entries or from the lines (with the frame parser).
+"""
+
+import argparse
+import math
+import random
+import time
+
+from libardurep import datastore
+from libardurep.frameparser import FrameParser
+from libardurep.ingest import IngestPolicy
+
+POLICIES = (
+    ("none", None),
+    ("max_rate=10", IngestPolicy(max_rate=10)),
+    ("coalesce=0.1", IngestPolicy(coalesce=0.1)),
+    ("deadband=0.5", IngestPolicy(deadband=0.5)),
+)
+
+def make_samples(count, rate):
+    """
+    Get (time, lines) of the frames of a slowly changing noisy sensor
+    """
+    r = random.Random(0)
+    samples = []
+    for i in range(count):
+        v = round(20 + 5 * math.sin(i / 5000.0) + r.uniform(-0.2, 0.2), 3)
+        samples.append((i / float(rate), [b"[\r\n", \
+                b'  {"id":"fast","value":' + repr(v).encode() + \
+                b',"unit":"C"}\r\n', b"]\r\n"]))
+    return samples
+
+def measure(policy, samples, parse, rounds):
+    """
+    The best microseconds per sample of some rounds, and the samples
+    registered
+    """
+    best = None
+    for r in range(rounds):
+        store = datastore.DataStore(metrics=False, \
+                                    default_ingest_policy=policy)
+        parser = FrameParser(codec=store.codec)
+        if parse:
+            start = time.perf_counter()
+            for t, lines in samples:
+                for l in lines:
+                    j = parser.feed_line(l)
+                store.register_records(j, t)
+        else:
+            frames = [(t, [parser.parse_record(lines[1].strip())]) \
+                                                    for t, lines in samples]
+            start = time.perf_counter()
+            for t, j in frames:
+                store.register_records(j, t)
+        us = (time.perf_counter() - start) * 1e6 / len(samples)
+        if best is None or us < best:
+            best = us
+    return best, store.version
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=int, default=1000, \
+                                            help="samples per second")
+    parser.add_argument("--seconds", type=int, default=20, \
+                                            help="of samples (emulated)")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    samples = make_samples(args.rate * args.seconds, args.rate)
+    for parse in (False, True):
+        print("registered from " + ("the lines" if parse else \
+                                                    "the decoded entries"))
+        results = {}
+        # alternate the policies, so they share the same conditions
+        for i in range(3):
+            for name, policy in POLICIES:
+                us, n = measure(policy, samples, parse, args.rounds)
+                if name not in results or us < results[name][0]:
+                    results[name] = (us, n)
+        for name, policy in POLICIES:
+            us, n = results[name]
+            print("  policy: %-13s %6.2f us/sample  %5.1f%% CPU at %d Hz" \
+                    "  registered: %6d of %d" % (name, us, \
+                    us * args.rate / 1e4, args.rate, n, len(samples)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+MODULE:       bench_jsoncache
+PURPOSE:      measure repeated get_json() calls while only a few sensors
+              change between the calls.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import json
+import random
+import time
+
+from libardurep import datastore
+
+def encode_all(store, prettyprint=False):
+    """
+    Translate and encode all the entries on every call (no cache)
+    """
+    j = list(store.get_translated_data().values())
+    if prettyprint:
+        return json.dumps(j, indent=2, separators=(',',': '))
+    return json.dumps(j)
+
+def measure(f, store, sensors, changed, calls):
+    elapsed = 0
+    for i in range(calls):
+        store.register_records([{"id": "sensor_%d" % s, \
+                        "value": random.random(), "unit": "C"} \
+                        for s in random.sample(range(sensors), changed)])
+        start = time.perf_counter()
+        f()
+        elapsed += time.perf_counter() - start
+    return elapsed / calls
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sensors", type=int, nargs="+", \
+                                            default=[100, 1000, 10000])
+    parser.add_argument("--changed", type=float, default=0.01, \
+                        help="part of the sensors changing between calls")
+    parser.add_argument("--calls", type=int, default=50)
+    args = parser.parse_args()
+    for n in args.sensors:
+        store = datastore.DataStore()
+        store.register_records([{"id": "sensor_%d" % s, "value": s, \
+                                            "unit": "C"} for s in range(n)])
+        changed = max(1, int(n * args.changed))
+        for p in (False, True):
+            assert encode_all(store, p) == store.get_json(p)
+            a = measure(lambda: encode_all(store, p), store, n, changed, \
+                                                                args.calls)
+            b = measure(lambda: store.get_json(p), store, n, changed, \
+                                                                args.calls)
+            print("sensors: %6d  changed: %4d  pretty: %-5s  " \
+                    "uncached: %8.2f ms  cached: %8.2f ms  (x%.1f)" % \
+                    (n, changed, p, 1000 * a, 1000 * b, a / b))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+MODULE:       bench_metrics
+PURPOSE:      measure the overhead of the metrics on the hot paths.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import os
+import threading
+import time
+import tty
+
+from benchmarks.emulator import FrameGenerator
+from libardurep import datastore, metrics, serialreader
+
+def ingest(m, texts, lines):
+    store = datastore.DataStore(metrics=m)
+    start = time.perf_counter()
+    for t in texts:
+        store.register_json(t)
+    return len(texts) / (time.perf_counter() - start)
+
+def serialize(m, texts, lines):
+    store = datastore.DataStore(metrics=m)
+    start = time.perf_counter()
+    for t in texts:
+        # a new record per sensor, so every fragment is encoded again
+        store.register_json(t)
+        store.get_json()
+    return len(texts) / (time.perf_counter() - start)
+
+def feed(fd, data):
+    data = memoryview(data)
+    while data:
+        data = data[os.write(fd, data):]
+
+def read(m, texts, lines):
+    """
+    Read the frames through run_blocking() from a pseudo terminal fed
+    by another thread, the reader stops after the last frame
+    """
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    store = datastore.DataStore(metrics=m)
+    # a round per frame
+    reader = serialreader.SerialReader(os.ttyname(slave), 9600, store, \
+                            len(lines), timeout=10, blocking=True, metrics=m)
+    feeder = threading.Thread(target=feed, args=(master, \
+                            b"".join([b"".join(frame) for frame in lines])))
+    try:
+        start = time.perf_counter()
+        feeder.start()
+        reader.run()
+        s = time.perf_counter() - start
+        feeder.join()
+    finally:
+        reader.device.close()
+        os.close(master)
+        os.close(slave)
+    return len(lines) / s
+
+def quantile(x, q):
+    x = sorted(x)
+    return x[int(q * (len(x) - 1) + 0.5)]
+
+def median(x):
+    return quantile(x, 0.5)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sensors", type=int, default=20, \
+                                                help="sensors per frame")
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--read-frames", type=int, default=200, \
+                help="frames sent over the serial line (it is read byte " \
+                                                        "by byte, slowly)")
+    parser.add_argument("--rounds", type=int, default=41)
+    args = parser.parse_args()
+    # the frames as JSON strings and as the lines of the serial line
+    g = FrameGenerator(args.sensors)
+    texts = [g.text(i) for i in range(args.frames)]
+    lines = [g.lines(i) for i in range(args.read_frames)]
+    for name, f in (("register_json", ingest), \
+                    ("register_json + get_json", serialize), \
+                    ("serial lines", read)):
+        rates = {False: [], True: []}
+        overheads = []
+        # alternate, so both share the same conditions, and compare the
+        # rounds pairwise: a single round varies by several percent
+        for r in range(args.rounds):
+            without = f(False, texts, lines)
+            with_metrics = f(metrics.MetricsRegistry(), texts, lines)
+            rates[False].append(without)
+            rates[True].append(with_metrics)
+            overheads.append((without / with_metrics - 1) * 100)
+        print("%-26s frames/s without: %8.0f  with: %8.0f  overhead: " \
+                "%5.1f%% (%.1f%% .. %.1f%%)" % (name, median(rates[False]), \
+                median(rates[True]), median(overheads), \
+                quantile(overheads, 0.25), quantile(overheads, 0.75)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+MODULE:       bench_records
+PURPOSE:      compare the memory used by the sensor records of the data
+              store with the dict per sensor used before.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import datetime
+import time
+import tracemalloc
+
+from benchmarks.emulator import FrameGenerator
+from libardurep import datastore
+
+def register_dicts(data, j):
+    """
+    The dict of dicts the data store used to build
+    """
+    timestamp = datetime.datetime.utcnow().replace(microsecond=0).isoformat()
+    for v in j:
+        data[v["id"]] = {}
+        data[v["id"]]["id"] = v["id"]
+        data[v["id"]]["value"] = v["value"]
+        if "unit" in v:
+            data[v["id"]]["unit"] = v["unit"]
+        if "threshold" in v:
+            data[v["id"]]["threshold"] = v["threshold"]
+        data[v["id"]]["time"] = timestamp
+
+def measure(name, f, sensors):
+    frame = FrameGenerator(sensors).entries(0)
+    # time it without tracing the memory
+    start = time.perf_counter()
+    f(frame)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = f(frame)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print("%-8s sensors: %7d  memory: %8d kB  %6.1f B/sensor  " \
+            "time: %7.1f ms" % (name, sensors, size // 1024, \
+            float(size) / sensors, 1000 * elapsed))
+    return kept
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sensors", type=int, nargs="+", \
+                                            default=[1000, 10000, 100000])
+    args = parser.parse_args()
+    for n in args.sensors:
+        def dicts(frame):
+            data = {}
+            register_dicts(data, frame)
+            return data
+        def records(frame):
+            store = datastore.DataStore()
+            store.register_records(frame)
+            return store
+        def fragments(frame):
+            # the JSON strings cached once a sensor was reported
+            store = records(frame)
+            for prettyprint in (False, True):
+                for translate in (False, True):
+                    store.get_json_fragments(prettyprint, translate)
+            return store
+        measure("dicts", dicts, n)
+        measure("records", records, n)
+        measure("+json x4", fragments, n)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+MODULE:       bench_schemaregistry
+PURPOSE:      measure the time to create data stores with schemas, sharing
+              the schema registry or not, and the cold start of a process.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+from libardurep import datastore, schemaregistry
+
+def cold_start(code, runs=5):
+    """
+    The fastest of some runs of a new interpreter
+    """
+    best = None
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, "-c", code])
+        t = time.perf_counter() - start
+        best = t if best is None else min(best, t)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--stores", type=int, default=1000)
+    args = parser.parse_args()
+    with open("./schemas/meta-schema.json", "r") as fh:
+        meta = fh.read()
+    with open("./examples/extended-input-schema.json", "r") as fh:
+        schema_in = fh.read()
+    with open("./examples/custom-output-schema.json", "r") as fh:
+        schema_out = fh.read()
+    with open("./examples/custom-output-meta-schema.json", "r") as fh:
+        meta_out = fh.read()
+    for name, shared in (("registry per store", False), \
+                                                ("shared registry", True)):
+        stores = []
+        start = time.perf_counter()
+        for i in range(args.stores):
+            r = None if shared else schemaregistry.SchemaRegistry()
+            stores.append(datastore.DataStore(schema_in, meta, schema_out, \
+                                                    meta_out, registry=r))
+        elapsed = time.perf_counter() - start
+        print("%-20s stores/s: %9.0f" % (name, args.stores / elapsed))
+    base = cold_start("pass")
+    for name, code in (
+            ("cold start", "from libardurep import datastore; " \
+                                        "datastore.DataStore()"),
+            ("cold start + schema", "from libardurep import datastore; " \
+                "s = open('./examples/extended-input-schema.json').read(); " \
+                "m = open('./schemas/meta-schema.json').read(); " \
+                                        "datastore.DataStore(s, m)")):
+        print("%-20s ms: %7.1f" % (name, (cold_start(code) - base) * 1000))
+
+if __name__ == "__main__":
+    main()
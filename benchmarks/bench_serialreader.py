@@ -0,0 +1,76 @@
+"""
+MODULE:       bench_serialreader
+PURPOSE:      measure the latency from the end of a frame on the serial
+              line to its arrival in the data store.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import random
+import serial
+import threading
+import time
+
+from libardurep import datastore, serialreader
+
+class TimedStore(datastore.DataStore):
+    """
+    Store that remembers when each frame was registered
+    """
+
+    def __init__(self):
+        datastore.DataStore.__init__(self)
+        self.arrivals = []
+        self.arrived = threading.Event()
+
+    def register_records(self, records):
+        self.arrivals.append(time.time())
+        datastore.DataStore.register_records(self, records)
+        self.arrived.set()
+
+def measure(blocking, frames, gap):
+    """
+    Send a number of frames over 'loop://' and return the latencies
+    """
+    store = TimedStore()
+    reader = serialreader.SerialReader(None, 9600, store, 0, \
+                                                    blocking=blocking)
+    reader.device_name = "loop://"
+    reader.device = serial.serial_for_url("loop://", timeout=60)
+    reader.start()
+    latencies = []
+    for i in range(frames):
+        # let the frames arrive at random points in time
+        time.sleep(random.uniform(0, gap))
+        store.arrived.clear()
+        reader.device.write(('[\r\n  {"id":"s","value":%d}\r\n' % i).encode())
+        sent = time.time()
+        reader.device.write(b']\r\n')
+        store.arrived.wait(10)
+        latencies.append(store.arrivals[-1] - sent)
+    reader.halt()
+    reader.join()
+    return latencies
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    n = len(latencies)
+    print("%-10s frames: %4d  mean: %8.2f ms  p50: %8.2f ms  max: %8.2f ms" % \
+            (name, n, 1000 * sum(latencies) / n, 1000 * latencies[n // 2], \
+            1000 * latencies[-1]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--gap", type=float, default=1.5, \
+                        help="maximal random pause between frames (s)")
+    args = parser.parse_args()
+    report("polling", measure(False, args.frames, args.gap))
+    report("blocking", measure(True, args.frames, args.gap))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+MODULE:       bench_sharedtable
+PURPOSE:      compare the frames per second read from several devices by
+              reader threads in one process and by an IngestPool with 1, 2
+              and 4 worker processes.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+
+The devices are emulated in a process of their own and send as fast as
+they are read. The store is updated (and encoded to JSON, as for a
+report) every 'interval' seconds in this process. The frames read are
+counted by the sequence numbers of the devices in the store.
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+
+from benchmarks.emulator import DeviceEmulator, FrameGenerator, open_pty, \
+                                                                pty_writer
+from libardurep import datastore, serialreader, sharedtable
+
+def emulate(masters, sensors, stopping):
+    """
+    Run the device emulators until 'stopping' is set
+    """
+    devices = [DeviceEmulator(pty_writer(m), FrameGenerator(sensors, \
+                            prefix="d%d." % i)) for i, m in enumerate(masters)]
+    for d in devices:
+        d.start()
+    stopping.wait()
+    for d in devices:
+        d.stop()
+    for d in devices:
+        d.join()
+
+def count_frames(store, devices):
+    n = 0
+    for i in range(devices):
+        r = store.data.get("d%d.seq" % i)
+        if r is not None:
+            n += r.value + 1
+    return n
+
+def measure(workers, devices, sensors, duration, interval):
+    """
+    Get the frames per second read with 'workers' processes (0: threads
+    in this process)
+    """
+    ptys = [open_pty() for i in range(devices)]
+    store = datastore.DataStore(concurrent=not workers, metrics=False)
+    if workers:
+        pool = sharedtable.IngestPool([n for m, s, n in ptys], 115200, \
+                                            store, workers, timeout=0.2)
+        pool.start()
+        update = pool.update
+        halt = pool.stop
+    else:
+        readers = [serialreader.SerialReader(n, 115200, store, 0, 0.2, \
+                                True, metrics=False) for m, s, n in ptys]
+        for r in readers:
+            r.start()
+        update = lambda: None
+
+        def halt():
+            for r in readers:
+                r.halt()
+            for r in readers:
+                r.join()
+
+    stopping = multiprocessing.Event()
+    emulator = multiprocessing.Process(target=emulate, \
+                            args=([m for m, s, n in ptys], sensors, stopping))
+    emulator.start()
+    # warm up
+    end = time.time() + 1
+    while time.time() < end:
+        update()
+        time.sleep(interval)
+    start = time.time()
+    first = count_frames(store, devices)
+    cpu = time.process_time()
+    end = start + duration
+    while time.time() < end:
+        update()
+        store.get_json()
+        time.sleep(interval)
+    update()
+    frames = count_frames(store, devices) - first
+    elapsed = time.time() - start
+    cpu = time.process_time() - cpu
+    stopping.set()
+    emulator.join()
+    halt()
+    for m, s, n in ptys:
+        os.close(m)
+        os.close(s)
+    return frames / elapsed, cpu / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling of the "
+                                        "multi-process ingestion")
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--sensors", type=int, default=20)
+    parser.add_argument("--workers", default="0,1,2,4", \
+                        help="worker processes to try, 0: threads")
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--interval", type=float, default=0.1, \
+                        help="seconds between the updates of the store")
+    args = parser.parse_args()
+    print("%d devices, %d sensors per frame, %d CPUs" % (args.devices, \
+                                        args.sensors, os.cpu_count() or 0))
+    for w in [int(w) for w in args.workers.split(",")]:
+        rate, cpu = measure(w, args.devices, args.sensors, args.duration, \
+                                                                args.interval)
+        print("%-10s %8.1f frames/s  %5.1f%% CPU in the reporting process" \
+                        % ("%d workers" % w if w else "threads", rate, \
+                        100 * cpu))
+
+if __name__ == "__main__":
+    main()
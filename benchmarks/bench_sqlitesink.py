@@ -0,0 +1,60 @@
+"""
+MODULE:       bench_sqlitesink
+PURPOSE:      measure the samples per second inserted into SQLite by
+              batch size and the time of the query helpers.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from libardurep import sqlitesink
+
+def measure(path, samples, sensors, batch_size):
+    s = sqlitesink.SQLiteSink(path, batch_size=batch_size)
+    start = time.perf_counter()
+    for i in range(samples):
+        s.append("sensor_%d" % (i % sensors), 1500000000.0 + i // sensors, \
+                                                                    float(i))
+    s.flush()
+    elapsed = time.perf_counter() - start
+    print("batch %5d  samples/s: %9.0f" % (batch_size, samples / elapsed))
+    return s
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--samples", type=int, default=100000)
+    parser.add_argument("--sensors", type=int, default=20)
+    args = parser.parse_args()
+    d = tempfile.mkdtemp()
+    try:
+        for batch_size in (1, 100, 1000):
+            s = measure(os.path.join(d, "db%d" % batch_size), \
+                    args.samples if batch_size > 1 else args.samples // 20, \
+                                                    args.sensors, batch_size)
+            if batch_size == 1000:
+                end = 1500000000.0 + args.samples // args.sensors
+                for name, query in (
+                        ("latest", lambda: s.latest("sensor_1")),
+                        ("range 1h", lambda: s.get_range("sensor_1", \
+                                                        end - 3600, end)),
+                        ("aggregates 1min", lambda: s.get_aggregates( \
+                                                        "sensor_1", 60))):
+                    start = time.perf_counter()
+                    for i in range(100):
+                        query()
+                    print("%-16s ms: %8.3f" % (name, \
+                                    (time.perf_counter() - start) * 10))
+            s.close()
+    finally:
+        shutil.rmtree(d)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""
+MODULE:       bench_suite
+PURPOSE:      measure the whole way from the serial line over the data
+              store to the reports with an emulated device, and keep the
+              results to compare them between releases.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+
+Every scenario runs a SerialReader on a pseudo terminal, written to by a
+DeviceEmulator, into a DataStore reported by a DataReporter every
+'report_interval' seconds. It reports the frames (and records) per
+second that made it into the store, the latency from the end of a frame
+on the line to its registration (p50, p99), the data lines dropped and
+the memory used.
+
+    python -m benchmarks.bench_suite --output results.json
+    python -m benchmarks.bench_suite --compare results.json
+
+Needs a POSIX system for the pseudo terminals.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from benchmarks.emulator import SCHEMA_FILES, DeviceEmulator, \
+                                    FrameGenerator, open_pty, pty_writer
+from libardurep import datareporter, datastore, serialreader
+
+class Arrivals(object):
+    """
+    Store listener noting the time every frame arrived by its sequence
+    number
+    """
+
+    def __init__(self):
+        self.times = {}
+
+    def __call__(self, records):
+        r = records.get("seq")
+        if r is not None:
+            self.times[r.value] = time.time()
+
+class Collector(BaseHTTPRequestHandler):
+    """
+    Accepts the reports posted, and counts them
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.posts += 1
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class CollectorServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def start_collector():
+    """
+    Start a Collector on a free local port, return the server (with the
+    number of reports in 'posts') and its URL
+    """
+    server = CollectorServer(("127.0.0.1", 0), Collector)
+    server.posts = 0
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server, "http://127.0.0.1:%d/" % server.server_address[1]
+
+def make_store(schema):
+    """
+    Get a store for the schema, shared by the reader and the reporting
+    thread
+    """
+    f = SCHEMA_FILES[schema]
+    if f is None:
+        return datastore.DataStore(concurrent=True)
+    with open(f, "r") as fh:
+        in_schema = fh.read()
+    with open("./schemas/meta-schema.json", "r") as fh:
+        meta_schema = fh.read()
+    return datastore.DataStore(in_schema, meta_schema, concurrent=True)
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[int(round(p * (len(values) - 1)))]
+
+def get_rss_mb():
+    """
+    The memory used by the process now, respectively at its peak if the
+    current one is unknown
+    """
+    try:
+        with open("/proc/self/statm", "r") as fh:
+            pages = int(fh.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1048576.0
+    except (IOError, OSError, ValueError):
+        return get_max_rss_mb()
+
+def get_max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes instead of kilobytes
+        return rss / 1048576.0
+    return rss / 1024.0
+
+def get_name(s):
+    return "%s sensors=%d rate=%s corruption=%g sink=%s" % (s["schema"], \
+                s["sensors"], s["rate"] or "max", s["corruption"], s["sink"])
+
+def run_scenario(scenario, duration, report_interval, seed, directory):
+    """
+    Run a scenario for 'duration' seconds, return its results
+    """
+    store = make_store(scenario["schema"])
+    arrivals = Arrivals()
+    store.add_listener(arrivals)
+    master, slave, device_name = open_pty()
+    reader = serialreader.SerialReader(device_name, 115200, store, 0, \
+                                            timeout=0.2, blocking=True)
+    os.close(slave)
+    server = None
+    if scenario["sink"] == "post":
+        server, url = start_collector()
+    else:
+        url = "file://" + os.path.join(directory, "report.json")
+    reporter = datareporter.DataReporter(store, url)
+    if scenario["sink"] == "file":
+        reporter.open_file_sink(url)
+    report_times = []
+    done = threading.Event()
+
+    def report():
+        while not done.wait(report_interval):
+            start = time.perf_counter()
+            reporter.log()
+            report_times.append(time.perf_counter() - start)
+
+    generator = FrameGenerator(scenario["sensors"], scenario["schema"], \
+                                            scenario["corruption"], seed)
+    device = DeviceEmulator(pty_writer(master), generator, scenario["rate"])
+    reporting = threading.Thread(target=report)
+    reader.start()
+    reporting.start()
+    start = time.time()
+    device.start()
+    time.sleep(duration)
+    device.stop()
+    device.join()
+    # let the reader catch up with what is still on the line
+    n = -1
+    deadline = time.time() + 10
+    while n != len(arrivals.times) and time.time() < deadline:
+        n = len(arrivals.times)
+        time.sleep(0.3)
+    end = max(arrivals.times.values()) if arrivals.times else time.time()
+    reader.halt()
+    reader.join()
+    done.set()
+    reporting.join()
+    reporter.close()
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+    os.close(master)
+
+    latencies = [arrivals.times[i] - device.sent[i] for i in arrivals.times \
+                                                        if i in device.sent]
+    frames = len(arrivals.times)
+    elapsed = end - start
+    result = dict(scenario)
+    result.update({
+        "name": get_name(scenario),
+        "frames_sent": device.count,
+        "frames": frames,
+        "frames_per_second": frames / elapsed,
+        "records_per_second": frames * (scenario["sensors"] + 1) / elapsed,
+        "latency_p50_ms": 1000 * percentile(latencies, 0.5) \
+                                                    if latencies else None,
+        "latency_p99_ms": 1000 * percentile(latencies, 0.99) \
+                                                    if latencies else None,
+        "lines_dropped": reader.parser.dropped,
+        "reports": len(report_times),
+        "report_ms_mean": 1000 * sum(report_times) / len(report_times) \
+                                                    if report_times else None,
+        "rss_mb": get_rss_mb(),
+        "max_rss_mb": get_max_rss_mb()
+    })
+    return result
+
+def compare(results, baseline, tolerance):
+    """
+    Print the changes against the results of an earlier run, return
+    the names of the scenarios that got worse by more than 'tolerance'
+    percent
+    """
+    old = dict([(r["name"], r) for r in baseline["results"]])
+    worse = []
+    for r in results:
+        o = old.get(r["name"])
+        if o is None:
+            print("%-62s new" % r["name"])
+            continue
+        line = "%-62s" % r["name"]
+        bad = False
+        # fewer frames per second is worse, except if the device was the
+        # limit; a longer latency is worse
+        for k, sign in (("frames_per_second", -1), ("latency_p99_ms", 1)):
+            if not o.get(k) or r.get(k) is None:
+                continue
+            change = 100.0 * (r[k] - o[k]) / o[k]
+            line += "  %s %+6.1f%%" % (k, change)
+            if sign * change > tolerance:
+                bad = True
+        if bad:
+            line += "  WORSE"
+            worse.append(r["name"])
+        print(line)
+    return worse
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, \
+                        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sensors", default="20", \
+                        help="sensors per frame, comma separated")
+    parser.add_argument("--rates", default="0,100", \
+                        help="frames per second (0: as fast as possible)")
+    parser.add_argument("--corruption", default="0,0.05", \
+                        help="probability of a data line to be corrupt")
+    parser.add_argument("--schemas", default="default,extended")
+    parser.add_argument("--sinks", default="file", help="file and/or post")
+    parser.add_argument("--duration", type=float, default=3, \
+                        help="seconds per scenario")
+    parser.add_argument("--report-interval", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default="", \
+                        help="e.g. the release, stored with the results")
+    parser.add_argument("--output", help="save the results to this file")
+    parser.add_argument("--compare", help="results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=10.0, \
+                        help="percent a scenario may get worse")
+    args = parser.parse_args()
+    scenarios = []
+    for schema in args.schemas.split(","):
+        for sensors in args.sensors.split(","):
+            for rate in args.rates.split(","):
+                for corruption in args.corruption.split(","):
+                    for sink in args.sinks.split(","):
+                        scenarios.append({
+                            "schema": schema,
+                            "sensors": int(sensors),
+                            "rate": float(rate),
+                            "corruption": float(corruption),
+                            "sink": sink
+                        })
+    directory = tempfile.mkdtemp()
+    results = []
+    try:
+        for s in scenarios:
+            r = run_scenario(s, args.duration, args.report_interval, \
+                                                        args.seed, directory)
+            results.append(r)
+            print("%-62s frames/s: %8.1f  p50: %7.2f ms  p99: %7.2f ms  " \
+                    "dropped: %5d  rss: %6.1f MB" % (r["name"], \
+                    r["frames_per_second"], r["latency_p50_ms"] or 0, \
+                    r["latency_p99_ms"] or 0, r["lines_dropped"], r["rss_mb"]))
+    finally:
+        shutil.rmtree(directory)
+    run = {
+        "label": args.label,
+        "time": datetime.datetime.now(datetime.timezone.utc).replace( \
+                                                microsecond=0).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "duration": args.duration,
+        "report_interval": args.report_interval,
+        "seed": args.seed,
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(run, fh, indent=2, separators=(',', ': '), \
+                                                            sort_keys=True)
+    if args.compare:
+        with open(args.compare, "r") as fh:
+            baseline = json.load(fh)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
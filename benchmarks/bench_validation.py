@@ -0,0 +1,61 @@
+"""
+MODULE:       bench_validation
+PURPOSE:      measure the overhead of validating the entries on ingest.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import argparse
+import time
+
+from benchmarks.emulator import FrameGenerator
+from libardurep import datastore
+
+def measure(store, frames, rounds):
+    """
+    The best frames/s of some rounds
+    """
+    best = 0
+    for r in range(rounds):
+        start = time.perf_counter()
+        for f in frames:
+            store.register_json(f)
+        best = max(best, len(frames) / (time.perf_counter() - start))
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sensors", type=int, default=20, \
+                                                help="sensors per frame")
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--bad", type=int, default=0, \
+                        help="make one in that many entries invalid")
+    args = parser.parse_args()
+    with open("./schemas/meta-schema.json", "r") as fh:
+        meta = fh.read()
+    with open("./examples/extended-input-schema.json", "r") as fh:
+        extended = fh.read()
+    for name, schema in (("default schema", None), \
+                                            ("extended schema", extended)):
+        g = FrameGenerator(args.sensors, "extended" if schema else \
+                        "default", invalid=args.bad and 1.0 / args.bad)
+        frames = [g.text(i) for i in range(args.frames)]
+        results = {}
+        # alternate the modes, so they share the same conditions
+        for i in range(3):
+            for mode in (None, "reject", "quarantine"):
+                store = datastore.DataStore(schema, schema and meta, \
+                                                        validation=mode)
+                results[mode] = max(results.get(mode, 0), \
+                                    measure(store, frames, args.rounds))
+        for mode in (None, "reject", "quarantine"):
+            print("%-16s validation: %-10s frames/s: %8.0f  overhead: " \
+                    "%5.1f%%" % (name, mode, results[mode], \
+                    (results[None] / results[mode] - 1) * 100))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+MODULE:       emulator
+PURPOSE:      pretend to be an arduino sending sensor data frames, for the
+              benchmarks.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+
+The frames look like the ones the sketches print:
+
+    [
+      {"id":"s0","value":21.5,"unit":"C","threshold":30},
+      ...
+    ]
+
+The first entry of every frame is the sequence number ("seq"), it is
+never corrupted, so the receiving end can tell which frame arrived.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+# the key names per schema variant
+SCHEMAS = {
+    "default": {
+        "id": "id",
+        "value": "value",
+        "unit": "unit",
+        "threshold": "threshold",
+        "other": {}
+    },
+    # examples/extended-input-schema.json
+    "extended": {
+        "id": "ourVeryCustomSensorName",
+        "value": "sensorValue",
+        "unit": "sensorValueUnit",
+        "threshold": "criticalThreshold",
+        "other": {
+            "warnThreshold": lambda i, s: 25.0 + s,
+            "measurementTimestamp": lambda i, s: time.strftime("%H:%M:%S")
+        }
+    }
+}
+
+# the schema files to create a data store for the variants with
+SCHEMA_FILES = {
+    "default": None,
+    "extended": "./examples/extended-input-schema.json"
+}
+
+class FrameGenerator(object):
+    """
+    Produces the lines of the frames of a device with 'sensors' sensors.
+    With 'corruption' set, every data line is broken with that
+    probability: cut off, garbled (not UTF-8) or lost altogether. With
+    'invalid' set, every value is a string instead of a number with that
+    probability (still JSON, but not valid against the schema). The
+    sensor ids start with 'prefix', to tell several devices apart.
+    """
+
+    def __init__(self, sensors=20, schema="default", corruption=0.0, \
+                                            seed=0, prefix="", invalid=0.0):
+        self.sensors = sensors
+        self.prefix = prefix
+        self.keys = SCHEMAS[schema]
+        self.corruption = corruption
+        self.invalid = invalid
+        self.random = random.Random(seed)
+
+    def entry(self, i, s):
+        k = self.keys
+        e = {
+            k["id"]: "%ss%d" % (self.prefix, s),
+            k["value"]: round(20.0 + s + self.random.uniform(-1, 1), 2),
+            k["unit"]: "C"
+        }
+        if self.invalid and self.random.random() < self.invalid:
+            e[k["value"]] = "broken"
+        if s % 2 == 0:
+            e[k["threshold"]] = 30 + s
+        for o in k["other"]:
+            e[o] = k["other"][o](i, s)
+        return e
+
+    def seq_entry(self, i):
+        k = self.keys
+        return {k["id"]: self.prefix + "seq", k["value"]: i}
+
+    def entries(self, i):
+        """
+        Get the entries of the i-th frame as they are decoded (never
+        corrupted)
+        """
+        return [self.seq_entry(i)] + \
+                            [self.entry(i, s) for s in range(self.sensors)]
+
+    def text(self, i):
+        """
+        Get the i-th frame as one JSON string (never corrupted)
+        """
+        return json.dumps(self.entries(i))
+
+    def lines(self, i):
+        """
+        Get the lines (bytes) of the i-th frame
+        """
+        lines = [b"[\r\n", ("  " + json.dumps(self.seq_entry(i)) + \
+                                                ",\r\n").encode("UTF-8")]
+        for s in range(self.sensors):
+            sep = "," if s < self.sensors - 1 else ""
+            l = ("  " + json.dumps(self.entry(i, s)) + sep + "\r\n" \
+                                                            ).encode("UTF-8")
+            if self.corruption and self.random.random() < self.corruption:
+                l = self.corrupt(l)
+            lines.append(l)
+        lines.append(b"]\r\n")
+        return lines
+
+    def corrupt(self, l):
+        r = self.random.random()
+        if r < 0.45:
+            # a line cut short
+            return l[:len(l) // 2] + b"\r\n"
+        if r < 0.9:
+            # noise on the line
+            return l[:6] + b"\xff\xfe" + l[8:]
+        # the line is lost
+        return b""
+
+class DeviceEmulator(threading.Thread):
+    """
+    Writes the frames of a FrameGenerator with 'write' (returning the
+    number of bytes written, e.g. to the master side of a pseudo
+    terminal, see pty_writer()) at 'rate' frames per second (0: as fast
+    as the other side reads), for at most 'frames' frames. Remembers the
+    time every frame was completely written.
+    """
+
+    def __init__(self, write, generator, rate=0, frames=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.write = write
+        self.generator = generator
+        self.rate = rate
+        self.frames = frames
+        self.stopping = threading.Event()
+        # frame number -> time it was written
+        self.sent = {}
+        self.count = 0
+
+    def run(self):
+        start = time.time()
+        i = 0
+        while not self.stopping.is_set():
+            if self.frames is not None and i >= self.frames:
+                break
+            if self.rate:
+                # keep to the schedule
+                delay = start + i / float(self.rate) - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            data = b"".join(self.generator.lines(i))
+            while data and not self.stopping.is_set():
+                data = data[self.write(data):]
+            if data:
+                break
+            self.sent[i] = time.time()
+            i += 1
+            self.count = i
+
+    def stop(self):
+        self.stopping.set()
+
+def open_pty():
+    """
+    Open a pseudo terminal, return the file descriptors of the master
+    side to write to and of the slave side (keep it open until the
+    reader has opened it) and the name of the device the reader is to
+    open
+    """
+    import pty
+    import tty
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    return master, slave, os.ttyname(slave)
+
+def pty_writer(master):
+    """
+    Get a function writing to the master side of a pseudo terminal
+    without blocking when the reader does not keep up
+    """
+    os.set_blocking(master, False)
+
+    def write(data):
+        try:
+            return os.write(master, data)
+        except BlockingIOError:
+            time.sleep(0.001)
+            return 0
+
+    return write
@@ -0,0 +1,409 @@
+"""
+MODULE:       aggregation
+PURPOSE:      summarize the sensor values over time windows.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+from collections import deque
+import datetime
+import math
+import threading
+import time
+
+from libardurep.codec import finite, get_codec
+from libardurep.record import MISSING
+
+class Stats(object):
+    """
+    Count, minimum, maximum, mean and variance of a series of values,
+    updated in constant time (Welford) and mergeable (Chan et al.)
+    """
+
+    __slots__ = ("count", "min", "max", "mean", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.count += 1
+        d = x - self.mean
+        self.mean += d / self.count
+        self.m2 += d * (x - self.mean)
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+
+    def merge(self, other):
+        if not other.count:
+            return
+        n = self.count + other.count
+        d = other.mean - self.mean
+        self.mean += d * other.count / n
+        self.m2 += other.m2 + d * d * self.count * other.count / n
+        self.count = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def variance(self):
+        """
+        The sample variance
+        """
+        if self.count < 2:
+            return 0.0
+        return self.m2 / (self.count - 1)
+
+class QuantileSketch(object):
+    """
+    Approximate quantiles with a relative error of at most
+    'relative_accuracy', the values are counted in logarithmically
+    sized bins (as in DDSketch). Sketches are mergeable and never use
+    more than 'max_bins' bins, the bins of the values closest to zero
+    are merged if needed.
+    """
+
+    __slots__ = ("gamma", "log_gamma", "max_bins", "positive", "negative", \
+                                                        "zero", "count")
+
+    # values closer to zero than this count as zero
+    MIN_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy=0.01, max_bins=256):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        # bin index -> count, by the magnitude of the values
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+
+    def add(self, x):
+        self.count += 1
+        if x > self.MIN_VALUE:
+            b = self.positive
+        elif x < -self.MIN_VALUE:
+            b = self.negative
+            x = -x
+        else:
+            self.zero += 1
+            return
+        k = int(math.ceil(math.log(x) / self.log_gamma))
+        if k in b:
+            b[k] += 1
+        else:
+            b[k] = 1
+            if len(self.positive) + len(self.negative) > self.max_bins:
+                self.collapse()
+
+    def collapse(self):
+        """
+        Merge the bin of the smallest magnitude into its neighbour
+        """
+        b = self.positive
+        if len(self.negative) > 1 and (len(b) < 2 or \
+                                        min(self.negative) < min(b)):
+            b = self.negative
+        if len(b) < 2:
+            return
+        low = sorted(b.keys())[0:2]
+        b[low[1]] += b.pop(low[0])
+
+    def merge(self, other):
+        for mine, theirs in ((self.positive, other.positive), \
+                                        (self.negative, other.negative)):
+            for k in theirs:
+                mine[k] = mine.get(k, 0) + theirs[k]
+        self.zero += other.zero
+        self.count += other.count
+        while len(self.positive) + len(self.negative) > self.max_bins:
+            self.collapse()
+
+    def value(self, k):
+        return 2 * self.gamma ** k / (self.gamma + 1)
+
+    def quantile(self, q):
+        """
+        Get the approximate q-quantile (0 <= q <= 1), None if empty
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        n = 0
+        for k in sorted(self.negative.keys(), reverse=True):
+            n += self.negative[k]
+            if n > rank:
+                return -self.value(k)
+        n += self.zero
+        if n > rank:
+            return 0.0
+        for k in sorted(self.positive.keys()):
+            n += self.positive[k]
+            if n > rank:
+                return self.value(k)
+        return self.value(max(self.positive.keys()))
+
+class Pane(object):
+    """
+    The summary of the values of a sensor in a time slot
+    """
+
+    __slots__ = ("start", "stats", "sketch", "unit")
+
+    def __init__(self, start, relative_accuracy, max_bins):
+        self.start = start
+        self.stats = Stats()
+        self.sketch = QuantileSketch(relative_accuracy, max_bins)
+        self.unit = None
+
+class WindowAggregator(object):
+    """
+    Summarizes the numeric values of every sensor over a time window
+    instead of keeping only the last value. The window is divided into
+    panes of 'step' seconds: a value is added to the current pane in
+    constant time and a window is the merge of its panes, so memory is
+    bounded by the number of panes and the sketch size, whatever the
+    sample rate is.
+
+    Without a 'step', the windows are tumbling, i.e. the reports cover
+    the last complete window. Otherwise they are sliding and cover the
+    last 'length' seconds up to now.
+
+    Feed it with attach() to a data store. The aggregator can in turn be
+    reported by a DataReporter in place of the store (in JSON or text,
+    but not to the archive or SQLite sinks, which need raw values).
+    """
+
+    def __init__(self, length=60, step=None, quantiles=(0.5, 0.9, 0.99), \
+                    relative_accuracy=0.01, max_bins=128, max_panes=120, \
+                    store=None):
+        """
+        Initialize the aggregator
+            length              the length of the window in seconds
+            step                the length of a pane for sliding windows
+            quantiles           the quantiles to report
+            relative_accuracy   the error of the quantiles
+            max_bins            the size of the quantile sketches
+            max_panes           the number of panes per window at most
+            store               the data store to take the key names from
+        """
+        if step is None:
+            step = length
+        if step <= 0 or length < step:
+            raise ValueError("The step must be positive and not longer " \
+                                                            "than the window")
+        if int(math.ceil(float(length) / step)) > max_panes:
+            raise ValueError("Too many panes per window, choose a longer " \
+                                                                    "step")
+        self.length = length
+        self.step = step
+        self.tumbling = step == length
+        self.quantiles = quantiles
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.store = None
+        self.lock = threading.Lock()
+        # sensor id -> deque of panes, oldest first
+        self.panes = {}
+        self.last_data_timestamp = None
+        if store is not None:
+            self.attach(store)
+
+    def attach(self, store):
+        """
+        Aggregate the values registered by a data store
+        """
+        self.store = store
+        store.add_listener(self.add_records)
+
+    def detach(self):
+        self.store.remove_listener(self.add_records)
+
+    def add(self, sensor_id, t, value, unit=None):
+        """
+        Add a value at time t (epoch seconds), return False if it is not
+        a number
+        """
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        if not math.isfinite(value):
+            # NaN or infinity, neither can be summarized
+            return False
+        start = math.floor(t / self.step) * self.step
+        with self.lock:
+            panes = self.panes.get(sensor_id)
+            if panes is None:
+                panes = deque()
+                self.panes[sensor_id] = panes
+            if not panes or panes[-1].start < start:
+                panes.append(Pane(start, self.relative_accuracy, \
+                                                            self.max_bins))
+                self.evict(panes, start)
+            # a value arriving late goes to the newest pane anyway
+            p = panes[-1]
+            p.stats.add(value)
+            p.sketch.add(value)
+            if unit is not None:
+                p.unit = unit
+        return True
+
+    def evict(self, panes, start):
+        """
+        Forget the panes that can no longer be part of a window
+        """
+        # tumbling: the last complete window is still reported
+        oldest = start - self.length
+        if not self.tumbling:
+            oldest += self.step
+        while panes and panes[0].start < oldest:
+            panes.popleft()
+
+    def add_records(self, records):
+        """
+        Add the values of a sensor id -> record dict (a store listener)
+        """
+        for k in records:
+            r = records[k]
+            self.add(k, time.time() if r.received is None else r.received, \
+                        r.value, None if r.unit is MISSING else r.unit)
+            self.last_data_timestamp = r.time
+
+    def get_window(self, now=None):
+        """
+        Get the start and end of the window to report
+        """
+        if now is None:
+            now = time.time()
+        current = math.floor(now / self.step) * self.step
+        if self.tumbling:
+            return current - self.length, current
+        return current + self.step - self.length, current + self.step
+
+    def get_aggregate(self, sensor_id, now=None):
+        """
+        Get the summary (Stats, QuantileSketch, unit) of a sensor over
+        the window, None if there were no values
+        """
+        start, end = self.get_window(now)
+        stats = Stats()
+        sketch = QuantileSketch(self.relative_accuracy, self.max_bins)
+        unit = None
+        with self.lock:
+            for p in self.panes.get(sensor_id, ()):
+                if start <= p.start < end:
+                    stats.merge(p.stats)
+                    sketch.merge(p.sketch)
+                    unit = p.unit or unit
+        if not stats.count:
+            return None
+        return stats, sketch, unit
+
+    def get_entries(self, now=None, translate=True):
+        """
+        Get the summaries of all sensors over the window as list of
+        sensor entries with the count, min, max, mean, variance and the
+        quantiles (e.g. "p50")
+        """
+        if now is None:
+            now = time.time()
+        start, end = self.get_window(now)
+        id_key, unit_key = self.get_keys(translate)
+        with self.lock:
+            sensor_ids = list(self.panes.keys())
+        entries = []
+        for k in sensor_ids:
+            a = self.get_aggregate(k, now)
+            if a is None:
+                continue
+            stats, sketch, unit = a
+            e = {
+                id_key: k,
+                "count": stats.count,
+                "min": stats.min,
+                "max": stats.max,
+                "mean": stats.mean,
+                "variance": stats.variance(),
+                "start": iso(start),
+                "end": iso(end)
+            }
+            for q in self.quantiles:
+                e["p" + ("%g" % (q * 100)).replace(".", "_")] = \
+                                                        sketch.quantile(q)
+            if unit is not None:
+                e[unit_key] = unit
+            entries.append(e)
+        return entries
+
+    def get_keys(self, translate):
+        """
+        The names of the id and unit entries
+        """
+        s = self.store
+        if s is None:
+            return "id", "unit"
+        if translate:
+            return s.translation_keys.get(s.id, s.id_key), \
+                                    s.translation_keys.get(s.unit, s.unit_key)
+        return s.id_key, s.unit_key
+
+    # the part of the DataStore interface used by the DataReporter
+
+    def get_text(self):
+        t = "==== " + str(self.last_data_timestamp) + " ====\n"
+        id_key, unit_key = self.get_keys(False)
+        for e in self.get_entries(translate=False):
+            u = e.get(unit_key, "")
+            t += "%s mean %g%s (min %g, max %g, n %d)\n" % (e[id_key], \
+                                e["mean"], u, e["min"], e["max"], e["count"])
+        return t
+
+    def get_json_fragments(self, prettyprint=False, translate=True, \
+                                                                data=None):
+        # encoded like the store's own report
+        codec = getattr(self.store, "codec", None) or get_codec()
+        fragments = []
+        for e in self.get_entries(translate=translate):
+            for k in e:
+                e[k] = finite(e[k])
+            if prettyprint:
+                fragments.append("  " + codec.dumps_pretty(e).replace( \
+                                                            "\n", "\n  "))
+            else:
+                fragments.append(codec.dumps(e))
+        return fragments
+
+    def get_json(self, prettyprint=False, translate=True, data=None):
+        j = self.get_json_fragments(prettyprint, translate)
+        if not j:
+            return "[]"
+        if prettyprint:
+            return "[\n" + ",\n".join(j) + "\n]"
+        return "[" + ", ".join(j) + "]"
+
+    def get_json_lines(self, translate=True, data=None):
+        j = self.get_json_fragments(False, translate)
+        if not j:
+            return ""
+        return "\n".join(j) + "\n"
+
+    def get_json_tuples(self, prettyprint=False, translate=True, data=None):
+        j = self.get_json_fragments(prettyprint, translate)
+        if not j:
+            return ""
+        if prettyprint:
+            return "\n" + ",\n".join(j) + ",\n"
+        return ", ".join(j) + ","
+
+def iso(t):
+    return datetime.datetime.utcfromtimestamp(t).replace( \
+                                                microsecond=0).isoformat()
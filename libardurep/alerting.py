@@ -0,0 +1,344 @@
+"""
+MODULE:       alerting
+PURPOSE:      watch the sensor values and raise alerts.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import json
+import math
+import threading
+
+from libardurep.codec import finite
+
+# records checked in a loop instead of on the arrays, see AlertEngine
+MAX_LOOP = 32
+
+class AlertEvent(object):
+    """
+    A rule of a sensor was violated ('raised') or is fine again
+        kind          "threshold" or "rate"
+        value         the sensor value, respectively its rate of change
+                      per second
+        limit         the threshold, respectively the maximal rate
+        time          the time of arrival of the value (epoch seconds)
+    """
+
+    __slots__ = ("sensor_id", "kind", "raised", "value", "limit", "time")
+
+    def __init__(self, sensor_id, kind, raised, value, limit, time):
+        self.sensor_id = sensor_id
+        self.kind = kind
+        self.raised = raised
+        self.value = value
+        self.limit = limit
+        self.time = time
+
+    def to_dict(self):
+        # JSON has no NaN or infinity, they are given as None
+        return {
+            "id": self.sensor_id,
+            "kind": self.kind,
+            "raised": self.raised,
+            "value": finite(self.value),
+            "limit": finite(self.limit),
+            "time": self.time
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def __repr__(self):
+        return "AlertEvent(" + repr(self.to_dict()) + ")"
+
+class AlertEngine(object):
+    """
+    Checks the rules of all sensors at once on NumPy arrays, one element
+    per sensor, whenever new values arrive (see attach()) or on request
+    (see evaluate()).
+
+    A threshold alert is raised when the value gets over the threshold
+    (the sensor's own or one given here) and cleared when it drops back
+    below the threshold minus the hysteresis. A rate alert is raised
+    while the value changes faster than the maximal rate (per second).
+    Every change of an alert's state is passed as an AlertEvent to the
+    callbacks, e.g. to log it or to send it on with a DataReporter.
+
+    The values of the records that changed are still picked out one by
+    one, and a check on the arrays has a fixed cost of its own, so up to
+    'max_loop' records are checked one after the other in a loop instead
+    (see bench_alerting).
+    """
+
+    def __init__(self, store, callback=None, thresholds=None, \
+                    hysteresis=None, default_hysteresis=0.0, max_rate=None, \
+                    default_max_rate=None, max_loop=MAX_LOOP):
+        """
+        Initialize the engine
+            store               the data store to watch
+            callback            called with every AlertEvent
+            thresholds          sensor id -> threshold, overrides the one
+                                sent by the sensor
+            hysteresis          sensor id -> how far the value must drop
+                                below the threshold to clear the alert
+            default_hysteresis  the hysteresis of the other sensors
+            max_rate            sensor id -> maximal change per second
+            default_max_rate    the maximal rate of the other sensors
+                                (None: no rate alerts)
+            max_loop            number of records up to which they are
+                                checked in a loop instead of on the
+                                arrays
+        """
+        import numpy
+        self.np = numpy
+        self.store = store
+        self.callbacks = []
+        if callback is not None:
+            self.callbacks.append(callback)
+        self.thresholds = dict(thresholds or {})
+        self.hysteresis = dict(hysteresis or {})
+        self.default_hysteresis = default_hysteresis
+        self.max_rate = dict(max_rate or {})
+        self.default_max_rate = default_max_rate
+        self.max_loop = max_loop
+        self.lock = threading.Lock()
+        # the version of the store seen last
+        self.version = 0
+        # sensor id -> index in the arrays
+        self.index = {}
+        self.ids = []
+        empty = numpy.empty(0)
+        self.values = empty
+        self.times = empty
+        self.previous_values = empty
+        self.previous_times = empty
+        self.limits = empty
+        self.hystereses = empty
+        self.rates = empty
+        # the current state of the alerts
+        self.over = numpy.zeros(0, dtype=bool)
+        self.fast = numpy.zeros(0, dtype=bool)
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def attach(self):
+        """
+        Check the rules whenever the store registers new values
+        """
+        self.store.add_listener(self.check_records)
+
+    def detach(self):
+        self.store.remove_listener(self.check_records)
+
+    def add_sensors(self, sensor_ids):
+        """
+        Make room for new sensors in the arrays
+        """
+        np = self.np
+        for k in sensor_ids:
+            self.index[k] = len(self.ids)
+            self.ids.append(k)
+        n = len(sensor_ids)
+        nan = np.full(n, np.nan)
+        self.values = np.concatenate((self.values, nan))
+        self.times = np.concatenate((self.times, nan))
+        self.previous_values = np.concatenate((self.previous_values, nan))
+        self.previous_times = np.concatenate((self.previous_times, nan))
+        self.limits = np.concatenate((self.limits, nan))
+        self.hystereses = np.concatenate((self.hystereses, \
+                    [self.hysteresis.get(k, self.default_hysteresis) \
+                                                    for k in sensor_ids]))
+        r = [self.max_rate.get(k, self.default_max_rate) for k in sensor_ids]
+        self.rates = np.concatenate((self.rates, \
+                                [np.nan if v is None else v for v in r]))
+        self.over = np.concatenate((self.over, np.zeros(n, dtype=bool)))
+        self.fast = np.concatenate((self.fast, np.zeros(n, dtype=bool)))
+
+    def get_limit(self, k, r):
+        if k in self.thresholds:
+            return float(self.thresholds[k])
+        try:
+            return float(r.threshold)
+        except (TypeError, ValueError):
+            # MISSING or not a number
+            return float("nan")
+
+    def floats(self, items):
+        """
+        Convert a list to a float array in one go, or item by item if
+        some are not numbers (NaN for those)
+        """
+        try:
+            a = self.np.array(items, dtype=float)
+            if a.shape == (len(items),):
+                return a
+        except (TypeError, ValueError):
+            pass
+        nan = float("nan")
+        a = []
+        for x in items:
+            try:
+                a.append(float(x))
+            except (TypeError, ValueError):
+                # MISSING or not a number
+                a.append(nan)
+        return a
+
+    def update(self, records):
+        """
+        Copy the new values into the arrays, return the indexes of the
+        sensors updated
+        """
+        np = self.np
+        new = [k for k in records if k not in self.index]
+        if new:
+            self.add_sensors(new)
+        index = self.index
+        thresholds = self.thresholds
+        keys = list(records)
+        rs = [records[k] for k in keys]
+        idx = np.array([index[k] for k in keys], dtype=np.intp)
+        self.previous_values[idx] = self.values[idx]
+        self.previous_times[idx] = self.times[idx]
+        self.values[idx] = self.floats([r.value for r in rs])
+        # None is NaN
+        self.times[idx] = np.array([r.received for r in rs], dtype=float)
+        if thresholds:
+            limits = [thresholds[k] if k in thresholds else r.threshold \
+                                                for k, r in zip(keys, rs)]
+        else:
+            limits = [r.threshold for r in rs]
+        self.limits[idx] = self.floats(limits)
+        return idx
+
+    def check(self, idx):
+        """
+        Evaluate the rules, the rates only of the sensors updated
+        """
+        np = self.np
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # the limit drops by the hysteresis while an alert is raised
+            over = self.values > np.where(self.over, \
+                                    self.limits - self.hystereses, self.limits)
+            rate = (self.values[idx] - self.previous_values[idx]) / \
+                                (self.times[idx] - self.previous_times[idx])
+            fast = self.fast.copy()
+            fast[idx] = np.abs(rate) > self.rates[idx]
+        events = []
+        # convert the columns of the events to Python objects at once
+        i = np.flatnonzero(over != self.over)
+        for e in zip(i.tolist(), over[i].tolist(), self.values[i].tolist(), \
+                            self.limits[i].tolist(), self.times[i].tolist()):
+            events.append(AlertEvent(self.ids[e[0]], "threshold", *e[1:]))
+        j = np.flatnonzero(fast[idx] != self.fast[idx])
+        i = idx[j]
+        for e in zip(i.tolist(), fast[i].tolist(), rate[j].tolist(), \
+                            self.rates[i].tolist(), self.times[i].tolist()):
+            events.append(AlertEvent(self.ids[e[0]], "rate", *e[1:]))
+        self.over = over
+        self.fast = fast
+        return events
+
+    def check_loop(self, records):
+        """
+        Copy the new values into the arrays and evaluate the rules one
+        record after the other, the same way check() does
+        """
+        new = [k for k in records if k not in self.index]
+        if new:
+            self.add_sensors(new)
+        nan = float("nan")
+        thresholds = []
+        rates = []
+        for k in records:
+            r = records[k]
+            i = self.index[k]
+            try:
+                value = float(r.value)
+            except (TypeError, ValueError):
+                value = nan
+            t = nan if r.received is None else float(r.received)
+            limit = self.get_limit(k, r)
+            previous_value = self.values.item(i)
+            previous_time = self.times.item(i)
+            self.previous_values[i] = previous_value
+            self.previous_times[i] = previous_time
+            self.values[i] = value
+            self.times[i] = t
+            self.limits[i] = limit
+            raised = self.over.item(i)
+            if raised:
+                over = value > limit - self.hystereses.item(i)
+            else:
+                over = value > limit
+            if over != raised:
+                self.over[i] = over
+                thresholds.append((i, AlertEvent(k, "threshold", over, \
+                                                        value, limit, t)))
+            dv = value - previous_value
+            dt = t - previous_time
+            if dt:
+                rate = dv / dt
+            else:
+                # as NumPy divides by 0
+                rate = math.copysign(float("inf"), dv) if dv else nan
+            max_rate = self.rates.item(i)
+            fast = abs(rate) > max_rate
+            if fast != self.fast.item(i):
+                self.fast[i] = fast
+                rates.append(AlertEvent(k, "rate", fast, rate, max_rate, t))
+        thresholds.sort(key=lambda e: e[0])
+        return [e for i, e in thresholds] + rates
+
+    def check_changes(self, records):
+        if len(records) <= self.max_loop:
+            return self.check_loop(records)
+        return self.check(self.update(records))
+
+    def check_records(self, records):
+        """
+        Evaluate the rules with the new records given, return the events
+        """
+        with self.lock:
+            events = self.check_changes(records)
+        self.dispatch(events)
+        return events
+
+    def evaluate(self):
+        """
+        Evaluate the rules with what changed in the store since the last
+        evaluation, return the events
+        """
+        with self.lock:
+            self.version, records = self.store.get_changes(self.version)
+            events = self.check_changes(records)
+        self.dispatch(events)
+        return events
+
+    def dispatch(self, events):
+        """
+        Pass the events to the callbacks, an error of a callback is only
+        printed: it must not stop the reader that registered the values
+        """
+        for e in events:
+            for c in self.callbacks:
+                try:
+                    c(e)
+                except Exception as ex:
+                    print(ex)
+                    print("Could not pass on the alert..")
+
+    def get_alerts(self):
+        """
+        Get the ids of the sensors with a raised alert, by kind
+        """
+        with self.lock:
+            return {
+                "threshold": [self.ids[i] for i in \
+                                            self.np.flatnonzero(self.over)],
+                "rate": [self.ids[i] for i in self.np.flatnonzero(self.fast)]
+            }
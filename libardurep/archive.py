@@ -0,0 +1,320 @@
+"""
+MODULE:       archive
+PURPOSE:      archive the sensor values in a compact binary file that can
+              be read back without parsing.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+
+The archive is an append-only sequence of blocks after a file header.
+Every block starts with a 16 byte header (tag, three unsigned 32 bit
+integers) and is padded to a multiple of 8 bytes. All numbers are little
+endian.
+
+    file header   b"ARDUARC1", version, 0
+    b"DICT"       sensor index, length of the id, 0
+                  followed by the UTF-8 encoded sensor id
+    b"COLS"       sensor index, number of samples n, capacity c (0: n)
+                  followed by c float64 values and c int64 times (epoch
+                  milliseconds), the first n of each are in use
+
+A sensor's block is set up for a number of samples, which are written
+into it as they come, so a reader can map the columns directly. The
+space of the whole block (16 bytes per sample) is taken up in the file
+at once, so the first block of a sensor only holds 'first_block'
+samples, and every further one twice as many as the one before, up to
+'chunk_size': a sensor that is rarely logged does not take up more than
+a few kilobytes.
+
+The samples of a snapshot are written right away (see
+append_snapshot()), so a report is on disk once it returns, but they
+only fill up the free places of the block: a report does not make a
+block of its own. The number of samples in the header is updated after
+the samples, so the samples in use are always complete.
+"""
+
+from array import array
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b"ARDUARC1"
+VERSION = 2
+HEADER = struct.Struct("<4sIII")
+DICT = b"DICT"
+COLS = b"COLS"
+
+def padding(n):
+    return (8 - n % 8) % 8
+
+class ArchiveWriter(object):
+    """
+    Append sensor samples to an archive file
+    """
+
+    def __init__(self, path, chunk_size=4096, first_block=64):
+        """
+        Initialize the writer
+            path          the archive file, continued if it exists
+            chunk_size    number of samples a block holds at most (16
+                          bytes each), append() writes the samples of a
+                          sensor once it collected that many
+            first_block   number of samples the first block of a sensor
+                          holds, the next ones hold twice as many as the
+                          one before
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.first_block = min(first_block, chunk_size)
+        # sensor id -> index
+        self.index = {}
+        # sensor id -> time of the last sample (epoch milliseconds)
+        self.last = {}
+        # sensor index -> (times, values) not yet written
+        self.pending = {}
+        # sensor index -> [offset, samples, capacity] of the block that
+        # is filled
+        self.blocks = {}
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            # sensor index -> offset of its last time
+            last = {}
+            for i, sensor_id, offset, n, c in scan(path):
+                if sensor_id is not None:
+                    self.index[sensor_id] = i
+                    continue
+                if n:
+                    last[i] = offset + 8 * c + 8 * (n - 1)
+                # go on filling the last one
+                self.blocks[i] = [offset, n, c]
+            self.fh = open(path, "r+b")
+            for k in self.index:
+                if self.index[k] in last:
+                    self.fh.seek(last[self.index[k]])
+                    self.last[k] = struct.unpack("<q", self.fh.read(8))[0]
+            # cut off whatever was left of an interrupted write
+            self.end = valid_size(path)
+            self.fh.truncate(self.end)
+        else:
+            self.fh = open(path, "wb")
+            self.fh.write(MAGIC + struct.pack("<II", VERSION, 0))
+            self.end = 16
+
+    def append(self, sensor_id, t, value):
+        """
+        Add a sample, t in epoch seconds
+        """
+        ms = int(round(t * 1000))
+        if self.last.get(sensor_id, -1) >= ms:
+            # already archived
+            return False
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        self.last[sensor_id] = ms
+        if sensor_id not in self.index:
+            self.add_sensor(sensor_id)
+        i = self.index[sensor_id]
+        if i not in self.pending:
+            self.pending[i] = (array("q"), array("d"))
+        times, values = self.pending[i]
+        times.append(ms)
+        values.append(value)
+        if len(times) >= self.chunk_size:
+            self.write_samples(i)
+        return True
+
+    def append_snapshot(self, store, flush=True):
+        """
+        Add the current values of a data store, the samples already
+        archived are skipped, and write them unless 'flush' is False
+        (then they are collected like the samples of append())
+        """
+        n = 0
+        data = store.get_snapshot()[1]
+        for k in data:
+            r = data[k]
+            if r.received is not None and self.append(k, r.received, r.value):
+                n += 1
+        if flush:
+            self.flush()
+        return n
+
+    def add_sensor(self, sensor_id):
+        i = len(self.index)
+        self.index[sensor_id] = i
+        b = sensor_id.encode("UTF-8")
+        self.fh.seek(self.end)
+        self.fh.write(HEADER.pack(DICT, i, len(b), 0) + b + \
+                                                    b"\0" * padding(len(b)))
+        self.end = self.fh.tell()
+
+    def add_block(self, i):
+        """
+        Set up a new block for the samples of a sensor at the end of the
+        file, twice the size of the last one (up to 'chunk_size')
+        """
+        b = self.blocks.get(i)
+        if b is None:
+            c = self.first_block
+        else:
+            c = min(max(2 * b[2], self.first_block), self.chunk_size)
+        self.fh.seek(self.end)
+        self.fh.write(HEADER.pack(COLS, i, 0, c))
+        b = [self.end + HEADER.size, 0, c]
+        self.end = b[0] + 16 * c
+        self.fh.truncate(self.end)
+        self.blocks[i] = b
+        return b
+
+    def write_samples(self, i):
+        """
+        Write the samples collected of a sensor into its block(s)
+        """
+        times, values = self.pending.pop(i)
+        if sys.byteorder != "little":
+            times.byteswap()
+            values.byteswap()
+        done = 0
+        while done < len(times):
+            b = self.blocks.get(i)
+            if b is None or b[1] >= b[2]:
+                b = self.add_block(i)
+            offset, n, c = b
+            k = min(c - n, len(times) - done)
+            self.fh.seek(offset + 8 * n)
+            self.fh.write(values[done:done + k].tobytes())
+            self.fh.seek(offset + 8 * c + 8 * n)
+            self.fh.write(times[done:done + k].tobytes())
+            # the samples are there, now count them in
+            self.fh.seek(offset - HEADER.size + 8)
+            self.fh.write(struct.pack("<I", n + k))
+            b[1] = n + k
+            done += k
+
+    def flush(self):
+        """
+        Write all the samples collected so far
+        """
+        for i in list(self.pending.keys()):
+            self.write_samples(i)
+        self.fh.flush()
+
+    def close(self):
+        if self.fh is not None:
+            self.flush()
+            self.fh.close()
+            self.fh = None
+
+def scan(path):
+    """
+    Generator of the blocks of an archive: (sensor index, sensor id or
+    None, offset of the data, number of samples or 0, capacity or 0)
+    """
+    with open(path, "rb") as fh:
+        head = fh.read(16)
+        if head[0:8] != MAGIC:
+            raise ValueError("Not an archive: " + path)
+        offset = 16
+        size = os.path.getsize(path)
+        while offset + HEADER.size <= size:
+            fh.seek(offset)
+            tag, i, n, x = HEADER.unpack(fh.read(HEADER.size))
+            offset += HEADER.size
+            if tag == DICT:
+                if offset + n > size:
+                    break
+                yield i, fh.read(n).decode("UTF-8"), offset, 0, 0
+                offset += n + padding(n)
+            elif tag == COLS:
+                c = x or n
+                if n > c or offset + 16 * c > size:
+                    break
+                yield i, None, offset, n, c
+                offset += 16 * c
+            else:
+                raise ValueError("Broken archive at " + str(offset))
+
+def valid_size(path):
+    """
+    Get the size of the complete blocks of an archive
+    """
+    end = 16
+    for i, sensor_id, offset, n, c in scan(path):
+        if sensor_id is not None:
+            b = len(sensor_id.encode("UTF-8"))
+            end = offset + b + padding(b)
+        else:
+            end = offset + 16 * c
+    return end
+
+class ArchiveReader(object):
+    """
+    Read an archive through a memory map. The columns of chunks() are
+    NumPy arrays pointing into the map, nothing is copied. get() has to
+    concatenate them if the samples of a sensor are spread over several
+    blocks (see ArchiveWriter), which copies them. The arrays must not
+    be used anymore once the reader is closed.
+    """
+
+    def __init__(self, path):
+        import numpy
+        self.numpy = numpy
+        self.path = path
+        self.ids = {}
+        # sensor index -> [(offset, n, capacity), ..]
+        self.blocks = {}
+        for i, sensor_id, offset, n, c in scan(path):
+            if sensor_id is not None:
+                self.ids[sensor_id] = i
+            elif n:
+                self.blocks.setdefault(i, []).append((offset, n, c))
+        self.fh = open(path, "rb")
+        self.map = mmap.mmap(self.fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def sensors(self):
+        """
+        Get the ids of the archived sensors
+        """
+        return list(self.ids.keys())
+
+    def chunks(self, sensor_id):
+        """
+        Get the (times, values) arrays of every block of a sensor, in
+        the order they were written, without copying them
+        """
+        np = self.numpy
+        c = []
+        for offset, n, cap in self.blocks.get(self.ids[sensor_id], []):
+            values = np.frombuffer(self.map, dtype="<f8", count=n, \
+                                                            offset=offset)
+            times = np.frombuffer(self.map, dtype="<i8", count=n, \
+                                                    offset=offset + 8 * cap)
+            c.append((times, values))
+        return c
+
+    def get(self, sensor_id):
+        """
+        Get the times (epoch milliseconds) and values of a sensor, in
+        one array each: a copy of the blocks, unless there is only one
+        (see chunks() to go through them without copying)
+        """
+        np = self.numpy
+        c = self.chunks(sensor_id)
+        if not c:
+            return np.empty(0, dtype="<i8"), np.empty(0, dtype="<f8")
+        if len(c) == 1:
+            return c[0]
+        return np.concatenate([t for t, v in c]), \
+                                        np.concatenate([v for t, v in c])
+
+    def close(self):
+        try:
+            self.map.close()
+        except BufferError:
+            # there are still arrays using the map, leave it to them
+            pass
+        self.fh.close()
@@ -0,0 +1,272 @@
+"""
+MODULE:       asyncreader
+PURPOSE:      get the data from many serial consoles in one event loop and
+              store it in the data store(s).
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import asyncio
+import io
+import serial
+import threading
+from time import perf_counter
+
+from libardurep.frameparser import FrameParser
+from libardurep.metrics import add_reader_metrics, \
+                                    release_reader_metrics
+
+class AsyncSerialReader(object):
+    """
+    Reader for one end device, driven by the event loop of an
+    AsyncReaderManager instead of a thread of its own
+    """
+
+    def __init__(self, device, baudrate, store, rounds=100, timeout=60, \
+                                        poll_interval=0.1, metrics=None):
+        """
+        Initialize the serial reader
+            device        device name to connect to
+            baudrate      the baud rate for the serial line
+            store         the data store object to send the data to
+            rounds        number of rounds to run / listen for input
+            timeout       seconds without any input that count as a round
+                          (None: never)
+            poll_interval how often to look at a line that can not be
+                          waited on (e.g. 'loop://')
+            metrics       the MetricsRegistry to count the frames and
+                          the waiting time in (None: the shared one,
+                          False: none)
+        """
+        self.baudrate = baudrate
+        self.store = store
+        self.rounds = rounds
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.do_run = True
+        self.device_name = device
+        self.device = None
+        self.parser = FrameParser(codec=getattr(store, "codec", None), \
+                                    timer=getattr(store, "parse_time", None))
+        self.loop = None
+        self.wakeup = None
+        self.metrics = add_reader_metrics(self, metrics, device)
+        try:
+            if device:
+                # never block the event loop on a read
+                self.device = serial.serial_for_url(device, self.baudrate, \
+                                                                    timeout=0)
+        except serial.serialutil.SerialException:
+            print("Could not connect to the serial line at " + self.device_name)
+
+    def age(self):
+        """
+        Get closer to your EOL
+        """
+        # 0 means this composer will never decompose
+        if self.rounds == 1:
+            self.do_run = False
+        elif self.rounds > 1:
+            self.rounds -= 1
+
+    def fileno(self):
+        """
+        Get the file descriptor of the line, None if there is none
+        """
+        try:
+            return self.device.fileno()
+        except (AttributeError, io.UnsupportedOperation, \
+                                        serial.serialutil.SerialException):
+            return None
+
+    def read_available(self):
+        """
+        Read whatever the line has to offer and pass complete frames on
+        to the store, return the number of bytes read
+        """
+        data = self.device.read(max(1, self.device.in_waiting))
+        p = self.parser
+        dropped = p.frames_dropped
+        frames = p.feed(data)
+        if self.metrics is not None and p.frames_dropped != dropped:
+            self.frames_dropped.inc(p.frames_dropped - dropped)
+        for records in frames:
+            if self.metrics is not None:
+                self.frames_read.inc()
+            self.store.register_records(records)
+            self.age()
+        return len(data)
+
+    async def wait(self, timeout):
+        """
+        Wait for the line to become readable (or to be halted)
+        """
+        if self.metrics is not None:
+            start = perf_counter()
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            if self.metrics is not None:
+                self.wait_time.observe(perf_counter() - start)
+        self.wakeup.clear()
+        return True
+
+    async def run(self, loop):
+        """
+        Receive data from the line until halted or out of rounds
+        """
+        if not self.device:
+            return
+        self.loop = loop
+        self.wakeup = asyncio.Event()
+        fd = self.fileno()
+        if fd is not None:
+            loop.add_reader(fd, self.wakeup.set)
+        try:
+            idle = 0
+            while self.do_run:
+                if fd is not None:
+                    if not (await self.wait(self.timeout)):
+                        # nothing arrived in time
+                        self.age()
+                        continue
+                else:
+                    # this line can not be waited on, have a look every
+                    # now and then
+                    await self.wait(self.poll_interval)
+                if not self.do_run:
+                    break
+                if self.read_available():
+                    idle = 0
+                elif fd is None:
+                    idle += self.poll_interval
+                    if self.timeout is not None and idle >= self.timeout:
+                        idle = 0
+                        self.age()
+        except serial.serialutil.SerialException:
+            print("Could not connect to the serial line at " + \
+                                                    str(self.device_name))
+        finally:
+            if fd is not None:
+                loop.remove_reader(fd)
+            release_reader_metrics(self, self.metrics, self.device_name)
+
+    def halt(self):
+        """
+        Tell the this object to stop working after the next round
+        """
+        self.do_run = False
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.wakeup.set)
+            except RuntimeError:
+                # the loop is already gone
+                pass
+
+class AsyncReaderManager(object):
+    """
+    Multiplex many serial lines in one thread. The manager is started,
+    halted and joined like a SerialReader thread.
+    """
+
+    def __init__(self):
+        self.readers = []
+        # reader -> task of the current run
+        self.tasks = {}
+        self.loop = None
+        self.changed = None
+        self.thread = None
+
+    def add_reader(self, device, baudrate, store, rounds=100, timeout=60, \
+                                        poll_interval=0.1, metrics=None):
+        """
+        Connect to another line, see AsyncSerialReader for the parameters
+        """
+        reader = AsyncSerialReader(device, baudrate, store, rounds, timeout, \
+                                                    poll_interval, metrics)
+        return self.register_reader(reader)
+
+    def register_reader(self, reader):
+        """
+        Add an already prepared reader (also while running)
+        """
+        self.readers.append(reader)
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.spawn, reader)
+            except RuntimeError:
+                # not running anymore, it will be spawned on the next run
+                pass
+        return reader
+
+    def spawn(self, reader):
+        """
+        Schedule a reader on the running loop
+        """
+        if reader in self.tasks:
+            return
+        self.tasks[reader] = self.loop.create_task(reader.run(self.loop))
+        if self.changed is not None:
+            self.changed.set()
+
+    async def main(self):
+        """
+        Run all the readers and wait for them to finish
+        """
+        self.changed = asyncio.Event()
+        for reader in self.readers:
+            self.spawn(reader)
+        while True:
+            pending = [t for t in self.tasks.values() if not t.done()]
+            if not pending:
+                break
+            self.changed.clear()
+            waiter = self.loop.create_task(self.changed.wait())
+            await asyncio.wait(pending + [waiter], \
+                                    return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+
+    def run(self):
+        """
+        Run the readers in the current thread until they are all done
+        """
+        self.tasks = {}
+        self.changed = None
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.main())
+        finally:
+            self.loop.close()
+
+    def start(self):
+        """
+        Run the readers in a thread of their own
+        """
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def join(self, timeout=None):
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def halt(self):
+        """
+        Tell all the readers to stop working after the next round
+        """
+        for reader in self.readers:
+            reader.halt()
+
+    def stop(self, timeout=None):
+        """
+        Halt all the readers and wait for them to finish
+        """
+        self.halt()
+        self.join(timeout)
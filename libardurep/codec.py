@@ -0,0 +1,153 @@
+"""
+MODULE:       codec
+PURPOSE:      choose the fastest JSON library available.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+
+The codecs decode with orjson or ujson if one of them is installed, as
+this is where the time goes when reading the serial lines. They keep
+encoding with the standard library by default though, because the
+others produce different bytes (no spaces after the separators, floats
+and non-ASCII characters written differently) and the output is
+expected not to change with the libraries installed. Pass
+compatible=False to encode with the faster library too.
+"""
+
+import json
+import math
+
+class Codec(object):
+    """
+    A set of JSON functions
+        loads         decode a str (or bytes)
+        loads_bytes   decode UTF-8 encoded bytes
+        dumps         encode to a str on a single line
+        dumps_pretty  encode to a str indented by two spaces
+    """
+
+    def __init__(self, name, loads, loads_bytes, dumps, dumps_pretty):
+        self.name = name
+        self.loads = loads
+        self.loads_bytes = loads_bytes
+        self.dumps = dumps
+        self.dumps_pretty = dumps_pretty
+
+    def __repr__(self):
+        return "Codec(" + repr(self.name) + ")"
+
+def stdlib_dumps_pretty(o):
+    return json.dumps(o, indent=2, separators=(',',': '))
+
+# json.loads() looks for the whitespace around the document with two
+# regular expressions, which takes as long as decoding a short line
+decoder = json.JSONDecoder()
+
+def stdlib_loads_bytes(b):
+    s = b.decode("UTF-8")
+    try:
+        o, end = decoder.raw_decode(s)
+        if end == len(s):
+            return o
+    except ValueError:
+        pass
+    # whitespace around it or not a valid document, json.loads() decides
+    return json.loads(s)
+
+def stdlib_codec(compatible=True):
+    return Codec("json", json.loads, stdlib_loads_bytes, json.dumps, \
+                                                        stdlib_dumps_pretty)
+
+def orjson_codec(compatible=True):
+    import orjson
+
+    def loads(s):
+        try:
+            return orjson.loads(s)
+        except ValueError:
+            # e.g. integers beyond 64 bits, the standard library decides
+            return json.loads(s)
+
+    def loads_bytes(b):
+        try:
+            return orjson.loads(b)
+        except ValueError:
+            return stdlib_loads_bytes(b)
+
+    if compatible:
+        return Codec("orjson", loads, loads_bytes, json.dumps, \
+                                                        stdlib_dumps_pretty)
+
+    def dumps(o):
+        return orjson.dumps(o).decode("UTF-8")
+
+    def dumps_pretty(o):
+        return orjson.dumps(o, option=orjson.OPT_INDENT_2).decode("UTF-8")
+
+    return Codec("orjson", loads, loads_bytes, dumps, dumps_pretty)
+
+def ujson_codec(compatible=True):
+    import ujson
+
+    def loads(s):
+        try:
+            return ujson.loads(s)
+        except ValueError:
+            return json.loads(s)
+
+    def loads_bytes(b):
+        try:
+            return ujson.loads(b)
+        except ValueError:
+            return stdlib_loads_bytes(b)
+
+    if compatible:
+        return Codec("ujson", loads, loads_bytes, json.dumps, \
+                                                        stdlib_dumps_pretty)
+
+    def dumps(o):
+        return ujson.dumps(o, escape_forward_slashes=False)
+
+    def dumps_pretty(o):
+        return ujson.dumps(o, indent=2, escape_forward_slashes=False)
+
+    return Codec("ujson", loads, loads_bytes, dumps, dumps_pretty)
+
+# name -> factory, the first ones are preferred
+CODECS = (
+    ("orjson", orjson_codec),
+    ("ujson", ujson_codec),
+    ("json", stdlib_codec)
+)
+
+# compatible -> the codec chosen for "auto"
+auto_codecs = {}
+
+def get_codec(name=None, compatible=True):
+    """
+    Get the codec of a library ("orjson", "ujson" or "json"), the
+    fastest one installed for None or "auto"
+    """
+    if name is None or name == "auto":
+        if compatible not in auto_codecs:
+            for n, factory in CODECS:
+                try:
+                    auto_codecs[compatible] = factory(compatible)
+                    break
+                except ImportError:
+                    pass
+        return auto_codecs[compatible]
+    for n, factory in CODECS:
+        if n == name:
+            return factory(compatible)
+    raise ValueError("Unknown JSON codec: " + str(name))
+
+def finite(x):
+    """
+    JSON has no NaN or infinity, report them as null
+    """
+    if isinstance(x, float) and not math.isfinite(x):
+        return None
+    return x
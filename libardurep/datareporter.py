@@ -9,10 +9,18 @@ COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
 """
 
 from base64 import b64encode
-import httplib2
 import re
-import requests
-import urllib3
+from time import perf_counter
+
+from libardurep.archive import ArchiveWriter
+from libardurep.delta import DeltaReport
+from libardurep.filesink import FileSink
+from libardurep.metrics import get_registry
+from libardurep.spool import Spool
+
+# requests (and urllib3) and sqlite3 take long to import, they are only
+# imported when a report is first sent over HTTP respectively written to
+# a database
 
 class DataReporter(object):
     """
@@ -20,16 +28,50 @@ class DataReporter(object):
     to a given URL on request.
     """
 
-    def __init__(self, store, url="", credentials={}, do_verify_certificate=True):
+    def __init__(self, store, url="", credentials={}, \
+                        do_verify_certificate=True, pool_size=1, retries=0, \
+                        batch_size=1, metrics=None):
         """
         Initialize the reporter.
             store store         the data store
+            pool_size           number of HTTP connections kept open
+            retries             number of retries of a failed HTTP POST
+            batch_size          number of store snapshots to send per
+                                HTTP POST
+            metrics             the MetricsRegistry to time the reports
+                                in (None: the shared one, False: none)
         """
         self.store = store
         # for commodity, either register url etc. or choose every time
         self.url = url
         self.credentials = credentials
         self.do_verify_certificate = do_verify_certificate
+        # the HTTP session is only set up when needed
+        self.pool_size = pool_size
+        self.retries = retries
+        self.session = None
+        # url -> [credentials, do_verify_certificate, snapshots] waiting
+        # to be sent there
+        self.batch_size = batch_size
+        self.batches = {}
+        # path -> long-lived file sink
+        self.file_sinks = {}
+        # path -> binary archive writer
+        self.archives = {}
+        # path -> SQLite database
+        self.databases = {}
+        # keeps the snapshots that could not be sent, see open_spool()
+        self.spool = None
+        # tracks what was reported, see enable_delta()
+        self.delta = None
+        self.metrics = get_registry(metrics)
+        if self.metrics is not None:
+            m = self.metrics
+            self.post_time = m.histogram("ardu_reporter_post_seconds", \
+                        "Time of the HTTP POST requests")
+            self.post_failures = m.counter( \
+                        "ardu_reporter_post_failures_total", \
+                        "HTTP POST requests that failed")
 
     def log(self, url=None, credentials=None, do_verify_certificate=True):
         """
@@ -38,12 +80,27 @@ class DataReporter(object):
         """
         if url is None:
             url = self.url
+        if self.metrics is not None:
+            start = perf_counter()
         if re.match("file://", url):
+            sink = "file"
             self.log_file(url)
+        elif re.match("archive://", url):
+            sink = "archive"
+            self.log_archive(url)
+        elif re.match("sqlite://", url):
+            sink = "sqlite"
+            self.log_sqlite(url)
         elif re.match("https://", url) or re.match("http://", url):
+            sink = "post"
             self.log_post(url, credentials, do_verify_certificate)
         else:
+            sink = "stdout"
             self.log_stdout()
+        if self.metrics is not None:
+            self.metrics.histogram("ardu_reporter_report_seconds", \
+                        "Time to report the data, by sink", sink=sink \
+                        ).observe(perf_counter() - start)
 
     def log_stdout(self):
         """
@@ -58,33 +115,319 @@ class DataReporter(object):
         if url is None:
             url = self.url
         f = re.sub("file://", "", url)
+        data = None
+        if self.delta is not None:
+            # only taken as reported once it is written
+            data, state = self.delta.prepare()
+            if not data:
+                # nothing changed
+                self.delta.advance(state)
+                return
         try:
-            with open(f, "a") as of:
-                of.write(str(self.store.get_json_tuples(True)))
+            if f in self.file_sinks:
+                self.file_sinks[f].write(self.store.get_json_lines(data=data))
+            else:
+                with open(f, "a") as of:
+                    of.write(str(self.store.get_json_tuples(True, \
+                                                                data=data)))
         except IOError as e:
             print(e)
             print("Could not write the content to the file..")
+            return
+        if data is not None:
+            self.delta.advance(state)
+
+    def log_archive(self, url=None):
+        """
+        Append the new values to a binary archive file
+        """
+        if url is None:
+            url = self.url
+        f = re.sub("archive://", "", url)
+        try:
+            if f not in self.archives:
+                self.archives[f] = ArchiveWriter(f)
+            self.archives[f].append_snapshot(self.store)
+        except (IOError, ValueError) as e:
+            print(e)
+            print("Could not write the content to the archive..")
+
+    def log_sqlite(self, url=None):
+        """
+        Insert the new values into a local SQLite database
+        """
+        if url is None:
+            url = self.url
+        f = re.sub("sqlite://", "", url)
+        from libardurep.sqlitesink import Error, SQLiteSink
+        try:
+            if f not in self.databases:
+                self.databases[f] = SQLiteSink(f)
+            self.databases[f].append_snapshot(self.store)
+        except Error as e:
+            print(e)
+            print("Could not write the content to the database..")
+
+    def open_sqlite_sink(self, url=None, **options):
+        """
+        Open the SQLite database with other options than the defaults,
+        see SQLiteSink (batch size, synchronous)
+        """
+        if url is None:
+            url = self.url
+        f = re.sub("sqlite://", "", url)
+        from libardurep.sqlitesink import SQLiteSink
+        if f in self.databases:
+            self.databases[f].close()
+        self.databases[f] = SQLiteSink(f, **options)
+        return self.databases[f]
+
+    def open_file_sink(self, url=None, **options):
+        """
+        Keep the file open and write newline delimited JSON to it from
+        now on, see FileSink for the options (buffering, syncing,
+        rotation, compression)
+        """
+        if url is None:
+            url = self.url
+        f = re.sub("file://", "", url)
+        if f in self.file_sinks:
+            self.file_sinks[f].close()
+        self.file_sinks[f] = FileSink(f, **options)
+        return self.file_sinks[f]
 
     def log_post(self, url=None, credentials=None, do_verify_certificate=True):
         """
         Write to a remote host via HTTP POST
         """
+        data = self.get_report_json()
+        if data is None:
+            return
+        if self.batch_size > 1:
+            if url is None:
+                url = self.url
+            b = self.batches.get(url)
+            if b is None:
+                b = self.batches[url] = [None, None, []]
+            # the latest credentials for the URL count
+            b[0] = credentials
+            b[1] = do_verify_certificate
+            b[2].append(data)
+            if len(b[2]) >= self.batch_size:
+                self.flush(url)
+        else:
+            self.deliver(data, url, credentials, do_verify_certificate)
+
+    def enable_delta(self, **options):
+        """
+        Report only the sensors that changed since the last report from
+        now on, see DeltaReport for the options (deadband, keyframes)
+        """
+        self.delta = DeltaReport(self.store, **options)
+        return self.delta
+
+    def get_report_data(self):
+        """
+        Get the data to report next, None stands for the whole store
+        """
+        if self.delta is None:
+            return None
+        return self.delta.get_data()
+
+    def get_report_json(self, prettyprint=False):
+        """
+        Get the data to report next in JSON form, or None if nothing
+        changed
+        """
+        data = self.get_report_data()
+        if data is not None and not data:
+            return None
+        return self.store.get_json(prettyprint, data=data)
+
+    def flush(self, url=None):
+        """
+        Send the snapshots collected so far in one HTTP POST per URL they
+        were collected for (only those for 'url' if given)
+        """
+        if url is None:
+            urls = list(self.batches)
+        else:
+            urls = [url]
+        for u in urls:
+            b = self.batches.pop(u, None)
+            if b is None or not b[2]:
+                continue
+            credentials, do_verify_certificate, batch = b
+            self.deliver(self.join_json(batch), u, credentials, \
+                                                    do_verify_certificate)
+
+    def open_spool(self, directory, **options):
+        """
+        Keep the JSON data that could not be sent in a spool directory
+        and send it later on, see Spool for the options (size limits,
+        replay rate)
+        """
+        if self.spool is not None:
+            self.spool.close()
+        self.spool = Spool(directory, **options)
+        return self.spool
+
+    def deliver(self, data, url=None, credentials=None, \
+                                    do_verify_certificate=True, session=None):
+        """
+        Send JSON data after what was spooled before, spool it if that
+        fails or if the spool can not be replayed completely yet, so the
+        snapshots arrive in order
+        """
+        if not self.catch_up(url, credentials, do_verify_certificate, \
+                                                                    session):
+            self.keep(data)
+            return False
+        if self.send(data, url, credentials, do_verify_certificate, session):
+            return True
+        self.keep(data)
+        return False
+
+    def catch_up(self, url=None, credentials=None, \
+                                    do_verify_certificate=True, session=None):
+        """
+        Replay the spool, return whether it is empty now, i.e. whether
+        new data may be sent (otherwise it has to be spooled behind)
+        """
+        if self.spool is None or not len(self.spool):
+            return True
+        self.replay(url, credentials, do_verify_certificate, session)
+        return not len(self.spool)
+
+    def keep(self, data):
+        """
+        Spool JSON data that could not be sent, without a spool make
+        sure at least that the next delta report is a complete one
+        """
+        if self.spool is not None:
+            self.spool.append(data)
+        elif self.delta is not None:
+            self.delta.reset()
+
+    def replay(self, url=None, credentials=None, \
+                                    do_verify_certificate=True, session=None):
+        """
+        Send (part of) the spooled data, return the number of snapshots
+        sent
+        """
+        if self.spool is None or not len(self.spool):
+            return 0
+        return self.spool.replay(lambda d: self.send(d, url, credentials, \
+                            do_verify_certificate, session), self.join_json)
+
+    def join_json(self, snapshots):
+        """
+        Merge JSON arrays into one
+        """
+        return "[" + ", ".join([j[1:-1] for j in snapshots if len(j) > 2]) + "]"
+
+    def send(self, data, url=None, credentials=None, \
+                                    do_verify_certificate=True, session=None):
+        """
+        Send JSON data to a remote host, return whether it was accepted
+        """
+        import requests
+        if self.metrics is not None:
+            start = perf_counter()
+        try:
+            request = self.post(data, url, credentials, \
+                                            do_verify_certificate, session)
+            request.raise_for_status()
+            return True
+        except requests.exceptions.RequestException as e:
+            if self.metrics is not None:
+                self.post_failures.inc()
+            print(e)
+            print("Could not send the content to the remote host..")
+            return False
+        finally:
+            if self.metrics is not None:
+                self.post_time.observe(perf_counter() - start)
+
+    def post(self, data, url=None, credentials=None, \
+                                    do_verify_certificate=True, session=None):
+        """
+        Send JSON data via HTTP POST over the pooled session (or the one
+        given, see new_session())
+        """
         if url is None:
             url = self.url
         if credentials is None:
             credentials = self.credentials
+        headers = self.get_headers(credentials)
         if do_verify_certificate is None:
             do_verify_certificate = self.do_verify_certificate
+        if session is None:
+            session = self.get_session()
+        return session.post(url, headers=headers, data=data, \
+                                                verify=do_verify_certificate)
+
+    def get_session(self):
+        """
+        Get the HTTP session keeping the connections alive
+        """
+        if self.session is None:
+            self.session = self.new_session()
+        return self.session
+
+    def new_session(self):
+        """
+        Set up an HTTP session with the pool size and retries of this
+        reporter, e.g. for a thread of its own (a session is not to be
+        shared between threads), the caller has to close it
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        session = requests.Session()
+        try:
+            retry = Retry(total=self.retries, backoff_factor=0.5, \
+                            status_forcelist=(500, 502, 503, 504), \
+                            allowed_methods=None)
+        except TypeError:
+            # urllib3 < 1.26
+            retry = Retry(total=self.retries, backoff_factor=0.5, \
+                            status_forcelist=(500, 502, 503, 504), \
+                            method_whitelist=False)
+        adapter = HTTPAdapter(pool_connections=self.pool_size, \
+                        pool_maxsize=self.pool_size, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self):
+        """
+        Send what is left and close the HTTP connections and files
+        """
+        self.flush()
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+        for f in self.file_sinks:
+            self.file_sinks[f].close()
+        self.file_sinks = {}
+        for f in self.archives:
+            self.archives[f].close()
+        self.archives = {}
+        for f in self.databases:
+            self.databases[f].close()
+        self.databases = {}
+        if self.spool is not None:
+            self.spool.close()
+
+    def get_headers(self, credentials):
+        """
+        Prepare the HTTP headers
+        """
         if credentials and "base64" in credentials:
-            headers = {"Content-Type": "application/json", \
+            return {"Content-Type": "application/json", \
                         'Authorization': 'Basic %s' % credentials["base64"]}
-        else:
-            headers = {"Content-Type": "application/json"}
-        try:
-            request = requests.post(url, headers=headers, \
-                    data=self.store.get_json(), verify=do_verify_certificate)
-        except httplib.IncompleteRead as e:
-            request = e.partial
+        return {"Content-Type": "application/json"}
 
     def log_ssh(self):
         """
@@ -9,23 +9,137 @@ COPYRIGHT:    (C) 2017 by Michael Lustenberger and the INOFIX GmbH
 """
 
 import datetime
-import json
-from jsonschema import Draft4Validator as Validator
+import itertools
+import threading
+import time
+from time import perf_counter
+
+from libardurep.codec import Codec, get_codec
+from libardurep.history import SensorHistory
+from libardurep.ingest import IngestFilter
+from libardurep.metrics import TIMING_SAMPLE, get_registry
+from libardurep.record import MISSING
+from libardurep.schemaregistry import registry as default_registry
+from libardurep.validation import Quarantine, get_checks
+
+# numbers the stores without a name, see DataStore
+store_numbers = itertools.count()
+
+class NoLock(object):
+    """
+    Stand-in for a lock where no locking is needed
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
 
 class DataStore(object):
     """
     This store is used to collect sensor data as separate tuples
     per sensor. Newer data overwrites older data and incomplete
     runs will eventually accumulate to full sets over time.
+
+    If the store is shared between threads, create it with 'concurrent'
+    set: the records of a frame are then published all at once and the
+    get_*() methods work on a consistent snapshot of the data.
+
+    With 'history_size' set, the store additionally keeps that many of
+    the latest numeric values per sensor (and none older than
+    'history_age' seconds if set).
+
+    Every registration counts up the store's version and marks the
+    records it registers with it, see get_changes(). Listeners added with
+    add_listener() are called with the new records right after every
+    registration.
+
+    The JSON is decoded and encoded by 'codec', the name of a JSON
+    library or a Codec, by default the fastest library installed (see
+    the codec module).
+
+    The schemas and the key mappings come from a SchemaRegistry, which
+    shares them between the stores (by default with all the others).
+
+    With 'validation' set, every entry is checked against the types and
+    the required properties of the input schema before it is registered.
+    Bad entries are dropped one by one, the rest of the frame is still
+    registered, and counted per sensor ("reject"), or additionally kept
+    for inspection ("quarantine", the latest 'quarantine_size' entries
+    per sensor, see get_quarantine()).
+
+    The time to decode and register the JSON frames and to encode the
+    data in JSON as well as the records registered go to the 'metrics'
+    registry (by default the shared one, False for none).
+
+    Sensors sending more often than needed are thinned out by their
+    IngestPolicy ('ingest_policies', sensor id -> policy, the others get
+    'default_ingest_policy', see the ingest module) before any record is
+    made, see set_ingest_policy(). The samples they throw away are
+    counted per store, by its 'name' (by default a number counting the
+    stores of the process).
     """
 
     def __init__(self, in_schema=None, in_meta_schema=None, \
-                        out_schema=None, out_meta_schema=None):
+                        out_schema=None, out_meta_schema=None, \
+                        concurrent=False, history_size=0, history_age=None, \
+                        codec=None, registry=None, validation=None, \
+                        quarantine_size=100, metrics=None, \
+                        ingest_policies=None, default_ingest_policy=None, \
+                        name=None):
+        if not isinstance(codec, Codec):
+            codec = get_codec(codec)
+        self.codec = codec
+        if name is None:
+            name = str(next(store_numbers))
+        self.name = name
+        if registry is None:
+            registry = default_registry
+        self.registry = registry
         # prepare a timestamp to remember the last data update
         self.last_data_timestamp = None
         # prepare a dict to store the data
         # this way we can wait for a stable set of values
         self.data = {}
+        # counted up by every registration, the records keep the version
+        # they were registered at
+        self.version = 0
+        # called with the sensor id -> record dict of every registration
+        self.listeners = []
+        # the records are never changed once they are in self.data, they
+        # are only replaced, so a shallow copy is a consistent snapshot
+        self.concurrent = concurrent
+        if concurrent:
+            self.lock = threading.Lock()
+        else:
+            self.lock = NoLock()
+        # what happens here is counted and timed
+        self.metrics = get_registry(metrics)
+        if self.metrics is not None:
+            m = self.metrics
+            self.parse_time = m.histogram("ardu_store_parse_seconds", \
+                        "Time to decode a JSON frame")
+            self.frames_invalid = m.counter( \
+                        "ardu_store_frames_invalid_total", \
+                        "JSON frames that could not be decoded")
+            self.records_registered = m.counter("ardu_store_records_total", \
+                        "Sensor records registered")
+            self.serialize_time = m.histogram( \
+                        "ardu_store_serialize_seconds", \
+                        "Time to encode the data in JSON")
+            self.serialized_bytes = m.counter( \
+                        "ardu_store_serialized_bytes_total", \
+                        "Characters of JSON encoded (bytes, as it is ASCII)")
+            # the frames left until the next one decoded respectively
+            # encoded is timed
+            self.parse_countdown = 1
+            self.serialize_countdown = 1
+        # the recent values per sensor
+        if history_size:
+            self.history = SensorHistory(history_size, history_age)
+        else:
+            self.history = None
 
         # the konstant meta keys used here and in the meta schema
         self.key = "key"
@@ -62,18 +176,47 @@ class DataStore(object):
             self.time_key: self.time_key
         }
 
+        # optionally check the entries before registering them
+        if validation not in (None, "reject", "quarantine"):
+            raise ValueError("Unknown validation mode: " + str(validation))
+        self.validation = validation
+        # sensor id (None if unknown) -> number of entries rejected
+        self.rejected = {}
+        self.quarantine = None
+        if validation == "quarantine":
+            self.quarantine = Quarantine(quarantine_size)
+        self.in_schema = None
+
         # see whether to override the keywords on in- or output
         self.parse_schemas(in_schema, in_meta_schema, \
                                     out_schema, out_meta_schema)
 
+        # thins out the samples before they are registered
+        self.ingest = None
+        if ingest_policies or default_ingest_policy is not None:
+            self.add_ingest_filter(ingest_policies, default_ingest_policy)
+
+    def add_ingest_filter(self, policies=None, default=None):
+        """
+        Set up the IngestFilter and count the samples it throws away
+        """
+        self.ingest = IngestFilter(policies, default, self.id_key, \
+                                                            self.value_key)
+        if self.metrics is not None:
+            for reason in ("dropped", "coalesced"):
+                self.metrics.counter_attribute( \
+                        "ardu_store_samples_dropped_total", self.ingest, \
+                        reason, \
+                        "Samples dropped or replaced by the ingest policies", \
+                        store=self.name, reason=reason)
+
     def parse_schemas(self, in_schema, in_meta_schema, \
                                     out_schema, out_meta_schema):
         # load the two JSON schema objects
         if in_schema and in_meta_schema:
-            m = json.loads(in_meta_schema)
-            s = json.loads(in_schema)
             # add some sanity argument before changing the config
-            Validator(m).validate(s)
+            s = self.registry.validate(in_schema, in_meta_schema)
+            self.in_schema = in_schema
             # search for the keys and change them if the schema requests
             for k in s[self.items][self.properties]:
                 v = s[self.items][self.properties][k]
@@ -96,10 +239,8 @@ class DataStore(object):
         elif in_schema:
             raise TypeError('Received input schema but no meta schema..')
         if out_schema and out_meta_schema:
-            m = json.loads(out_meta_schema)
-            s = json.loads(out_schema)
             # add some sanity argument before changing the config
-            Validator(m).validate(s)
+            s = self.registry.validate(out_schema, out_meta_schema)
             # search for the keys and change them if the schema requests
             for k in s[self.items][self.properties]:
                 v = s[self.items][self.properties][k]
@@ -108,113 +249,410 @@ class DataStore(object):
                     self.translation_keys[t] = k
         elif out_schema:
             raise TypeError('Received input schema but no meta schema..')
+        self.compile_mapping()
+
+    def compile_mapping(self):
+        """
+        Prepare the record type and the two functions used to map the
+        input entries to records and the records to the output entries
+        for the current keys. They are compiled once per set of keys and
+        shared by the stores using the same registry.
+        """
+        # the well known entries are translated by their meaning, the
+        # rest by their name, anything unknown is passed on as it is
+        t = self.translation_keys
+        other_keys = tuple(self.other_keys)
+        keys = (self.id_key, self.value_key, self.unit_key, \
+                    self.threshold_key, other_keys, self.sensor_time_key, \
+                    self.time_key, t.get(self.id, self.id_key), \
+                    t.get(self.value, self.value_key), \
+                    t.get(self.unit, self.unit_key), \
+                    t.get(self.threshold, self.threshold_key), \
+                    tuple([t.get(k, k) for k in other_keys]), \
+                    t.get(self.sensor_time_key, self.sensor_time_key), \
+                    t.get(self.time_key, self.time_key))
+        # the extract function checks the entries on the way if needed,
+        # 'check' only tells the reason why one was rejected
+        checks = None
+        self.check = None
+        if self.validation:
+            items = self.registry.get_items(self.in_schema)
+            checks = get_checks(items, self.id_key, self.value_key, \
+                        self.unit_key, self.threshold_key, other_keys, \
+                        self.sensor_time_key)
+            kept = (self.id_key, self.value_key, self.unit_key, \
+                        self.threshold_key, self.sensor_time_key) + other_keys
+            self.check = self.registry.get_validator(self.in_schema, \
+                                        (self.id_key, self.value_key), kept)
+        self.record_type, self.extract, self.translate = \
+                                    self.registry.get_mapping(keys, checks)
+        # (prettyprint, translate) -> sensor id -> (record, JSON string)
+        self.fragments = {
+            (False, False): {},
+            (False, True): {},
+            (True, False): {},
+            (True, True): {}
+        }
 
     def register_json(self, data):
         """
         Register the contents as JSON
         """
-        j = json.loads(data)
-        self.last_data_timestamp = \
-                datetime.datetime.utcnow().replace(microsecond=0).isoformat()
+        start = None
+        if self.metrics is not None:
+            self.parse_countdown -= 1
+            if not self.parse_countdown:
+                self.parse_countdown = TIMING_SAMPLE
+                start = perf_counter()
         try:
-            for v in j:
-                # prepare the sensor entry container
-                self.data[v[self.id_key]] = {}
-                # add the mandatory entries
-                self.data[v[self.id_key]][self.id_key] = \
-                                            v[self.id_key]
-                self.data[v[self.id_key]][self.value_key] = \
-                                            v[self.value_key]
-                # add the optional well known entries if provided
-                if self.unit_key in v:
-                    self.data[v[self.id_key]][self.unit_key] = \
-                                            v[self.unit_key]
-                if self.threshold_key in v:
-                    self.data[v[self.id_key]][self.threshold_key] = \
-                                            v[self.threshold_key]
-                # add any further entries found
-                for k in self.other_keys:
-                    if k in v:
-                        self.data[v[self.id_key]][k] = v[k]
-                # add the custom sensor time
-                if self.sensor_time_key in v:
-                    self.data[v[self.sensor_time_key]][self.sensor_time_key] = \
-                                            v[self.sensor_time_key]
-                # last: add the time the data was received (overwriting any
-                # not properly defined timestamp that was already there)
-                self.data[v[self.id_key]][self.time_key] = \
-                                            self.last_data_timestamp
-        except KeyError as e:
-            print("The main key was not found on the serial input line: " + \
-                    str(e))
+            j = self.codec.loads(data)
         except ValueError as e:
+            if self.metrics is not None:
+                self.frames_invalid.inc()
             print("No valid JSON string received. Waiting for the next turn.")
             print("The error was: " + str(e))
+            return
+        if start is not None:
+            self.parse_time.observe(perf_counter() - start)
+        self.register_records(j, time.time())
+
+    def register_records(self, j, now=None):
+        """
+        Register a list of already decoded sensor records, 'now' is the
+        time of their arrival (epoch seconds, default: now)
+        """
+        if now is None:
+            now = time.time()
+        if self.ingest is not None:
+            with self.lock:
+                j = self.ingest.filter(j, now)
+            if not j:
+                return
+        self.add_records(j, now)
+
+    def add_records(self, j, now):
+        """
+        Make records of the entries let through and publish them
+        """
+        timestamp = datetime.datetime.utcfromtimestamp(now).replace( \
+                                                    microsecond=0).isoformat()
+        records = {}
+        extract = self.extract
+        check = self.check
+        try:
+            if check is None:
+                for v in j:
+                    r = extract(v, timestamp, now)
+                    records[r.id] = r
+            else:
+                for v in j:
+                    try:
+                        r = extract(v, timestamp, now)
+                    except (KeyError, TypeError):
+                        # e.g. a missing id or not an object at all
+                        r = None
+                    if r is None:
+                        self.reject(v, check(v) or "invalid", now)
+                    else:
+                        records[r.id] = r
+        except KeyError as e:
+            print("The main key was not found on the serial input line: " + \
+                    str(e))
+        # publish the complete entries found so far all at once
+        with self.lock:
+            if records:
+                self.version += 1
+                v = self.version
+                for r in records.values():
+                    r.version = v
+            self.data.update(records)
+            self.last_data_timestamp = timestamp
+            if self.history is not None:
+                for k in records:
+                    self.history.add(k, now, records[k].value)
+        if records:
+            if self.metrics is not None:
+                # Counter.inc() without the call, once per frame
+                self.records_registered.value += len(records)
+            for l in self.listeners:
+                l(records)
+
+    def reject(self, entry, reason, now):
+        """
+        Count (and quarantine) an entry that did not pass the validation
+        """
+        k = None
+        if type(entry) is dict:
+            k = entry.get(self.id_key)
+            try:
+                hash(k)
+            except TypeError:
+                k = None
+        with self.lock:
+            self.rejected[k] = self.rejected.get(k, 0) + 1
+        if self.quarantine is not None:
+            self.quarantine.add(k, entry, reason, now)
+
+    def get_rejected(self):
+        """
+        Get the number of entries rejected per sensor id (None for the
+        entries without a usable id)
+        """
+        with self.lock:
+            return dict(self.rejected)
+
+    def get_quarantine(self, sensor_id):
+        """
+        Get the latest (time, reason, entry) rejected of a sensor
+        """
+        if self.quarantine is None:
+            return []
+        return self.quarantine.get(sensor_id)
+
+    def set_ingest_policy(self, sensor_id, policy):
+        """
+        Set the IngestPolicy of a sensor (None: let all its samples
+        through), respectively the default policy for 'sensor_id' None
+        """
+        with self.lock:
+            if self.ingest is None:
+                self.add_ingest_filter()
+            if sensor_id is None:
+                self.ingest.set_default(policy)
+            else:
+                self.ingest.set_policy(sensor_id, policy)
+
+    def flush_ingest(self, now=None):
+        """
+        Register the samples held back by coalescing whose interval is
+        over (they are otherwise registered with the next frame)
+        """
+        if self.ingest is None:
+            return
+        if now is None:
+            now = time.time()
+        with self.lock:
+            j = self.ingest.flush(now)
+        if j:
+            self.add_records(j, now)
+
+    def add_listener(self, callback):
+        """
+        Call back with the new records (sensor id -> record) after every
+        registration
+        """
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def get_snapshot(self):
+        """
+        Get the time of the last update and the data at that time, the
+        data must not be changed
+        """
+        with self.lock:
+            if self.concurrent:
+                return self.last_data_timestamp, dict(self.data)
+            return self.last_data_timestamp, self.data
+
+    def get_changes(self, since=0):
+        """
+        Get the current version of the store and the data of the sensors
+        updated after version 'since', the data must not be changed
+        """
+        with self.lock:
+            if since == 0:
+                return self.version, dict(self.data)
+            if since == self.version:
+                return self.version, {}
+            return self.version, dict([(k, r) for k, r in self.data.items() \
+                                                    if r.version > since])
 
     def get_text(self):
         """
         Get the data in text form (i.e. human readable)
         """
-        t = "==== " + str(self.last_data_timestamp) + " ====\n"
-        for k in self.data:
-            t += k + " " + str(self.data[k][self.value_key])
+        timestamp, data = self.get_snapshot()
+        t = "==== " + str(timestamp) + " ====\n"
+        for k in data:
+            r = data[k]
+            t += k + " " + str(r.value)
             u = ""
-            if self.unit_key in self.data[k]:
-                u = self.data[k][self.unit_key]
+            if r.unit is not MISSING:
+                u = r.unit
                 t += u
-            if self.threshold_key in self.data[k]:
-                if (self.data[k][self.threshold_key] < \
-                                    self.data[k][self.value_key]):
+            if r.threshold is not MISSING:
+                if (r.threshold < r.value):
                     t += " !Warning: Value is over threshold: " + \
-                                str(self.data[k][self.threshold_key]) + "!"
+                                str(r.threshold) + "!"
                 else:
-                    t += " (" + str(self.data[k][self.threshold_key]) + u + ")"
-            for l in self.other_keys:
-                if l in self.data[k]:
-                    t += " " + self.data[k][l]
+                    t += " (" + str(r.threshold) + u + ")"
+            if r.other is not None:
+                for o in r.other:
+                    if o is not MISSING:
+                        t += " " + o
             t += "\n"
         return t
 
-    def get_translated_data(self):
+    def get_history(self, sensor_id, start=None, end=None):
         """
-        Translate the data with the translation table
+        Get the recent (time, value) samples of a sensor, optionally
+        limited to the time range from start to end (epoch seconds)
         """
+        if self.history is None:
+            return []
+        with self.lock:
+            return self.history.get(sensor_id, start, end, time.time())
+
+    def get_history_data(self, sensor_ids=None, start=None, end=None):
+        """
+        Get the recent samples as a list of records like the ones in
+        the store
+        """
+        if self.history is None:
+            return []
+        if sensor_ids is None:
+            with self.lock:
+                sensor_ids = self.history.sensors()
+        R = self.record_type
+        j = []
+        for k in sensor_ids:
+            for t, v in self.get_history(k, start, end):
+                j.append(R(k, v, time=datetime.datetime.utcfromtimestamp(t \
+                            ).replace(microsecond=0).isoformat(), received=t))
+        return j
+
+    def get_translated_data(self, data=None):
+        """
+        Translate the data (default: a snapshot of the store) with the
+        translation table
+        """
+        if data is None:
+            data = self.get_snapshot()[1]
         j = {}
-        for k in self.data:
-            d = {}
-            for l in self.data[k]:
-                d[self.translation_keys[l]] = self.data[k][l]
-            j[k] = d
+        for k in data:
+            j[k] = self.translate(data[k])
         return j
 
-    def get_json(self, prettyprint=False, translate=True):
+    def get_json_fragments(self, prettyprint=False, translate=True, \
+                                                                data=None):
+        """
+        Get the JSON encoded sensor entries (default: of a snapshot of
+        the store), one string per sensor. The strings are cached per
+        sensor and only encoded again after the sensor's record was
+        replaced, which takes about 215-245 bytes per sensor for every
+        combination of 'prettyprint' and 'translate' used.
+        """
+        cache = self.fragments[(prettyprint, translate)]
+        dumps = self.codec.dumps
+        dumps_pretty = self.codec.dumps_pretty
+        fragments = []
+        if data is None:
+            data = self.get_snapshot()[1]
+        for k in data:
+            r = data[k]
+            c = cache.get(k)
+            if c is None or c[0] is not r:
+                if translate:
+                    d = self.translate(r)
+                else:
+                    d = r.to_dict()
+                if prettyprint:
+                    # indented as an element of the array
+                    f = "  " + dumps_pretty(d).replace("\n", "\n  ")
+                else:
+                    f = dumps(d)
+                c = (r, f)
+                cache[k] = c
+            fragments.append(c[1])
+        return fragments
+
+    def get_json(self, prettyprint=False, translate=True, data=None):
         """
         Get the data in JSON form
         """
-        j = []
-        if translate:
-            d = self.get_translated_data()
+        if self.metrics is not None:
+            start = self.start_serialize()
+        j = self.get_json_fragments(prettyprint, translate, data)
+        if not j:
+            j = "[]"
+        elif prettyprint:
+            j = "[\n" + ",\n".join(j) + "\n]"
         else:
-            d = self.data
-        for k in d:
-            j.append(d[k])
-        if prettyprint:
-            j = json.dumps(j, indent=2, separators=(',',': '))
+            j = "[" + ", ".join(j) + "]"
+        if self.metrics is not None:
+            self.count_serialized(j, start)
+        return j
+
+    def get_json_lines(self, translate=True, data=None):
+        """
+        Get the data as newline delimited JSON, one sensor per line
+        """
+        if self.metrics is not None:
+            start = self.start_serialize()
+        j = self.get_json_fragments(False, translate, data)
+        if j:
+            j = "\n".join(j) + "\n"
         else:
-            j = json.dumps(j)
+            j = ""
+        if self.metrics is not None:
+            self.count_serialized(j, start)
         return j
 
-    def get_json_tuples(self, prettyprint=False, translate=True):
+    def start_serialize(self):
         """
-        Get the data as JSON tuples
+        Get the perf_counter() to time the encoding from, None if this
+        one is not timed
         """
-        j = self.get_json(prettyprint, translate)
-        if len(j) > 2:
-            if prettyprint:
-                j = j[1:-2] + ",\n"
-            else:
-                j = j[1:-1] + ","
+        self.serialize_countdown -= 1
+        if self.serialize_countdown:
+            return None
+        self.serialize_countdown = TIMING_SAMPLE
+        return perf_counter()
+
+    def count_serialized(self, j, start):
+        """
+        Count the JSON encoded since 'start' (see start_serialize())
+        """
+        if start is not None:
+            self.serialize_time.observe(perf_counter() - start)
+        self.serialized_bytes.inc(len(j))
+
+    def get_history_json(self, sensor_ids=None, start=None, end=None, \
+                                            prettyprint=False, translate=True):
+        """
+        Get the recent samples in JSON form
+        """
+        j = self.get_history_data(sensor_ids, start, end)
+        if translate:
+            j = [self.translate(r) for r in j]
         else:
+            j = [r.to_dict() for r in j]
+        return self.dump_json(j, prettyprint)
+
+    def dump_json(self, j, prettyprint=False):
+        """
+        Encode a list of sensor entries
+        """
+        if prettyprint:
+            return self.codec.dumps_pretty(j)
+        return self.codec.dumps(j)
+
+    def get_json_tuples(self, prettyprint=False, translate=True, data=None):
+        """
+        Get the data as JSON tuples
+        """
+        if self.metrics is not None:
+            start = self.start_serialize()
+        j = self.get_json_fragments(prettyprint, translate, data)
+        if not j:
             j = ""
+        elif prettyprint:
+            j = "\n" + ",\n".join(j) + ",\n"
+        else:
+            j = ", ".join(j) + ","
+        if self.metrics is not None:
+            self.count_serialized(j, start)
         return j
 
@@ -0,0 +1,128 @@
+"""
+MODULE:       delta
+PURPOSE:      report only the sensors that changed since the last report.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import time
+
+class DeltaReport(object):
+    """
+    Tracks what was reported from a data store. A report contains the
+    sensors updated since the last one, unless their value stayed
+    within the deadband of the value reported before. From time to time
+    a keyframe with all the sensors is reported, so the receiver catches
+    up after a lost report and learns that the quiet sensors are still
+    alive. The reports are JSON arrays as usual, so the receiver need
+    not know about deltas at all.
+    """
+
+    def __init__(self, store, deadband=None, default_deadband=None, \
+                                keyframe_every=None, keyframe_interval=3600):
+        """
+        Initialize the tracking
+            store               the data store to report
+            deadband            sensor id -> tolerance, changes of the
+                                value up to it are not reported
+            default_deadband    the tolerance of the other sensors (None:
+                                report every change of the value)
+            keyframe_every      report all sensors every that many reports
+            keyframe_interval   report all sensors after that many seconds
+        """
+        self.store = store
+        self.deadband = dict(deadband or {})
+        self.default_deadband = default_deadband
+        self.keyframe_every = keyframe_every
+        self.keyframe_interval = keyframe_interval
+        # the version of the store seen last
+        self.version = 0
+        # sensor id -> record reported last
+        self.reported = {}
+        self.last_keyframe = None
+        self.count = 0
+
+    def reset(self):
+        """
+        Forget what was reported, the next report is a keyframe
+        """
+        self.last_keyframe = None
+
+    def is_keyframe_due(self, now):
+        if self.last_keyframe is None:
+            return True
+        if self.keyframe_every and self.count >= self.keyframe_every:
+            return True
+        if self.keyframe_interval is not None and \
+                        now - self.last_keyframe >= self.keyframe_interval:
+            return True
+        return False
+
+    def is_unchanged(self, sensor_id, record):
+        """
+        Whether the record's value does not differ enough from the one
+        reported last
+        """
+        old = self.reported.get(sensor_id)
+        if old is None or old.unit != record.unit:
+            return False
+        if old.value == record.value:
+            return True
+        tolerance = self.deadband.get(sensor_id, self.default_deadband)
+        if tolerance is None:
+            return False
+        try:
+            return abs(float(record.value) - float(old.value)) <= tolerance
+        except (TypeError, ValueError):
+            return False
+
+    def get_data(self, now=None):
+        """
+        Get the data to report next (sensor id -> record) and take it as
+        reported, i.e. everything on a keyframe and the changes otherwise
+        """
+        data, state = self.prepare(now)
+        self.advance(state)
+        return data
+
+    def prepare(self, now=None):
+        """
+        Get the data to report next like get_data(), but only take it as
+        reported once it is passed on to advance() with the state
+        returned along with it (e.g. after it was written)
+        """
+        if now is None:
+            now = time.time()
+        if self.is_keyframe_due(now):
+            version, data = self.store.get_changes(0)
+            return data, (version, data, now)
+        version, changed = self.store.get_changes(self.version)
+        data = {}
+        for k in changed:
+            r = changed[k]
+            if not self.is_unchanged(k, r):
+                data[k] = r
+        return data, (version, data, None)
+
+    def advance(self, state):
+        """
+        Take the data prepared as reported
+        """
+        version, data, keyframe = state
+        self.version = version
+        if keyframe is not None:
+            self.reported = dict(data)
+            self.last_keyframe = keyframe
+            self.count = 0
+        else:
+            self.reported.update(data)
+            self.count += 1
+
+    def get_json(self, prettyprint=False, translate=True, now=None):
+        """
+        Get the next report in JSON form
+        """
+        return self.store.get_json(prettyprint, translate, self.get_data(now))
@@ -0,0 +1,173 @@
+"""
+MODULE:       filesink
+PURPOSE:      append the reports to a local file that is rotated from time
+              to time.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import datetime
+import gzip
+import os
+import shutil
+import threading
+import time
+
+class FileSink(object):
+    """
+    A log file kept open between the reports. The writes are buffered,
+    synced to disk in batches and the file is rotated when it gets too
+    big or too old. Rotated files may be compressed with gzip or zstd
+    (the latter needs the 'zstandard' package), on a thread of their own
+    so the report that rotated the file does not wait for it.
+    """
+
+    def __init__(self, path, buffer_size=65536, fsync_every=0, \
+                    fsync_interval=None, max_bytes=None, max_age=None, \
+                    compress=None):
+        """
+        Initialize the sink
+            path            the file to write to
+            buffer_size     bytes to collect before writing them out
+            fsync_every     sync to disk after this many writes (0: never)
+            fsync_interval  sync to disk after this many seconds
+            max_bytes       rotate when the file gets bigger than this
+            max_age         rotate when the file gets older than this
+                            (seconds)
+            compress        None, "gzip" or "zstd" for the rotated files
+        """
+        if compress not in (None, "gzip", "zstd"):
+            raise ValueError("Unknown compression: " + str(compress))
+        if compress == "zstd":
+            # fail early if it is not available
+            import zstandard
+        self.path = path
+        self.buffer_size = buffer_size
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress = compress
+        # the threads compressing rotated files
+        self.compressing = []
+        self.fh = None
+        self.open()
+
+    def open(self):
+        """
+        Open (or continue) the file
+        """
+        self.fh = open(self.path, "ab", self.buffer_size)
+        self.size = self.fh.tell()
+        self.opened = time.time()
+        self.last_sync = self.opened
+        self.unsynced = 0
+
+    def write(self, data):
+        """
+        Append a (unicode) string
+        """
+        if self.fh is None:
+            self.open()
+        b = data.encode("UTF-8")
+        self.fh.write(b)
+        self.size += len(b)
+        self.unsynced += 1
+        now = time.time()
+        if (self.fsync_every and self.unsynced >= self.fsync_every) or \
+                (self.fsync_interval is not None and \
+                            now - self.last_sync >= self.fsync_interval):
+            self.sync(now)
+        if (self.max_bytes is not None and self.size >= self.max_bytes) or \
+                (self.max_age is not None and \
+                            now - self.opened >= self.max_age):
+            self.rotate()
+
+    def sync(self, now=None):
+        """
+        Write the buffer out and make sure it reaches the disk
+        """
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+        self.unsynced = 0
+        self.last_sync = now or time.time()
+
+    def rotate(self):
+        """
+        Move the current file aside and start a new one, return the
+        name of the rotated file (the name it gets once it is compressed,
+        see wait())
+        """
+        self.sync()
+        self.fh.close()
+        self.fh = None
+        stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        name = self.path + "." + stamp
+        n = 1
+        while os.path.exists(name) or os.path.exists(name + ".gz") or \
+                                            os.path.exists(name + ".zst"):
+            name = self.path + "." + stamp + "-" + str(n)
+            n += 1
+        os.rename(self.path, name)
+        self.open()
+        if self.compress is None:
+            return name
+        self.compressing = [t for t in self.compressing if t.is_alive()]
+        t = threading.Thread(target=self.compress_file, args=(name,))
+        t.start()
+        self.compressing.append(t)
+        return name + (".gz" if self.compress == "gzip" else ".zst")
+
+    def compress_file(self, name):
+        """
+        Compress a rotated file, return the new name
+        """
+        if self.compress == "gzip":
+            target = name + ".gz"
+        else:
+            target = name + ".zst"
+        # only complete files get the final name
+        part = target + ".part"
+        try:
+            if self.compress == "gzip":
+                with open(name, "rb") as src:
+                    with gzip.open(part, "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+            else:
+                import zstandard
+                with open(name, "rb") as src:
+                    with open(part, "wb") as dst:
+                        zstandard.ZstdCompressor().copy_stream(src, dst)
+            os.rename(part, target)
+            os.remove(name)
+        except (IOError, OSError) as e:
+            print(e)
+            print("Could not compress " + name + ", it is kept as it is..")
+            # do not leave a half written file behind
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+            return name
+        return target
+
+    def wait(self):
+        """
+        Wait until the rotated files are compressed
+        """
+        for t in self.compressing:
+            t.join()
+        self.compressing = []
+
+    def close(self):
+        """
+        Sync and close the file, and wait for the compression
+        """
+        if self.fh is not None:
+            self.sync()
+            self.fh.close()
+            self.fh = None
+        self.wait()
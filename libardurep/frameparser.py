@@ -0,0 +1,184 @@
+"""
+MODULE:       frameparser
+PURPOSE:      parse the frames sent over the serial line line by line.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import json
+from time import perf_counter
+
+from libardurep.codec import stdlib_loads_bytes
+from libardurep.metrics import TIMING_SAMPLE
+
+class FrameParser(object):
+    """
+    Incremental parser for the sensor data frames. The micro controller
+    sends a frame as a JSON array with one sensor object per line, e.g.
+
+        [
+          {"id":"light_value","value":777},
+          {"id":"box_temperature","value":23.31,"unit":"C"}
+        ]
+
+    Every data line is decoded as soon as it arrives, so a corrupt line
+    only costs its own record and not the whole frame.
+    """
+
+    def __init__(self, loads=json.loads, codec=None, timer=None):
+        """
+        Initialize the parser
+            loads         the function used to decode a single JSON object
+            codec         a Codec to decode the lines with instead, it
+                          takes the bytes as they are
+            timer         a Histogram to file the time it takes to decode
+                          one in TIMING_SAMPLE frames in
+        """
+        self.loads = loads
+        if codec is not None:
+            self.loads_bytes = codec.loads_bytes
+        elif loads is json.loads:
+            self.loads_bytes = stdlib_loads_bytes
+        else:
+            self.loads_bytes = lambda b: loads(b.decode("UTF-8"))
+        # the records of the frame currently being received (None while
+        # we are waiting for the start of a frame)
+        self.records = None
+        # an incomplete line from the last chunk fed
+        self.buffer = b""
+        # count the lines we could not make sense of
+        self.dropped = 0
+        # count the frames cut off or with lines we could not make sense
+        # of, and whether the current one is already counted
+        self.frames_dropped = 0
+        self.broken = False
+        self.timer = timer
+        # the frames left until the next one is timed, and the time spent
+        # decoding the current one (None if it is not timed)
+        self.countdown = 1
+        self.elapsed = None
+
+    def feed_line(self, line):
+        """
+        Parse one (bytes) line and return the list of records once the
+        frame is complete, None otherwise
+        """
+        l = line.strip()
+        if l == b"[":
+            if self.records is not None:
+                # the end of the last frame never arrived
+                self.drop_frame()
+            # start recording
+            self.records = []
+            self.broken = False
+            if self.timer is not None:
+                self.countdown -= 1
+                if not self.countdown:
+                    self.countdown = TIMING_SAMPLE
+                    self.elapsed = 0.0
+        elif l == b"]":
+            records = self.records
+            self.records = None
+            if self.elapsed is not None:
+                if records:
+                    self.timer.observe(self.elapsed)
+                self.elapsed = None
+            if records:
+                return records
+        elif line[0:3] == b"  {" and self.records is not None:
+            # this is a data line, the separating comma is optional
+            if l[-1:] == b",":
+                l = l[:-1]
+            if self.elapsed is None:
+                record = self.parse_record(l)
+            else:
+                start = perf_counter()
+                record = self.parse_record(l)
+                self.elapsed += perf_counter() - start
+            if record is not None:
+                self.records.append(record)
+        return None
+
+    def drop_frame(self):
+        """
+        Count the current frame as dropped, once
+        """
+        if not self.broken:
+            self.broken = True
+            self.frames_dropped += 1
+
+    def parse_record(self, l):
+        """
+        Decode a single data line, count it as dropped if it is corrupt
+        """
+        try:
+            record = self.loads_bytes(l)
+        except (UnicodeDecodeError, ValueError):
+            self.dropped += 1
+            self.drop_frame()
+            return None
+        if not isinstance(record, dict):
+            self.dropped += 1
+            self.drop_frame()
+            return None
+        return record
+
+    def feed(self, data):
+        """
+        Feed an arbitrary chunk of bytes and return the list of frames
+        completed by it
+        """
+        frames = []
+        # only the first line is joined with the rest of the last chunk,
+        # instead of copying the whole chunk
+        lines = data.split(b"\n")
+        if self.buffer:
+            lines[0] = self.buffer + lines[0]
+        # the last element is the beginning of a line still to come
+        self.buffer = lines.pop()
+        for l in lines:
+            records = self.feed_line(l)
+            if records is not None:
+                frames.append(records)
+        return frames
+
+    def reset(self):
+        """
+        Forget about the frame currently being received
+        """
+        self.records = None
+        self.buffer = b""
+        self.elapsed = None
+
+def iter_frames(chunks, parser=None):
+    """
+    Generator of the complete frames (lists of records) found in an
+    iterable of byte chunks (e.g. a file opened in binary mode)
+    """
+    if parser is None:
+        parser = FrameParser()
+    for chunk in chunks:
+        for frame in parser.feed(chunk):
+            yield frame
+
+def iter_records(chunks, parser=None):
+    """
+    Generator of the sensor records found in an iterable of byte chunks.
+    The records are returned as soon as their line was parsed, i.e. before
+    the frame they belong to is complete.
+    """
+    if parser is None:
+        parser = FrameParser()
+    for chunk in chunks:
+        lines = chunk.split(b"\n")
+        if parser.buffer:
+            lines[0] = parser.buffer + lines[0]
+        parser.buffer = lines.pop()
+        for l in lines:
+            n = len(parser.records) if parser.records else 0
+            parser.feed_line(l)
+            if parser.records and len(parser.records) > n:
+                yield parser.records[-1]
@@ -0,0 +1,143 @@
+"""
+MODULE:       history
+PURPOSE:      keep the recent values of every sensor.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+from array import array
+
+class RingBuffer(object):
+    """
+    Fixed size buffer of (time, value) samples, the oldest sample is
+    overwritten when it is full. Times and values are kept in two plain
+    arrays of doubles, i.e. 16 bytes per sample.
+
+    The samples are searched by time, so the times must not go back.
+    They are times of arrival from the wall clock, though, which can be
+    set back. A sample older than the newest one is kept with the time
+    of the newest one instead, until the clock has caught up again.
+    """
+
+    def __init__(self, size):
+        """
+        Initialize the buffer
+            size          the maximal number of samples to keep
+        """
+        if size < 1:
+            raise ValueError("The buffer must hold at least one sample..")
+        self.size = size
+        self.times = array("d", [0.0]) * size
+        self.values = array("d", [0.0]) * size
+        # index of the oldest sample and number of samples
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, t, value):
+        """
+        Add a sample, at the time of the newest one if t is older
+        """
+        i = (self.start + self.count) % self.size
+        if self.count:
+            # the newest sample (index -1 is the end of the array)
+            last = self.times[i - 1]
+            if t < last:
+                # the clock went back
+                t = last
+        self.times[i] = t
+        self.values[i] = value
+        if self.count == self.size:
+            self.start = (self.start + 1) % self.size
+        else:
+            self.count += 1
+
+    def evict(self, t):
+        """
+        Forget all samples older than t
+        """
+        n = self.find(t)
+        self.start = (self.start + n) % self.size
+        self.count -= n
+
+    def find(self, t):
+        """
+        Get the number of samples older than t (binary search)
+        """
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[(self.start + mid) % self.size] < t:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, start=None, end=None):
+        """
+        Get the samples from start to end (both inclusive) as a list of
+        (time, value) tuples, oldest first
+        """
+        first = 0 if start is None else self.find(start)
+        samples = []
+        for n in range(first, self.count):
+            i = (self.start + n) % self.size
+            if end is not None and self.times[i] > end:
+                break
+            samples.append((self.times[i], self.values[i]))
+        return samples
+
+class SensorHistory(object):
+    """
+    A ring buffer per sensor, limited by the number of samples and
+    optionally by their age
+    """
+
+    def __init__(self, size=1024, max_age=None):
+        """
+        Initialize the history
+            size          the number of samples to keep per sensor
+            max_age       forget samples older than this (seconds)
+        """
+        self.size = size
+        self.max_age = max_age
+        self.buffers = {}
+
+    def add(self, sensor_id, t, value):
+        """
+        Remember a sample, return False if the value is not a number
+        """
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return False
+        if sensor_id not in self.buffers:
+            self.buffers[sensor_id] = RingBuffer(self.size)
+        b = self.buffers[sensor_id]
+        b.append(t, value)
+        if self.max_age is not None:
+            b.evict(t - self.max_age)
+        return True
+
+    def get(self, sensor_id, start=None, end=None, now=None):
+        """
+        Get the samples of a sensor from start to end (epoch seconds)
+        """
+        if sensor_id not in self.buffers:
+            return []
+        b = self.buffers[sensor_id]
+        if self.max_age is not None and now is not None:
+            b.evict(now - self.max_age)
+        return b.get(start, end)
+
+    def sensors(self):
+        """
+        Get the ids of the sensors with a history
+        """
+        return list(self.buffers.keys())
@@ -0,0 +1,209 @@
+"""
+MODULE:       ingest
+PURPOSE:      thin out the samples of sensors sending more often than
+              anybody reports them.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+
+The data store keeps only the latest sample of a sensor anyway. A sensor
+sending a thousand times per second costs a thousand records per second
+though, most of which are overwritten before they are ever reported.
+An IngestFilter looks at the decoded entries before the store makes
+records of them, and lets through only what the sensor's IngestPolicy
+allows. A sample thrown away costs a few lookups and comparisons.
+"""
+
+class IngestPolicy(object):
+    """
+    What to let through of a sensor's samples
+        max_rate      samples per second at most, the samples coming
+                      sooner after the last one let through are dropped
+        deadband      the samples whose value does not differ by more
+                      than that from the last one let through are
+                      dropped (non-numeric values: if they are equal)
+        coalesce      let through at most one sample per that many
+                      seconds, the latest one: the samples coming sooner
+                      are held back, each replacing the one before, and
+                      registered once the interval is over (with the
+                      next registration, see IngestFilter.filter())
+    """
+
+    __slots__ = ("max_rate", "deadband", "coalesce", "interval")
+
+    def __init__(self, max_rate=None, deadband=None, coalesce=None):
+        if max_rate is not None and max_rate <= 0:
+            raise ValueError("The maximal rate must be positive")
+        if max_rate is not None and coalesce is not None:
+            raise ValueError("Either drop (max_rate) or coalesce the samples")
+        self.max_rate = max_rate
+        self.deadband = deadband
+        self.coalesce = coalesce
+        # the least time between two samples let through
+        if max_rate is not None:
+            self.interval = 1.0 / max_rate
+        else:
+            self.interval = coalesce or 0.0
+
+    def __repr__(self):
+        return "IngestPolicy(max_rate=%r, deadband=%r, coalesce=%r)" % \
+                                (self.max_rate, self.deadband, self.coalesce)
+
+class SensorState(object):
+    """
+    The policy of a sensor and what was let through last
+    """
+
+    __slots__ = ("policy", "time", "value")
+
+    def __init__(self, policy):
+        self.policy = policy
+        self.time = None
+        self.value = None
+
+class IngestFilter(object):
+    """
+    Applies the IngestPolicy of every sensor ('policies', sensor id ->
+    policy, the others get 'default', None: everything is let through)
+    to the decoded entries, read by 'id_key' and 'value_key'. Entries
+    without a usable id are always let through, the store decides what
+    to do with them.
+    """
+
+    def __init__(self, policies=None, default=None, id_key="id", \
+                                                            value_key="value"):
+        self.policies = dict(policies or {})
+        self.default = default
+        self.id_key = id_key
+        self.value_key = value_key
+        # sensor id -> SensorState, False for no policy at all
+        self.states = {}
+        # sensor id -> entry held back by coalescing
+        self.pending = {}
+        # the time the next entry held back is due (None: none is)
+        self.due = None
+        # samples dropped respectively replaced by a later one
+        self.dropped = 0
+        self.coalesced = 0
+
+    def set_policy(self, sensor_id, policy):
+        """
+        Set the policy of a sensor (None: let everything through), and
+        start over with it
+        """
+        if policy is None:
+            self.policies.pop(sensor_id, None)
+        else:
+            self.policies[sensor_id] = policy
+        self.states.pop(sensor_id, None)
+        self.pending.pop(sensor_id, None)
+
+    def set_default(self, policy):
+        """
+        Set the policy of the sensors without one of their own, and
+        start over with all of them (the entries held back are dropped)
+        """
+        self.default = policy
+        self.states = {}
+        self.pending = {}
+        self.due = None
+
+    def get_state(self, sensor_id):
+        p = self.policies.get(sensor_id, self.default)
+        if p is None:
+            s = False
+        else:
+            s = SensorState(p)
+        self.states[sensor_id] = s
+        return s
+
+    def filter(self, j, now):
+        """
+        Get the entries of a decoded frame let through at time 'now'
+        (epoch seconds), including those held back that are due by now
+        """
+        id_key = self.id_key
+        states = self.states
+        pending = self.pending
+        accepted = []
+        for v in j:
+            try:
+                k = v[id_key]
+                s = states.get(k)
+            except (KeyError, TypeError):
+                # no or no usable id, or not even an object
+                accepted.append(v)
+                continue
+            if s is None:
+                s = self.get_state(k)
+            if s is False:
+                accepted.append(v)
+                continue
+            p = s.policy
+            if s.time is not None and now - s.time < p.interval:
+                if p.coalesce is None:
+                    self.dropped += 1
+                    continue
+                # keep the latest one for the end of the interval
+                if k in pending:
+                    self.coalesced += 1
+                pending[k] = v
+                due = s.time + p.interval
+                if self.due is None or due < self.due:
+                    self.due = due
+                continue
+            if self.let_through(s, v, now):
+                accepted.append(v)
+                if pending:
+                    # this one is newer than the one held back
+                    if pending.pop(k, None) is not None:
+                        self.coalesced += 1
+        if self.due is not None and now >= self.due:
+            self.flush(now, accepted)
+        return accepted
+
+    def let_through(self, s, v, now):
+        """
+        Check a sample against the deadband and take it as the sensor's
+        latest one if it passes
+        """
+        p = s.policy
+        try:
+            value = v[self.value_key]
+        except (KeyError, TypeError):
+            # the store decides about an entry without a value
+            return True
+        if p.deadband is not None and s.time is not None:
+            try:
+                if value == s.value or \
+                                    abs(value - s.value) <= p.deadband:
+                    self.dropped += 1
+                    return False
+            except TypeError:
+                # not a number
+                pass
+        s.time = now
+        s.value = value
+        return True
+
+    def flush(self, now, accepted=None):
+        """
+        Get the entries held back whose interval is over by time 'now'
+        (appended to 'accepted' if given)
+        """
+        if accepted is None:
+            accepted = []
+        due = None
+        for k in list(self.pending):
+            s = self.states[k]
+            d = s.time + s.policy.interval
+            if d <= now:
+                v = self.pending.pop(k)
+                if self.let_through(s, v, now):
+                    accepted.append(v)
+            elif due is None or d < due:
+                due = d
+        self.due = due
+        return accepted
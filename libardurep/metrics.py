@@ -0,0 +1,368 @@
+"""
+MODULE:       metrics
+PURPOSE:      count what happens on the hot paths and how long it takes.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+
+The readers, the data store and the reporter update the counters and
+latency histograms of a MetricsRegistry, by default the shared
+'registry' below (pass metrics=False to them to turn it off). Read them
+with get_metrics() or in the Prometheus text format with get_text(),
+which start_http_server() serves over HTTP.
+
+The metrics are updated without a lock to keep them cheap: an update is
+a few attribute increments, so concurrent updates of the same metric
+could lose one on rare occasions, which does not matter for monitoring.
+
+Reading the clock and filing the duration in a histogram costs more
+than decoding a small frame takes to a few percent, so the store (and
+the frame parsers of the readers feeding it) only times every
+TIMING_SAMPLE-th frame it decodes and encodes: the count of its latency
+histograms is the number of frames timed, not of all the frames (which
+the counters have).
+"""
+
+from bisect import bisect_left
+import threading
+import weakref
+
+# the store times one in that many frames
+TIMING_SAMPLE = 64
+
+# the upper bounds of the latency buckets in seconds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, \
+                    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 60.0)
+
+class Counter(object):
+    """
+    A number that only goes up
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def get(self):
+        return self.value
+
+class FunctionCounter(object):
+    """
+    A counter kept by some object anyway, read when it is collected
+    """
+
+    __slots__ = ("function",)
+
+    def __init__(self, function):
+        self.function = function
+
+    def get(self):
+        return self.function()
+
+class AttributeCounter(object):
+    """
+    A counter kept by some objects anyway as one of their attributes,
+    the sum of them is read when it is collected. Only weak references
+    to the objects are held, once one is gone (or released) the value
+    read last stays in the sum, so the counter does not go back when an
+    object is replaced by a new one, e.g. the parser of a reader that
+    reconnects.
+    """
+
+    __slots__ = ("attribute", "value", "objects")
+
+    def __init__(self, attribute, value=0):
+        self.attribute = attribute
+        # the sum of the objects released
+        self.value = value
+        # [weak reference, value read last] per object
+        self.objects = []
+
+    def add(self, obj):
+        for o in self.objects:
+            if o[0]() is obj:
+                return
+        self.objects.append([weakref.ref(obj), getattr(obj, self.attribute)])
+
+    def release(self, obj):
+        """
+        Keep the value read from 'obj', but stop reading it
+        """
+        for o in self.objects:
+            if o[0]() is obj:
+                o[1] = getattr(obj, self.attribute)
+                self.value += o[1]
+                self.objects.remove(o)
+                return
+
+    def get(self):
+        n = self.value
+        for o in list(self.objects):
+            obj = o[0]()
+            if obj is not None:
+                o[1] = getattr(obj, self.attribute)
+            n += o[1]
+        return n
+
+class Histogram(object):
+    """
+    The distribution of observed values (e.g. durations in seconds) in
+    buckets with fixed upper bounds, plus their sum
+    """
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        # the last one counts the values above all bounds
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, x):
+        # the total count is added up when it is read
+        self.counts[bisect_left(self.bounds, x)] += 1
+        self.sum += x
+
+    def get(self):
+        """
+        Get the count, the sum and the cumulative count per upper bound
+        """
+        buckets = []
+        n = 0
+        for b, c in zip(self.bounds + (float("inf"),), list(self.counts)):
+            n += c
+            buckets.append((b, n))
+        return {"count": n, "sum": self.sum, "buckets": buckets}
+
+class MetricFamily(object):
+    """
+    A metric by name, with one child per set of label values
+    """
+
+    def __init__(self, name, kind, help):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        # sorted (label, value) tuple -> Counter, Histogram, ...
+        self.children = {}
+
+class MetricsRegistry(object):
+    """
+    The metrics of a process by name. The get methods create a metric
+    on first use and return the same one for the same name and labels
+    afterwards.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {}
+
+    def get_child(self, name, kind, help, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            f = self.families.get(name)
+            if f is None:
+                f = MetricFamily(name, kind, help)
+                self.families[name] = f
+            elif f.kind != kind:
+                raise ValueError("The metric " + name + " is a " + f.kind)
+            m = f.children.get(key)
+            if m is None:
+                m = factory()
+                f.children[key] = m
+            return m
+
+    def counter(self, name, help="", **labels):
+        """
+        Get a counter
+        """
+        return self.get_child(name, "counter", help, labels, Counter)
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS, **labels):
+        """
+        Get a histogram
+        """
+        return self.get_child(name, "histogram", help, labels, \
+                                                lambda: Histogram(buckets))
+
+    def set_child(self, name, help, labels, m):
+        key = tuple(sorted(labels.items()))
+        self.get_child(name, "counter", help, labels, Counter)
+        with self.lock:
+            self.families[name].children[key] = m
+
+    def counter_function(self, name, function, help="", **labels):
+        """
+        Report what function() returns as a counter, replacing the
+        function registered before for the same labels (the registry
+        keeps the function and whatever it refers to)
+        """
+        self.set_child(name, help, labels, FunctionCounter(function))
+
+    def counter_attribute(self, name, obj, attribute, help="", **labels):
+        """
+        Report an attribute of 'obj' as a counter, added to the objects
+        registered before for the same labels (see AttributeCounter)
+        """
+        key = tuple(sorted(labels.items()))
+        m = self.get_child(name, "counter", help, labels, \
+                                        lambda: AttributeCounter(attribute))
+        with self.lock:
+            if not isinstance(m, AttributeCounter):
+                # go on from the counter's value
+                m = AttributeCounter(attribute, m.get())
+                self.families[name].children[key] = m
+            m.add(obj)
+
+    def freeze(self, name, obj, **labels):
+        """
+        Keep the current value of a counter read from 'obj', but stop
+        reading it (nothing happens if the counter is not read from
+        'obj' (anymore))
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            f = self.families.get(name)
+            m = f and f.children.get(key)
+            if isinstance(m, AttributeCounter):
+                m.release(obj)
+
+    def get_metrics(self):
+        """
+        Get the current values: name -> list of (labels, value), the
+        value of a histogram is a dict, see Histogram.get()
+        """
+        with self.lock:
+            families = [(f.name, list(f.children.items())) \
+                                        for f in self.families.values()]
+        metrics = {}
+        for name, children in families:
+            metrics[name] = [(dict(k), m.get()) for k, m in children]
+        return metrics
+
+    def get_value(self, name, **labels):
+        """
+        Get the current value of a metric, None if there is none
+        """
+        with self.lock:
+            f = self.families.get(name)
+            m = f and f.children.get(tuple(sorted(labels.items())))
+        if m is None:
+            return None
+        return m.get()
+
+    def get_text(self):
+        """
+        Get the metrics in the Prometheus text exposition format
+        """
+        with self.lock:
+            families = [(f, list(f.children.items())) \
+                            for f in sorted(self.families.values(), \
+                                                    key=lambda f: f.name)]
+        lines = []
+        for f, children in families:
+            lines.append("# HELP " + f.name + " " + escape(f.help, False))
+            lines.append("# TYPE " + f.name + " " + f.kind)
+            for k, m in sorted(children, key=lambda c: c[0]):
+                v = m.get()
+                if f.kind == "histogram":
+                    for b, n in v["buckets"]:
+                        lines.append(f.name + "_bucket" + \
+                                format_labels(k + (("le", \
+                                format_value(b)),)) + " " + str(n))
+                    lines.append(f.name + "_sum" + format_labels(k) + " " + \
+                                                        format_value(v["sum"]))
+                    lines.append(f.name + "_count" + format_labels(k) + \
+                                                        " " + str(v["count"]))
+                else:
+                    lines.append(f.name + format_labels(k) + " " + \
+                                                            format_value(v))
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self.lock:
+            self.families = {}
+
+def escape(s, quote=True):
+    s = str(s).replace("\\", "\\\\").replace("\n", "\\n")
+    if quote:
+        s = s.replace('"', '\\"')
+    return s
+
+def format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join([k + '="' + escape(v) + '"' for k, v in key]) + "}"
+
+def format_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    if isinstance(v, float):
+        return repr(v)
+    return str(v)
+
+def get_registry(metrics):
+    """
+    Get the registry a component is to use: the shared one for None, no
+    registry at all for False
+    """
+    if metrics is None:
+        return registry
+    if metrics is False:
+        return None
+    return metrics
+
+def add_reader_metrics(reader, metrics, device):
+    """
+    Get the registry a serial line reader is to use (see get_registry())
+    and set up its metrics there: the counters and the histogram become
+    attributes of the reader, the lines dropped are read from its parser
+    until release_reader_metrics() and added to those of the readers of
+    the device before
+    """
+    m = get_registry(metrics)
+    if m is not None:
+        d = str(device)
+        reader.frames_read = m.counter("ardu_reader_frames_total", \
+                    "Frames read from the serial line", device=d)
+        reader.frames_dropped = m.counter( \
+                    "ardu_reader_frames_dropped_total", \
+                    "Frames cut off or with data lines thrown away", device=d)
+        reader.wait_time = m.histogram("ardu_reader_wait_seconds", \
+                    "Time spent waiting for the serial line", device=d)
+        m.counter_attribute("ardu_reader_lines_dropped_total", \
+                    reader.parser, "dropped", \
+                    "Data lines that could not be decoded", device=d)
+    return m
+
+def release_reader_metrics(reader, metrics, device):
+    """
+    Keep the number of lines the reader dropped, but stop reading its
+    parser (once the reader is done)
+    """
+    if metrics is not None:
+        metrics.freeze("ardu_reader_lines_dropped_total", reader.parser, \
+                                                            device=str(device))
+
+def start_http_server(port=9100, host="", metrics=None):
+    """
+    Serve the metrics in the Prometheus text format on a thread of its
+    own, return the server (stop it with shutdown())
+    """
+    # http.server is only imported when it is needed, see metricsserver
+    from libardurep.metricsserver import MetricsHandler, MetricsServer
+    server = MetricsServer((host, port), MetricsHandler)
+    server.registry = get_registry(metrics) or registry
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server
+
+# shared by all the components unless they get their own
+registry = MetricsRegistry()
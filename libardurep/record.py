@@ -0,0 +1,141 @@
+"""
+MODULE:       record
+PURPOSE:      compact representation of a sensor data set.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+# marks the fields a sensor did not send
+MISSING = object()
+
+class SensorRecord(object):
+    """
+    The data of one sensor. The fields live in slots instead of a dict
+    per sensor (about 125-145 instead of 200-220 bytes per sensor), but
+    the record can still be read like the dict it replaces, i.e. by the
+    (configurable) key names of the data store.
+    Records are not to be changed once they are registered, the data
+    store only sets the version (of the store) they were registered at.
+
+    Use make_record_type() to get a record class for a set of key names.
+    """
+
+    __slots__ = ("id", "value", "unit", "threshold", "other", \
+                            "sensor_time", "time", "received", "version")
+
+    # (key name, slot) of the well known fields, in output order
+    key_slots = ()
+    # the key names of the 'other' fields
+    other_keys = ()
+    # key name -> slot
+    slot_of = {}
+
+    def __init__(self, id, value, unit=MISSING, threshold=MISSING, \
+                            other=None, sensor_time=MISSING, time=MISSING, \
+                            received=None):
+        self.id = id
+        self.value = value
+        self.unit = unit
+        self.threshold = threshold
+        # None or a tuple with the values of other_keys (or MISSING)
+        self.other = other
+        self.sensor_time = sensor_time
+        self.time = time
+        # the time of arrival in epoch seconds (not part of the entry)
+        self.received = received
+        # the version of the data store that registered the record
+        self.version = 0
+
+    def items(self):
+        """
+        Get the (key, value) pairs of the fields present
+        """
+        i = []
+        for k, s in self.key_slots:
+            if s == "other":
+                if self.other is not None:
+                    for n, v in zip(self.other_keys, self.other):
+                        if v is not MISSING:
+                            i.append((n, v))
+                continue
+            v = getattr(self, s)
+            if v is not MISSING:
+                i.append((k, v))
+        return i
+
+    def keys(self):
+        return [k for k, v in self.items()]
+
+    def values(self):
+        return [v for k, v in self.items()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def get(self, key, default=None):
+        s = self.slot_of.get(key)
+        if s is not None:
+            v = getattr(self, s)
+        elif key in self.other_keys and self.other is not None:
+            v = self.other[self.other_keys.index(key)]
+        else:
+            return default
+        if v is MISSING:
+            return default
+        return v
+
+    def __getitem__(self, key):
+        v = self.get(key, MISSING)
+        if v is MISSING:
+            raise KeyError(key)
+        return v
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, SensorRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return self.__class__.__name__ + "(" + repr(self.to_dict()) + ")"
+
+def make_record_type(id_key, value_key, unit_key, threshold_key, \
+                                    other_keys, sensor_time_key, time_key):
+    """
+    Create a record class reading its fields by the given key names
+    """
+    key_slots = (
+        (id_key, "id"),
+        (value_key, "value"),
+        (unit_key, "unit"),
+        (threshold_key, "threshold"),
+        (None, "other"),
+        (sensor_time_key, "sensor_time"),
+        (time_key, "time")
+    )
+    slot_of = {}
+    for k, s in key_slots:
+        if k is not None:
+            slot_of[k] = s
+    return type("SensorRecord", (SensorRecord,), {
+        "__slots__": (),
+        "key_slots": key_slots,
+        "other_keys": tuple(other_keys),
+        "slot_of": slot_of
+    })
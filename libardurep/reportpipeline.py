@@ -0,0 +1,203 @@
+"""
+MODULE:       reportpipeline
+PURPOSE:      report the data from the store in the background.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+from collections import deque
+import threading
+
+class ReportPipeline(object):
+    """
+    Queue of store snapshots that worker threads send via HTTP POST, so
+    a slow or unreachable host does not hold up the caller. Snapshots
+    that still fail after the retries go to the reporter's spool, if it
+    has one, and as long as it can not be replayed completely the new
+    snapshots are spooled behind it (see DataReporter.deliver()). Every
+    worker sends over an HTTP session of its own. The reporter's delta
+    report is used by one thread at a time (as long as nobody else uses
+    the reporter meanwhile), the spool has a lock of its own, so nothing
+    is sent while submit() might be waiting for the lock.
+
+    If the queue is full when a new snapshot arrives, the policy decides:
+        drop_oldest     forget the oldest snapshot waiting
+        drop_newest     forget the new snapshot
+        coalesce        the new snapshot replaces the newest one waiting
+        block           wait for a free place (the new snapshot is
+                        dropped if the pipeline is stopped meanwhile)
+    """
+
+    POLICIES = ("drop_oldest", "drop_newest", "coalesce", "block")
+
+    def __init__(self, reporter, url=None, maxsize=10, workers=1, \
+                    policy="drop_oldest", retries=5, backoff=1.0, \
+                    max_backoff=60.0):
+        """
+        Initialize the pipeline
+            reporter      the DataReporter used to send the snapshots
+            url           where to send them (default: the reporter's url)
+            maxsize       number of snapshots to keep waiting at most
+            workers       number of sending threads
+            policy        what to do when the queue is full, see above
+            retries       how often to try again to send a snapshot
+            backoff       seconds to wait before the first retry, doubled
+                          for every further retry
+            max_backoff   seconds to wait between two retries at most
+        """
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown policy: " + str(policy))
+        self.reporter = reporter
+        self.url = url
+        self.maxsize = maxsize
+        self.workers = workers
+        self.policy = policy
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.queue = deque()
+        self.condition = threading.Condition()
+        # the reporter's delta report is not thread safe
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.threads = []
+        # the counters
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, data=None):
+        """
+        Queue a snapshot of the store (or the JSON data given), return
+        False if it was dropped
+        """
+        if data is None:
+            with self.lock:
+                data = self.reporter.get_report_json()
+            if data is None:
+                # nothing changed since the last report
+                return True
+        with self.condition:
+            if len(self.queue) >= self.maxsize:
+                if self.policy == "drop_newest":
+                    self.drop()
+                    return False
+                elif self.policy == "drop_oldest":
+                    self.queue.popleft()
+                    self.drop()
+                elif self.policy == "coalesce":
+                    # the new snapshot is more recent than the last one
+                    self.queue[-1] = data
+                    self.drop()
+                    self.queued += 1
+                    return True
+                else:
+                    while len(self.queue) >= self.maxsize and \
+                                                not self.stopping.is_set():
+                        self.condition.wait(1)
+                    if len(self.queue) >= self.maxsize:
+                        # stopped before there was room
+                        self.drop()
+                        return False
+            self.queue.append(data)
+            self.queued += 1
+            self.condition.notify()
+        return True
+
+    def drop(self):
+        """
+        Count a dropped snapshot
+        """
+        self.dropped += 1
+        with self.lock:
+            if self.reporter.delta is not None:
+                # the changes it contained have to be reported again
+                self.reporter.delta.reset()
+
+    def get_counters(self):
+        """
+        Get the number of snapshots queued, sent, dropped, failed and
+        still waiting
+        """
+        with self.condition:
+            return {
+                "queued": self.queued,
+                "sent": self.sent,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "waiting": len(self.queue)
+            }
+
+    def start(self):
+        """
+        Start the worker threads
+        """
+        self.stopping.clear()
+        self.threads = []
+        for i in range(self.workers):
+            t = threading.Thread(target=self.work)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def stop(self, timeout=None):
+        """
+        Send what is waiting (trying only once per snapshot) and stop
+        the worker threads
+        """
+        self.stopping.set()
+        with self.condition:
+            self.condition.notify_all()
+        for t in self.threads:
+            t.join(timeout)
+
+    def work(self):
+        """
+        Send the snapshots until stopped and the queue is empty
+        """
+        session = self.reporter.new_session()
+        try:
+            while True:
+                with self.condition:
+                    while not self.queue and not self.stopping.is_set():
+                        self.condition.wait(1)
+                    if not self.queue:
+                        return
+                    data = self.queue.popleft()
+                    # there is room for a blocked submit() now
+                    self.condition.notify_all()
+                # what was spooled before goes first
+                ok = self.reporter.catch_up(self.url, session=session)
+                if ok:
+                    ok = self.deliver(data, session)
+                if not ok:
+                    # spooled, or else the delta report is reset
+                    with self.lock:
+                        self.reporter.keep(data)
+                with self.condition:
+                    if ok:
+                        self.sent += 1
+                    else:
+                        self.failed += 1
+        finally:
+            session.close()
+
+    def deliver(self, data, session=None):
+        """
+        Try to send a snapshot, back off exponentially on failure
+        """
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            if self.reporter.send(data, self.url, session=session):
+                return True
+            if attempt == self.retries or self.stopping.is_set():
+                break
+            # wait, but not past a stop()
+            if self.stopping.wait(delay):
+                break
+            delay = min(delay * 2, self.max_backoff)
+        return False
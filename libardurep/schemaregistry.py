@@ -0,0 +1,173 @@
+"""
+MODULE:       schemaregistry
+PURPOSE:      share the schemas and the key mappings between data stores.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import threading
+
+from libardurep.codec import get_codec
+from libardurep.record import MISSING, make_record_type
+from libardurep.validation import compile_checked_extract, \
+                                    compile_validator, get_items
+
+class SchemaRegistry(object):
+    """
+    Decodes every schema and validates it against its meta schema only
+    once, and compiles the key mapping for every set of keys only once,
+    however many data stores use them. jsonschema is not imported until
+    a schema is validated for the first time.
+
+    The decoded schemas are shared and must not be changed.
+    """
+
+    def __init__(self, codec=None):
+        """
+        Initialize the registry
+            codec         the JSON codec (or its name) to decode with
+        """
+        self.codec = codec
+        self.lock = threading.RLock()
+        # JSON text -> decoded schema
+        self.schemas = {}
+        # (schema, meta schema) texts validated successfully
+        self.validated = set()
+        # (the keys, checks) -> (record type, extract, translate)
+        self.mappings = {}
+        # (schema, required keys, keys checked) -> entry validator
+        self.validators = {}
+
+    def load(self, text):
+        """
+        Get a decoded schema
+        """
+        with self.lock:
+            s = self.schemas.get(text)
+            if s is None:
+                if self.codec is None or isinstance(self.codec, str):
+                    self.codec = get_codec(self.codec)
+                s = self.codec.loads(text)
+                self.schemas[text] = s
+            return s
+
+    def validate(self, schema, meta_schema):
+        """
+        Get a decoded schema after validating it against its meta schema
+        """
+        with self.lock:
+            s = self.load(schema)
+            if (schema, meta_schema) not in self.validated:
+                from jsonschema import Draft4Validator as Validator
+                Validator(self.load(meta_schema)).validate(s)
+                self.validated.add((schema, meta_schema))
+            return s
+
+    def get_mapping(self, keys, checks=None):
+        """
+        Get the (record type, extract, translate) for the keys, see
+        compile_mapping()
+        """
+        with self.lock:
+            m = self.mappings.get((keys, checks))
+            if m is None:
+                m = compile_mapping(*keys, checks=checks)
+                self.mappings[(keys, checks)] = m
+            return m
+
+    def get_validator(self, schema, required=(), keys=None):
+        """
+        Get the entry validator compiled from an input schema (None: the
+        default schema), see validation.compile_validator()
+        """
+        with self.lock:
+            v = self.validators.get((schema, required, keys))
+            if v is None:
+                v = compile_validator(self.get_items(schema), required, keys)
+                self.validators[(schema, required, keys)] = v
+            return v
+
+    def get_items(self, schema):
+        """
+        Get the 'items' of an input schema (None: the default schema)
+        """
+        return get_items(None if schema is None else self.load(schema))
+
+    def clear(self):
+        with self.lock:
+            self.schemas = {}
+            self.validated = set()
+            self.mappings = {}
+            self.validators = {}
+
+def compile_mapping(id_key, value_key, unit_key, threshold_key, other_keys, \
+                        sensor_time_key, time_key, out_id, out_value, \
+                        out_unit, out_threshold, out_other, out_sensor_time, \
+                        out_time, checks=None):
+    """
+    Prepare the record type and the two functions used to map the input
+    entries to records and the records to the output entries for the
+    keys given, so the keys need not be looked up again for every
+    record. Returns (record type, extract, translate).
+
+    With 'checks' (see validation.get_checks()), extract also checks the
+    types of the fields and the required keys on the way and returns
+    None for an invalid entry. This costs much less than validating the
+    entries separately, as every field is only looked up once.
+    """
+    # the sensor entries are stored as records using these keys
+    R = make_record_type(id_key, value_key, unit_key, threshold_key, \
+                                    other_keys, sensor_time_key, time_key)
+    M = MISSING
+
+    if other_keys:
+        def extract(v, timestamp, now=None):
+            o = None
+            for k in other_keys:
+                if k in v:
+                    o = tuple([v[k] if k in v else M for k in other_keys])
+                    break
+            return R(v[id_key], v[value_key], \
+                v[unit_key] if unit_key in v else M, \
+                v[threshold_key] if threshold_key in v else M, o, \
+                v[sensor_time_key] if sensor_time_key in v else M, \
+                timestamp, now)
+    else:
+        def extract(v, timestamp, now=None):
+            return R(v[id_key], v[value_key], \
+                v[unit_key] if unit_key in v else M, \
+                v[threshold_key] if threshold_key in v else M, None, \
+                v[sensor_time_key] if sensor_time_key in v else M, \
+                timestamp, now)
+
+    if checks is not None:
+        extract = compile_checked_extract(R, id_key, value_key, unit_key, \
+                        threshold_key, other_keys, sensor_time_key, checks)
+
+    def translate(r):
+        d = {out_id: r.id, out_value: r.value}
+        e = r.unit
+        if e is not M:
+            d[out_unit] = e
+        e = r.threshold
+        if e is not M:
+            d[out_threshold] = e
+        if r.other is not None:
+            for k, e in zip(out_other, r.other):
+                if e is not M:
+                    d[k] = e
+        e = r.sensor_time
+        if e is not M:
+            d[out_sensor_time] = e
+        e = r.time
+        if e is not M:
+            d[out_time] = e
+        return d
+
+    return R, extract, translate
+
+# shared by all the data stores unless they get their own
+registry = SchemaRegistry()
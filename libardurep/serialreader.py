@@ -9,30 +9,48 @@ COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
               License (v3).
 """
 
-import json
 import serial
 import threading
-from time import sleep
+from time import perf_counter, sleep
+
+from libardurep.frameparser import FrameParser
+from libardurep.metrics import add_reader_metrics, \
+                                    release_reader_metrics
 
 class SerialReader(threading.Thread):
     """
     Reader class for connecting to an end device and reading its output
     """
 
-    def __init__(self, device, baudrate, store, rounds=100, timeout=60):
+    def __init__(self, device, baudrate, store, rounds=100, timeout=60, \
+                                            blocking=False, metrics=None):
         """
         Initialize the serial reader class
             device        device name to connect to
             baudrate      the baud rate for the serial line
             store        the data store object to send the data to
             rounds        number of rounds to run / listen for input
+            timeout       read timeout of the serial line in seconds
+            blocking      block on the line instead of polling it every
+                          second (a round then lasts up to 'timeout')
+            metrics       the MetricsRegistry to count the frames and
+                          the waiting time in (None: the shared one,
+                          False: none)
         """
         threading.Thread.__init__(self)
         self.baudrate = baudrate
         self.store = store
         self.rounds = rounds
+        self.blocking = blocking
         self.do_run = True
         self.device_name = device
+        self.device = None
+        # the frames are assembled here
+        self.parser = FrameParser(codec=getattr(store, "codec", None), \
+                                    timer=getattr(store, "parse_time", None))
+        # an incomplete line left over from a timed out read
+        self.pending = b""
+        self.metrics = add_reader_metrics(self, metrics, device)
         try:
             if device:
                 self.device = serial.Serial(device, self.baudrate, timeout=timeout);
@@ -56,42 +74,95 @@ class SerialReader(threading.Thread):
         if not self.device:
             return
         try:
-            data = ""
-            while (self.do_run):
-                try:
-                    if (self.device.inWaiting() > 1):
-                        l = self.device.readline()[:-2]
-                        l = l.decode("UTF-8")
+            if self.blocking:
+                self.run_blocking()
+            else:
+                self.run_polling()
+        except serial.serialutil.SerialException:
+            print("Could not connect to the serial line at " + self.device_name)
+        finally:
+            release_reader_metrics(self, self.metrics, self.device_name)
 
-                        if (l == "["):
-                            # start recording
-                            data = "["
-                        elif (l == "]") and (len(data) > 4) and (data[0] == "["):
-                            # now parse the input
-                            data = data + "]"
-                            self.store.register_json(data)
-                            self.age()
-                        elif (l[0:3] == "  {"):
-                            # this is a data line
-                            data = data + " " + l
-                    else:
-                        # this is a slow interface - give it some time
-                        sleep(1)
-                        # then count down..
-                        self.age()
-                except (UnicodeDecodeError, ValueError):
-                    # only accepting unicode: throw away the whole bunch
-                    data = ""
-                    # and count down the exit condition
+    def run_polling(self):
+        """
+        Ask the line for new input and sleep a second if there is none
+        """
+        while (self.do_run):
+            try:
+                if self.metrics is not None:
+                    start = perf_counter()
+                if (self.device.inWaiting() > 1):
+                    l = self.device.readline()
+                    if self.metrics is not None:
+                        self.wait_time.observe(perf_counter() - start)
+                    self.handle_line(l)
+                else:
+                    # this is a slow interface - give it some time
+                    sleep(1)
+                    if self.metrics is not None:
+                        self.wait_time.observe(perf_counter() - start)
+                    # then count down..
                     self.age()
+            except ValueError:
+                self.drop_frame()
 
-        except serial.serialutil.SerialException:
-            print("Could not connect to the serial line at " + self.device_name)
+    def run_blocking(self):
+        """
+        Wait on the line until a full line arrives or the read times out
+        """
+        while (self.do_run):
+            try:
+                if self.metrics is not None:
+                    start = perf_counter()
+                l = self.pending + self.device.readline()
+                if self.metrics is not None:
+                    self.wait_time.observe(perf_counter() - start)
+                if l[-1:] != b"\n":
+                    # timed out (or halted) in the middle of nowhere, keep
+                    # what we have got so far for the next round
+                    self.pending = l
+                    self.age()
+                    continue
+                self.pending = b""
+                self.handle_line(l)
+            except ValueError:
+                self.drop_frame()
+
+    def drop_frame(self):
+        """
+        The frame is broken: throw away the whole bunch
+        """
+        self.parser.reset()
+        if self.metrics is not None:
+            self.frames_dropped.inc()
+        # and count down the exit condition
+        self.age()
+
+    def handle_line(self, l):
+        """
+        Add a line read from the serial line to the current frame and
+        pass the frame on to the store as soon as it is complete
+        """
+        p = self.parser
+        dropped = p.frames_dropped
+        records = p.feed_line(l)
+        if self.metrics is not None and p.frames_dropped != dropped:
+            self.frames_dropped.inc(p.frames_dropped - dropped)
+        if records is not None:
+            if self.metrics is not None:
+                self.frames_read.inc()
+            self.store.register_records(records)
+            self.age()
 
     def halt(self):
         """
         Tell the this object to stop working after the next round
         """
         self.do_run = False
-
-
+        # do not make a blocking reader wait for its timeout
+        if self.blocking and self.device and \
+                                    hasattr(self.device, "cancel_read"):
+            try:
+                self.device.cancel_read()
+            except serial.serialutil.SerialException:
+                pass
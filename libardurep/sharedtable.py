@@ -0,0 +1,485 @@
+"""
+MODULE:       sharedtable
+PURPOSE:      read the serial lines in several processes and collect the
+              sensor data in a table in shared memory.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+
+One process only gets one core for reading the lines and decoding the
+JSON, however many reader threads it runs. An IngestPool runs the
+readers in worker processes instead. They write the latest entry of
+every sensor to a SharedSensorTable, from where the process reporting
+takes what changed into its DataStore, without any pickling:
+
+    pool = sharedtable.IngestPool(['/dev/ttyACM0', '/dev/ttyACM1'], \
+                                                        9600, store, 2)
+    pool.start()
+    ...
+        pool.update()
+        reporter.log()
+    ...
+    pool.stop()
+
+Needs Python >= 3.8.
+"""
+
+import math
+import multiprocessing
+import struct
+import time
+
+from libardurep.codec import Codec, get_codec
+from libardurep.metrics import get_registry
+from libardurep.serialreader import SerialReader
+
+# partitions, slots per partition, maximal size of an entry
+HEADER = struct.Struct("<III4x")
+# per partition: sequence number of the last frame written, slots used,
+# entries dropped by the writer
+PARTITION = struct.Struct("<QQQ")
+# per slot: sequence number of the frame it was written with, time of
+# arrival, size and kind of the entry; followed by the entry
+SLOT = struct.Struct("<QdIB3x")
+
+# the kinds of entries: JSON, or the fields of the usual records (id,
+# value, unit, threshold) packed as (value, threshold, length of the id,
+# length of the unit), followed by the UTF-8 encoded id and unit, which
+# the reader decodes only once
+JSON = 0
+PACKED = 1
+# flags of a packed entry
+INT_VALUE = 2
+UNIT = 4
+THRESHOLD = 8
+INT_THRESHOLD = 16
+# flags -> the struct of the packed numbers (value, threshold)
+NUMBERS = {}
+for f in range(PACKED, 32, 2):
+    NUMBERS[f] = struct.Struct("<" + ("q" if f & INT_VALUE else "d") + \
+                                        ("q" if f & INT_THRESHOLD else "d"))
+# the lengths of the id and the unit (NO_UNIT without one)
+LENGTHS = struct.Struct("<HH")
+NO_UNIT = 0xffff
+INT64 = (-2 ** 63, 2 ** 63)
+# the default names of the id, value, unit and threshold fields
+KEYS = ("id", "value", "unit", "threshold")
+
+def pack_number(v):
+    """
+    Get whether a number can be packed and if it is an integer
+    """
+    t = type(v)
+    if t is float:
+        # JSON has no NaN or infinity
+        return math.isfinite(v), False
+    if t is int and INT64[0] <= v < INT64[1]:
+        return True, True
+    return False, False
+
+def encode_entry(v, keys, dumps):
+    """
+    Get the kind and the encoded form of a sensor record, the usual
+    ones are packed, any other is JSON encoded. 'keys' are the names of
+    the id, value, unit and threshold fields.
+    """
+    id_key, value_key, unit_key, threshold_key = keys
+    k = v[id_key]
+    unit = v.get(unit_key)
+    threshold = v.get(threshold_key, 0.0)
+    n = 2 + (unit_key in v) + (threshold_key in v)
+    ok, int_value = pack_number(v.get(value_key))
+    if ok and len(v) == n and type(k) is str and \
+                        (unit_key not in v or type(unit) is str):
+        ok, int_threshold = pack_number(threshold)
+        if ok:
+            f = PACKED
+            if int_value:
+                f |= INT_VALUE
+            u = b""
+            m = NO_UNIT
+            if unit is not None:
+                f |= UNIT
+                u = unit.encode("UTF-8")
+                m = len(u)
+            if threshold_key in v:
+                f |= THRESHOLD
+                if int_threshold:
+                    f |= INT_THRESHOLD
+            i = k.encode("UTF-8")
+            if len(i) <= 0xffff and len(u) < NO_UNIT:
+                return f, NUMBERS[f].pack(v[value_key], threshold) + \
+                                            LENGTHS.pack(len(i), m) + i + u
+    return JSON, dumps(v).encode("UTF-8")
+
+def decode_entries(entries, keys, loads_bytes, names=None):
+    """
+    Decode a list of (kind, entry), the JSON ones all at once. 'names'
+    keeps the ids and units decoded before, they hardly ever change.
+    """
+    j = [e for kind, e in entries if kind == JSON]
+    if j:
+        j = iter(loads_bytes(b"[" + b",".join(j) + b"]"))
+    if names is None:
+        names = {}
+    id_key, value_key, unit_key, threshold_key = keys
+    records = []
+    for kind, e in entries:
+        if kind == JSON:
+            records.append(next(j))
+            continue
+        value, threshold = NUMBERS[kind].unpack_from(e)
+        tail = e[16:]
+        v = names.get(tail)
+        if v is None:
+            n, m = LENGTHS.unpack_from(tail)
+            v = {id_key: tail[4:4 + n].decode("UTF-8")}
+            if m != NO_UNIT:
+                v[unit_key] = tail[4 + n:4 + n + m].decode("UTF-8")
+            names[tail] = v
+        v = v.copy()
+        v[value_key] = value
+        if kind & THRESHOLD:
+            v[threshold_key] = threshold
+        records.append(v)
+    return records
+
+class SharedSensorTable(object):
+    """
+    The latest entry of every sensor, packed or JSON encoded (see
+    encode_entry()), in shared memory.
+
+    The table is split into 'partitions' of 'slots' slots each. Every
+    partition has a single writer (see get_writer()), which takes the
+    next free slot for every new sensor, and a lock (shared with the
+    processes started from here) held while a frame is written or the
+    changes are copied out, so a reader never sees half a frame.
+
+    Create a table with 'name' unset, and attach to it in the other
+    processes with SharedSensorTable.attach(name, table.locks).
+    """
+
+    def __init__(self, partitions=1, slots=256, entry_size=256, \
+                                        name=None, memory=None, locks=None):
+        if memory is None:
+            from multiprocessing import shared_memory
+            size = HEADER.size + partitions * (PARTITION.size + \
+                                            slots * (SLOT.size + entry_size))
+            memory = shared_memory.SharedMemory(name, True, size)
+            HEADER.pack_into(memory.buf, 0, partitions, slots, entry_size)
+        if locks is None:
+            locks = [multiprocessing.Lock() for p in range(partitions)]
+        self.memory = memory
+        self.name = memory.name
+        self.locks = locks
+        self.partitions = partitions
+        self.slots = slots
+        self.entry_size = entry_size
+        self.slot_size = SLOT.size + entry_size
+        self.partition_size = PARTITION.size + slots * self.slot_size
+
+    @classmethod
+    def attach(cls, name, locks):
+        """
+        Open the table created by another process
+        """
+        from multiprocessing import shared_memory
+        try:
+            # do not have it removed when this process ends
+            memory = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            # Python < 3.13
+            memory = shared_memory.SharedMemory(name)
+        partitions, slots, entry_size = HEADER.unpack_from(memory.buf, 0)
+        return cls(partitions, slots, entry_size, memory=memory, locks=locks)
+
+    def get_offset(self, partition, slot=None):
+        """
+        Get the position of a partition, respectively of one of its slots
+        """
+        o = HEADER.size + partition * self.partition_size
+        if slot is None:
+            return o
+        return o + PARTITION.size + slot * self.slot_size
+
+    def get_writer(self, partition, keys=KEYS, codec=None):
+        """
+        Get the writer of a partition, there must be only one
+        """
+        return TableWriter(self, partition, keys, codec)
+
+    def read_partition(self, partition, since=0):
+        """
+        Get the sequence number of a partition and the (time of arrival,
+        kind, entry) of the slots written after sequence number 'since'
+        """
+        buf = self.memory.buf
+        o = self.get_offset(partition)
+        with self.locks[partition]:
+            sequence, used, dropped = PARTITION.unpack_from(buf, o)
+            if sequence == since:
+                return sequence, []
+            entries = []
+            s = o + PARTITION.size
+            for n in range(used):
+                written, received, size, kind = SLOT.unpack_from(buf, s)
+                if written > since:
+                    d = s + SLOT.size
+                    entries.append((received, kind, bytes(buf[d:d + size])))
+                s += self.slot_size
+        return sequence, entries
+
+    def get_dropped(self, partition=None):
+        """
+        Get the number of entries the writers of a partition (of all of
+        them for None) could not write
+        """
+        if partition is None:
+            return sum([self.get_dropped(p) for p in range(self.partitions)])
+        with self.locks[partition]:
+            return PARTITION.unpack_from(self.memory.buf, \
+                                            self.get_offset(partition))[2]
+
+    def close(self):
+        """
+        Let go of the table (in this process)
+        """
+        self.memory.close()
+
+    def unlink(self):
+        """
+        Remove the table, once all the processes closed it
+        """
+        self.memory.unlink()
+
+class TableWriter(object):
+    """
+    Writes the records of the frames to a partition of a table. It takes
+    the place of the data store for the readers.
+    """
+
+    def __init__(self, table, partition, keys=KEYS, codec=None):
+        self.table = table
+        self.partition = partition
+        self.keys = keys
+        # the frame parsers of the readers decode with this one, the
+        # entries are only read back by the table readers, so they are
+        # encoded by the fastest library too
+        if not isinstance(codec, Codec):
+            codec = get_codec(codec, False)
+        self.codec = codec
+        self.offset = table.get_offset(partition)
+        self.lock = table.locks[partition]
+        # sensor id -> slot, taken over from a writer before
+        self.sequence, entries = table.read_partition(partition)
+        self.slot_of = {}
+        for i, v in enumerate(decode_entries([(kind, e) for r, kind, e \
+                                in entries], keys, codec.loads_bytes)):
+            self.slot_of[v[keys[0]]] = i
+        # entries that did not fit in (too large or too many sensors),
+        # published in the partition's header
+        self.dropped = table.get_dropped(partition)
+
+    def register_records(self, j, now=None):
+        """
+        Write a frame of decoded sensor records
+        """
+        if now is None:
+            now = time.time()
+        t = self.table
+        buf = t.memory.buf
+        dumps = self.codec.dumps
+        keys = self.keys
+        id_key = keys[0]
+        # encode before taking the lock
+        entries = []
+        for v in j:
+            try:
+                k = v[id_key]
+                hash(k)
+                kind, e = encode_entry(v, keys, dumps)
+            except (AttributeError, KeyError, TypeError):
+                # no or no usable id, the store would not take it
+                self.dropped += 1
+                continue
+            if len(e) > t.entry_size:
+                self.dropped += 1
+                continue
+            entries.append((k, kind, e))
+        # the readers of a worker share the partition, too
+        with self.lock:
+            self.sequence += 1
+            for k, kind, e in entries:
+                slot = self.slot_of.get(k)
+                if slot is None:
+                    slot = len(self.slot_of)
+                    if slot >= t.slots:
+                        self.dropped += 1
+                        continue
+                    self.slot_of[k] = slot
+                s = t.get_offset(self.partition, slot)
+                SLOT.pack_into(buf, s, self.sequence, now, len(e), kind)
+                s += SLOT.size
+                buf[s:s + len(e)] = e
+            PARTITION.pack_into(buf, self.offset, self.sequence, \
+                                        len(self.slot_of), self.dropped)
+
+class TableReader(object):
+    """
+    Takes what changed in a table into a data store
+    """
+
+    def __init__(self, table, store):
+        self.table = table
+        self.store = store
+        # partition -> sequence number read last
+        self.sequences = [0] * table.partitions
+        # the ids and units decoded for the keys, see decode_entries()
+        self.keys = None
+        self.names = {}
+
+    def update(self):
+        """
+        Register the entries written since the last update in the store,
+        those that arrived at the same time at once, return their number
+        """
+        # time of arrival -> [(kind, entry), ..]
+        groups = {}
+        for p in range(self.table.partitions):
+            self.sequences[p], changes = self.table.read_partition(p, \
+                                                        self.sequences[p])
+            for t, kind, e in changes:
+                g = groups.get(t)
+                if g is None:
+                    g = groups[t] = []
+                g.append((kind, e))
+        s = self.store
+        keys = (s.id_key, s.value_key, s.unit_key, s.threshold_key)
+        if keys != self.keys or \
+                    len(self.names) > 2 * self.table.partitions * \
+                                                        self.table.slots:
+            # the store's keys or a lot of the units changed
+            self.keys = keys
+            self.names = {}
+        n = 0
+        for t in sorted(groups):
+            j = decode_entries(groups[t], keys, s.codec.loads_bytes, \
+                                                                self.names)
+            s.register_records(j, t)
+            n += len(j)
+        return n
+
+def run_worker(name, locks, partition, devices, baudrate, keys, codec, \
+                                                        timeout, stopping):
+    """
+    Read the devices of a worker process into its partition of the table
+    until 'stopping' is set
+    """
+    table = SharedSensorTable.attach(name, locks)
+    writer = table.get_writer(partition, keys, codec)
+    readers = [SerialReader(d, baudrate, writer, 0, timeout, True) \
+                                                            for d in devices]
+    for r in readers:
+        r.start()
+    try:
+        stopping.wait()
+    except KeyboardInterrupt:
+        pass
+    for r in readers:
+        r.halt()
+    for r in readers:
+        r.join()
+    table.close()
+
+class IngestPool(object):
+    """
+    Reads the serial lines in 'workers' processes into a shared table,
+    the devices are distributed evenly among them. The entries are
+    registered in the store by update().
+    """
+
+    def __init__(self, devices, baudrate, store, workers=2, slots=256, \
+                                entry_size=256, timeout=1, metrics=None):
+        """
+        Initialize the pool
+            devices       the names of the devices to read from
+            baudrate      the baud rate for the serial lines
+            store         the data store to update
+            workers       number of worker processes
+            slots         maximal number of sensors per worker
+            entry_size    maximal size of an encoded entry
+            timeout       read timeout of the serial lines in seconds,
+                          i.e. the time the workers take to stop
+            metrics       the MetricsRegistry to count the entries the
+                          workers dropped in (None: the shared one,
+                          False: none)
+        """
+        self.devices = devices
+        self.baudrate = baudrate
+        self.store = store
+        self.workers = min(workers, len(devices)) or 1
+        self.timeout = timeout
+        self.table = SharedSensorTable(self.workers, slots, entry_size)
+        self.reader = TableReader(self.table, store)
+        self.stopping = multiprocessing.Event()
+        self.processes = []
+        # the entries dropped, once the table is gone
+        self.final_dropped = None
+        self.metrics = get_registry(metrics)
+        if self.metrics is not None:
+            self.metrics.counter_attribute( \
+                    "ardu_ingest_entries_dropped_total", self, "dropped", \
+                    "Entries the workers could not write to the table", \
+                    store=store.name)
+
+    @property
+    def dropped(self):
+        """
+        The number of entries the workers could not write to the table
+        (too large, too many sensors or no usable id)
+        """
+        if self.final_dropped is not None:
+            return self.final_dropped
+        return self.table.get_dropped()
+
+    def start(self):
+        """
+        Start the worker processes
+        """
+        for w in range(self.workers):
+            p = multiprocessing.Process(target=run_worker, args=( \
+                        self.table.name, self.table.locks, w, \
+                        self.devices[w::self.workers], \
+                        self.baudrate, (self.store.id_key, \
+                        self.store.value_key, self.store.unit_key, \
+                        self.store.threshold_key), self.store.codec.name, \
+                        self.timeout, self.stopping))
+            p.daemon = True
+            p.start()
+            self.processes.append(p)
+
+    def update(self):
+        """
+        Register what the workers read since the last update in the
+        store, return the number of entries
+        """
+        return self.reader.update()
+
+    def stop(self):
+        """
+        Stop the worker processes, take over what they read last and
+        remove the table
+        """
+        self.stopping.set()
+        for p in self.processes:
+            p.join()
+        self.processes = []
+        self.update()
+        self.final_dropped = self.table.get_dropped()
+        if self.metrics is not None:
+            self.metrics.freeze("ardu_ingest_entries_dropped_total", self, \
+                                                    store=self.store.name)
+        self.table.close()
+        self.table.unlink()
@@ -0,0 +1,251 @@
+"""
+MODULE:       spool
+PURPOSE:      keep the reports that could not be sent on disk until the
+              remote host is reachable again.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+
+The spool is a directory of segment files, numbered in the order they
+were written. A segment is a sequence of payloads, each preceded by its
+length (unsigned 32 bit, little endian). The position of the next
+payload to replay is kept in the file 'cursor'.
+"""
+
+import os
+import re
+import struct
+import threading
+import time
+
+LENGTH = struct.Struct("<I")
+SEGMENT = re.compile(r"^\d{12}\.seg$")
+
+class Spool(object):
+    """
+    Store-and-forward queue of payloads. The payloads are appended to
+    the newest segment, a new segment is started when it gets bigger
+    than 'segment_size' and the oldest segments are dropped when all of
+    them take more than 'max_bytes'. Replaying is rate limited: at most
+    'replay_rate' requests per second (in bursts of up to
+    'replay_burst'), each with up to 'replay_batch' payloads.
+    """
+
+    def __init__(self, directory, segment_size=1048576, max_bytes=67108864, \
+                    replay_batch=50, replay_rate=1.0, replay_burst=5):
+        """
+        Initialize the spool
+            directory     where to keep the segments, created if needed
+            segment_size  start a new segment beyond this many bytes
+            max_bytes     drop the oldest segments beyond this many bytes
+            replay_batch  number of payloads to merge into one request
+            replay_rate   requests per second when replaying
+            replay_burst  requests to send at once at most
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.replay_batch = replay_batch
+        self.replay_rate = replay_rate
+        self.replay_burst = replay_burst
+        self.lock = threading.Lock()
+        # only one thread replays at a time
+        self.replaying = threading.Lock()
+        self.segments = sorted([f for f in os.listdir(directory) \
+                                                        if SEGMENT.match(f)])
+        self.sizes = {}
+        for s in self.segments:
+            self.sizes[s] = os.path.getsize(os.path.join(directory, s))
+        if self.segments:
+            # cut off a payload that was not written completely
+            items = self.read(self.segments[-1], 0)
+            size = items[-1][1] if items else 0
+            if size < self.sizes[self.segments[-1]]:
+                with open(self.path(self.segments[-1]), "r+b") as fh:
+                    fh.truncate(size)
+                self.sizes[self.segments[-1]] = size
+        # the segment and offset of the next payload to replay
+        self.cursor = self.load_cursor()
+        self.fh = None
+        self.tokens = float(replay_burst)
+        self.refilled = time.time()
+        # the counters
+        self.spooled = 0
+        self.replayed = 0
+        self.dropped = 0
+
+    def path(self, segment):
+        return os.path.join(self.directory, segment)
+
+    def load_cursor(self):
+        try:
+            with open(self.path("cursor")) as fh:
+                segment, offset = fh.read().split()
+            if segment in self.sizes:
+                return segment, int(offset)
+        except (IOError, OSError, ValueError):
+            pass
+        if self.segments:
+            return self.segments[0], 0
+        return None, 0
+
+    def save_cursor(self):
+        tmp = self.path("cursor.tmp")
+        with open(tmp, "w") as fh:
+            fh.write("%s %d\n" % self.cursor)
+        os.rename(tmp, self.path("cursor"))
+
+    def append(self, data):
+        """
+        Add a (unicode) payload
+        """
+        b = data.encode("UTF-8")
+        with self.lock:
+            if self.fh is None or self.sizes[self.segments[-1]] >= \
+                                                        self.segment_size:
+                self.start_segment()
+            segment = self.segments[-1]
+            self.fh.write(LENGTH.pack(len(b)) + b)
+            self.fh.flush()
+            os.fsync(self.fh.fileno())
+            self.sizes[segment] += LENGTH.size + len(b)
+            self.spooled += 1
+            self.evict()
+
+    def start_segment(self):
+        if self.fh is not None:
+            self.fh.close()
+        if self.segments and self.sizes[self.segments[-1]] < \
+                                                        self.segment_size:
+            # continue the last segment of a previous run
+            segment = self.segments[-1]
+        else:
+            n = int(self.segments[-1][0:12]) + 1 if self.segments else 0
+            segment = "%012d.seg" % n
+            self.segments.append(segment)
+            self.sizes[segment] = 0
+            if self.cursor[0] is None:
+                self.cursor = (segment, 0)
+        self.fh = open(self.path(segment), "ab")
+
+    def evict(self):
+        """
+        Drop the oldest segments while the spool is too big
+        """
+        while len(self.segments) > 1 and \
+                                    sum(self.sizes.values()) > self.max_bytes:
+            segment = self.segments[0]
+            offset = self.cursor[1] if self.cursor[0] == segment else 0
+            self.dropped += len(self.read(segment, offset))
+            self.remove(segment)
+
+    def remove(self, segment):
+        """
+        Delete a segment, the cursor moves on to the next one
+        """
+        self.segments.remove(segment)
+        del self.sizes[segment]
+        os.remove(self.path(segment))
+        if self.cursor[0] == segment:
+            if self.segments:
+                self.cursor = (self.segments[0], 0)
+            else:
+                self.cursor = (None, 0)
+            self.save_cursor()
+
+    def read(self, segment, offset, n=None):
+        """
+        Get up to n (payload, offset after it) from a segment, stops at
+        an incomplete payload
+        """
+        items = []
+        with open(self.path(segment), "rb") as fh:
+            fh.seek(offset)
+            while n is None or len(items) < n:
+                head = fh.read(LENGTH.size)
+                if len(head) < LENGTH.size:
+                    break
+                b = fh.read(LENGTH.unpack(head)[0])
+                if len(b) < LENGTH.unpack(head)[0]:
+                    break
+                offset += LENGTH.size + len(b)
+                items.append((b.decode("UTF-8"), offset))
+        return items
+
+    def __len__(self):
+        """
+        Get the number of bytes waiting to be replayed
+        """
+        with self.lock:
+            return sum(self.sizes.values()) - self.cursor[1]
+
+    def replay(self, send, join=None):
+        """
+        Send what is waiting as far as the rate allows. 'send' gets the
+        (joined) payloads and returns whether they were accepted, 'join'
+        merges a list of payloads into one (without it, the payloads are
+        sent one by one). Returns the number of payloads replayed.
+        """
+        if not self.replaying.acquire(False):
+            return 0
+        try:
+            now = time.time()
+            self.tokens = min(self.replay_burst, self.tokens + \
+                                    (now - self.refilled) * self.replay_rate)
+            self.refilled = now
+            n = 0
+            while self.tokens >= 1:
+                with self.lock:
+                    segment, offset = self.cursor
+                    if segment is None:
+                        break
+                    items = self.read(segment, offset, \
+                                self.replay_batch if join is not None else 1)
+                    if not items:
+                        if segment == self.segments[-1]:
+                            # the writer is not done with it yet
+                            if self.sizes[segment] < self.segment_size:
+                                break
+                            if self.fh is not None:
+                                self.fh.close()
+                                self.fh = None
+                        self.remove(segment)
+                        continue
+                if join is not None:
+                    ok = send(join([p for p, o in items]))
+                else:
+                    ok = send(items[0][0])
+                self.tokens -= 1
+                if not ok:
+                    break
+                with self.lock:
+                    # the segment might have been dropped meanwhile
+                    if self.cursor == (segment, offset):
+                        self.cursor = (segment, items[-1][1])
+                        self.save_cursor()
+                        self.replayed += len(items)
+                        n += len(items)
+            return n
+        finally:
+            self.replaying.release()
+
+    def get_counters(self):
+        """
+        Get the number of payloads spooled, replayed and dropped
+        """
+        with self.lock:
+            return {
+                "spooled": self.spooled,
+                "replayed": self.replayed,
+                "dropped": self.dropped
+            }
+
+    def close(self):
+        with self.lock:
+            if self.fh is not None:
+                self.fh.close()
+                self.fh = None
@@ -0,0 +1,192 @@
+"""
+MODULE:       sqlitesink
+PURPOSE:      keep the sensor values in a local SQLite database.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+"""
+
+import json
+import sqlite3
+
+from libardurep.record import MISSING
+
+# what goes wrong with the database, for the callers of the sink
+Error = sqlite3.Error
+
+# the values of SQLite's synchronous setting
+SYNCHRONOUS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+# the values SQLite stores as they are
+SCALARS = (int, float, str, type(None))
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS samples (" \
+        "sensor TEXT NOT NULL, " \
+        "time REAL NOT NULL, " \
+        "value, " \
+        "unit TEXT, " \
+        "entry TEXT, " \
+        "PRIMARY KEY (sensor, time))",
+    "CREATE INDEX IF NOT EXISTS samples_time ON samples (time)"
+)
+
+class SQLiteSink(object):
+    """
+    A table of samples with one row per sensor and time of arrival
+    (epoch seconds). The rows are inserted in batches, every batch in
+    one transaction, and the database is in WAL mode so readers do not
+    block the writer. The samples of a snapshot are inserted right away
+    (see append_snapshot()).
+    """
+
+    def __init__(self, path, batch_size=100, synchronous="NORMAL", \
+                                                        max_pending=10000):
+        """
+        Initialize the sink
+            path          the database file
+            batch_size    number of rows to collect before inserting them
+            synchronous   SQLite's synchronous setting, "NORMAL" is safe
+                          in WAL mode, "FULL" survives a power loss
+            max_pending   number of rows kept queued while inserting them
+                          fails, the oldest are dropped beyond it
+        """
+        synchronous = str(synchronous).upper()
+        if synchronous not in SYNCHRONOUS:
+            raise ValueError("Unknown synchronous setting: " + synchronous)
+        self.path = path
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.pending = []
+        # rows dropped from the queue
+        self.dropped = 0
+        # sensor id -> time of the last sample queued (and kept queued
+        # until it is stored)
+        self.last = {}
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=" + synchronous)
+        with self.db:
+            for s in SCHEMA:
+                self.db.execute(s)
+        for sensor, t in self.db.execute( \
+                            "SELECT sensor, MAX(time) FROM samples " \
+                                                        "GROUP BY sensor"):
+            self.last[sensor] = t
+
+    def append(self, sensor_id, t, value, unit=None, entry=None):
+        """
+        Queue a sample, t in epoch seconds. A value (or unit) SQLite can
+        not store as it is, e.g. a list, is stored as NULL, the entry
+        (by default the value in JSON) still has it.
+        """
+        if self.last.get(sensor_id, -1) >= t:
+            # already stored
+            return False
+        if not isinstance(value, SCALARS):
+            if entry is None:
+                entry = json.dumps(value)
+            value = None
+        if not isinstance(unit, SCALARS):
+            unit = None
+        self.last[sensor_id] = t
+        self.pending.append((sensor_id, t, value, unit, entry))
+        if len(self.pending) > self.max_pending:
+            n = len(self.pending) - self.max_pending
+            del self.pending[:n]
+            self.dropped += n
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return True
+
+    def append_snapshot(self, store, flush=True):
+        """
+        Queue the current values of a data store, the samples already
+        stored are skipped, and insert them unless 'flush' is False
+        """
+        n = 0
+        data = store.get_snapshot()[1]
+        for k in data:
+            r = data[k]
+            if r.received is None or self.last.get(k, -1) >= r.received:
+                continue
+            unit = None if r.unit is MISSING else r.unit
+            if self.append(k, r.received, r.value, unit, \
+                                store.codec.dumps(store.translate(r))):
+                n += 1
+        if flush:
+            self.flush()
+        return n
+
+    def flush(self):
+        """
+        Insert the queued samples in one transaction, they stay queued
+        if that fails
+        """
+        if not self.pending:
+            return
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO samples " \
+                    "(sensor, time, value, unit, entry) VALUES " \
+                                            "(?, ?, ?, ?, ?)", self.pending)
+        self.pending = []
+
+    def latest(self, sensor_id):
+        """
+        Get the last (time, value) of a sensor or None
+        """
+        return self.db.execute("SELECT time, value FROM samples " \
+                                "WHERE sensor = ? ORDER BY time DESC " \
+                                            "LIMIT 1", (sensor_id,)).fetchone()
+
+    def get_range(self, sensor_id, start=None, end=None):
+        """
+        Get the (time, value) samples of a sensor from start to end (both
+        inclusive), oldest first
+        """
+        return self.db.execute("SELECT time, value FROM samples " \
+                    "WHERE sensor = ? AND time BETWEEN ? AND ? " \
+                    "ORDER BY time", \
+                        (sensor_id, self.bound(start, -1), \
+                                            self.bound(end, 1))).fetchall()
+
+    def get_aggregates(self, sensor_id, interval, start=None, end=None):
+        """
+        Downsample the numeric values of a sensor to one
+        (start of the interval, count, min, max, avg) per 'interval'
+        seconds
+        """
+        return self.db.execute("SELECT " \
+                    "CAST(time / ? AS INTEGER) * ? AS slot, " \
+                    "COUNT(value), MIN(value), MAX(value), AVG(value) " \
+                    "FROM samples WHERE sensor = ? AND time BETWEEN ? AND ? " \
+                    "AND typeof(value) IN ('integer', 'real') " \
+                    "GROUP BY slot ORDER BY slot", \
+                        (interval, interval, sensor_id, \
+                            self.bound(start, -1), \
+                                            self.bound(end, 1))).fetchall()
+
+    def sensors(self):
+        """
+        Get the ids of the stored sensors
+        """
+        return [r[0] for r in self.db.execute( \
+                                        "SELECT DISTINCT sensor FROM samples")]
+
+    def bound(self, t, sign):
+        if t is None:
+            return sign * float("inf")
+        return t
+
+    def close(self):
+        """
+        Insert what is left and close the database
+        """
+        if self.db is not None:
+            try:
+                self.flush()
+            finally:
+                self.db.close()
+                self.db = None
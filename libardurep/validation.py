@@ -0,0 +1,237 @@
+"""
+MODULE:       validation
+PURPOSE:      check the sensor entries received against the input schema.
+AUTHOR(S):    michael lustenberger inofix.ch
+COPYRIGHT:    (C) 2017 by Michael Lustenberger and INOFIX GmbH
+
+              This program is free software under the GNU General Public
+              License (v3).
+
+Validating every entry with jsonschema would cost more than the rest of
+the ingest together. The input schemas only describe flat objects
+though, so the parts that matter for the data store, i.e. the types of
+the properties and the required ones, are compiled into a function
+checking just that.
+"""
+
+from collections import deque
+import threading
+
+from libardurep.record import MISSING
+
+# JSON schema type -> the Python types of decoded JSON values
+TYPES = {
+    "string": (str,),
+    "number": (int, float),
+    "integer": (int,),
+    "boolean": (bool,),
+    "object": (dict,),
+    "array": (list,),
+    "null": (type(None),)
+}
+
+# any decoded JSON value
+ANY = frozenset([t for n in TYPES for t in TYPES[n]])
+# a field that was not sent
+OPTIONAL = frozenset([object])
+# the types of the values usable as sensor ids
+HASHABLE = frozenset([str, int, float, bool, type(None)])
+# the order of the type tests in the compiled checks, likely ones first
+ORDER = (str, float, int, bool, dict, list, type(None))
+
+# the items of the default input schema (schemas/default-schema.json)
+DEFAULT_ITEMS = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "string"},
+        "value": {"type": "number"},
+        "unit": {"type": "string"},
+        "threshold": {"type": "number"}
+    },
+    "required": ["id", "value"]
+}
+
+def get_types(prop):
+    """
+    Get the set of Python types allowed by a property of the schema,
+    None if it may be anything
+    """
+    t = prop.get("type")
+    if t is None:
+        return None
+    if not isinstance(t, list):
+        t = [t]
+    types = set()
+    for n in t:
+        if n not in TYPES:
+            # not a type we know, do not guess
+            return None
+        types.update(TYPES[n])
+    return frozenset(types)
+
+def get_items(schema):
+    """
+    Get the 'items' of a decoded input schema (None: the default one)
+    """
+    if schema is None:
+        return DEFAULT_ITEMS
+    return schema["items"]
+
+def compile_validator(items, required=(), keys=None):
+    """
+    Compile the 'items' of an input schema into a function returning
+    None for a valid entry and the reason otherwise. The keys in
+    'required' are required in addition to the ones of the schema. With
+    'keys' given, only the types of these properties are checked.
+    """
+    properties = items.get("properties", {})
+    required = list(items.get("required", [])) + \
+                [k for k in required if k not in items.get("required", [])]
+    if keys is None:
+        keys = properties.keys()
+    # (key, types or None), type checks on the optional keys only
+    required_checks = tuple([(k, get_types(properties.get(k, {})) \
+                                if k in keys else None) for k in required])
+    optional_checks = tuple([(k, get_types(properties[k])) \
+                        for k in keys if k in properties and \
+                        k not in required and \
+                        get_types(properties[k]) is not None])
+
+    def check(v):
+        if type(v) is not dict:
+            return "not an object"
+        for k, t in required_checks:
+            if k not in v:
+                return "missing " + k
+            if t is not None and type(v[k]) not in t:
+                return "wrong type of " + k
+        for k, t in optional_checks:
+            if k in v and type(v[k]) not in t:
+                return "wrong type of " + k
+        return None
+
+    return check
+
+def get_checks(items, id_key, value_key, unit_key, threshold_key, \
+                                                other_keys, sensor_time_key):
+    """
+    Get the rules for an extract function checking the entries while it
+    maps them to records (see schemaregistry.compile_mapping()): the
+    types allowed per field and the keys required besides the id and the
+    value. Only the properties kept by the store are type checked, like
+    with compile_validator(items, (id_key, value_key), keys).
+    """
+    properties = items.get("properties", {})
+    required = items.get("required", [])
+
+    def types(k):
+        t = get_types(properties[k]) if k in properties else None
+        if t is None:
+            t = ANY
+        if k not in required:
+            # the fields not sent are MISSING, i.e. an object()
+            t = t | OPTIONAL
+        return t
+
+    # the ids are keys of a dict
+    return (types(id_key) & HASHABLE, types(value_key), types(unit_key), \
+            types(threshold_key), tuple([types(k) for k in other_keys]), \
+            types(sensor_time_key), tuple([k for k in required \
+            if k not in (id_key, value_key)]))
+
+def compile_test(name, types):
+    """
+    Get the source of a test whether the variable 'name' has one of the
+    types, None if anything goes
+    """
+    if types >= ANY:
+        return None
+    tests = []
+    if object in types:
+        tests.append(name + " is M")
+    for t in ORDER:
+        if t in types:
+            tests.append("type(" + name + ") is " + t.__name__)
+    if not tests:
+        return "False"
+    return "(" + " or ".join(tests) + ")"
+
+def compile_checked_extract(R, id_key, value_key, unit_key, threshold_key, \
+                                    other_keys, sensor_time_key, checks):
+    """
+    Compile the extract function of schemaregistry.compile_mapping()
+    checking the entries (see get_checks()). The source is generated,
+    like collections.namedtuple() does, so the keys are constants and
+    every check is a few identity tests inlined, without any loop.
+    """
+    id_types, value_types, unit_types, threshold_types, other_types, \
+                                    sensor_time_types, required = checks
+    lines = ["def extract(v, timestamp, now=None):"]
+    for k in required:
+        lines.append("    if %r not in v:" % k)
+        lines.append("        return None")
+    lines.append("    i = v[%r]" % id_key)
+    lines.append("    x = v[%r]" % value_key)
+    fields = [("i", id_types), ("x", value_types)]
+    others = ["o%d" % n for n in range(len(other_keys))]
+    for name, k, t in [("u", unit_key, unit_types), \
+                        ("h", threshold_key, threshold_types), \
+                        ("s", sensor_time_key, sensor_time_types)] + \
+                        list(zip(others, other_keys, other_types)):
+        lines.append("    %s = v[%r] if %r in v else M" % (name, k, k))
+        fields.append((name, t))
+    tests = [compile_test(name, t) for name, t in fields]
+    tests = [t for t in tests if t is not None]
+    if tests:
+        lines.append("    if not (" + "\n            and ".join(tests) + "):")
+        lines.append("        return None")
+    if others:
+        lines.append("    o = (" + ", ".join(others) + ",)")
+        lines.append("    if " + " and ".join([n + " is M" \
+                                                for n in others]) + ":")
+        lines.append("        o = None")
+    else:
+        lines.append("    o = None")
+    lines.append("    return R(i, x, u, h, o, s, timestamp, now)")
+    namespace = {"R": R, "M": MISSING, "NoneType": type(None)}
+    exec("\n".join(lines) + "\n", namespace)
+    return namespace["extract"]
+
+class Quarantine(object):
+    """
+    Keeps the latest entries rejected per sensor, with the reason and
+    the time (epoch seconds), for inspection
+    """
+
+    def __init__(self, size=100):
+        """
+        Initialize the quarantine
+            size          the number of entries to keep per sensor
+        """
+        self.size = size
+        self.lock = threading.Lock()
+        # sensor id (None if unknown) -> deque of (time, reason, entry)
+        self.entries = {}
+
+    def add(self, sensor_id, entry, reason, now):
+        with self.lock:
+            q = self.entries.get(sensor_id)
+            if q is None:
+                q = deque(maxlen=self.size)
+                self.entries[sensor_id] = q
+            q.append((now, reason, entry))
+
+    def get(self, sensor_id):
+        """
+        Get the (time, reason, entry) of a sensor, oldest first
+        """
+        with self.lock:
+            return list(self.entries.get(sensor_id, ()))
+
+    def sensors(self):
+        with self.lock:
+            return list(self.entries.keys())
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
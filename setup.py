@@ -44,20 +44,25 @@ setup(
 
         'License :: OSI Approved :: GNU General Public License (GPL)',
 
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
         'Programming Language :: Python :: 3.3',
         'Programming Language :: Python :: 3.4',
         'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
 
     keywords='arduino sensor serial json',
 
     packages=find_packages(exclude=['contrib', 'docs', 'tests']),
 
+    python_requires='>=3.3',
+
     install_requires=[
-        'httplib2',
         'jsonschema',
         'pyserial',
         'requests',
@@ -70,7 +75,9 @@ setup(
     # $ pip install -e .[dev,test]
     extras_require={
 #        'dev': ['check-manifest'],
-        'test': ['unittest2'],
+        'archive': ['numpy'],
+        'alerting': ['numpy'],
+        'fast': ['orjson'],
     },
 
     package_data={
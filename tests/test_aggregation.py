@@ -0,0 +1,124 @@
+import unittest
+import json
+import random
+import tempfile
+import time
+
+from libardurep import aggregation, datastore, datareporter
+
+class TestStats(unittest.TestCase):
+    def test_stats(self):
+        r = random.Random(1)
+        values = [r.gauss(20, 3) for i in range(1000)]
+        a = aggregation.Stats()
+        b = aggregation.Stats()
+        for v in values[0:300]:
+            a.add(v)
+        for v in values[300:]:
+            b.add(v)
+        a.merge(b)
+        self.assertEqual(1000, a.count)
+        mean = sum(values) / len(values)
+        variance = sum((v - mean) ** 2 for v in values) / (len(values) - 1)
+        self.assertAlmostEqual(mean, a.mean)
+        self.assertAlmostEqual(variance, a.variance())
+        self.assertEqual(min(values), a.min)
+        self.assertEqual(max(values), a.max)
+        a.merge(aggregation.Stats())
+        self.assertEqual(1000, a.count)
+
+class TestQuantileSketch(unittest.TestCase):
+    def test_quantile(self):
+        r = random.Random(1)
+        values = [r.uniform(-50, 150) for i in range(10000)] + [0] * 100
+        s = aggregation.QuantileSketch(0.01)
+        for v in values:
+            s.add(v)
+        values.sort()
+        for q in (0.01, 0.1, 0.5, 0.9, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertLess(abs(s.quantile(q) - exact), abs(exact) * 0.01 \
+                                                                    + 0.05)
+        self.assertIsNone(aggregation.QuantileSketch().quantile(0.5))
+
+    def test_bounded(self):
+        s = aggregation.QuantileSketch(0.01, max_bins=32)
+        for i in range(1, 100000):
+            s.add(i * 0.01)
+        self.assertLessEqual(len(s.positive), 32)
+        # the high quantiles keep their accuracy
+        self.assertAlmostEqual(990, s.quantile(0.99), delta=10)
+
+class TestWindowAggregator(unittest.TestCase):
+    def test_tumbling(self):
+        a = aggregation.WindowAggregator(60)
+        for t in range(0, 180):
+            a.add("a", 1000 + t, t)
+        a.add("b", 1000, "text")
+        # the last complete window is [1080, 1140)
+        e = a.get_entries(1190)
+        self.assertEqual(1, len(e))
+        self.assertEqual((60, 80, 139), (e[0]["count"], e[0]["min"], \
+                                                            e[0]["max"]))
+        self.assertEqual(109.5, e[0]["mean"])
+        self.assertAlmostEqual(110, e[0]["p50"], delta=2)
+        self.assertEqual("1970-01-01T00:19:00", e[0]["end"])
+        # older panes are dropped
+        self.assertEqual(2, len(a.panes["a"]))
+
+    def test_sliding(self):
+        a = aggregation.WindowAggregator(60, 10)
+        for t in range(0, 200):
+            a.add("a", 1000 + t, t)
+        stats, sketch, unit = a.get_aggregate("a", 1199)
+        # [1140, 1200)
+        self.assertEqual((60, 140, 199), (stats.count, stats.min, stats.max))
+        self.assertEqual(6, len(a.panes["a"]))
+        with self.assertRaises(ValueError):
+            aggregation.WindowAggregator(3600, 1)
+
+    def test_report(self):
+        store = datastore.DataStore()
+        a = aggregation.WindowAggregator(3600, 60, store=store)
+        for v in (1, 2, 3):
+            store.register_records([{"id": "a", "value": v, "unit": "C"}])
+        tf = tempfile.NamedTemporaryFile()
+        reporter = datareporter.DataReporter(a, "file://" + tf.name)
+        reporter.log()
+        with open(tf.name) as fh:
+            self.assertIn('"count": 3', fh.read())
+        j = json.loads(a.get_json())
+        self.assertEqual(1, len(j))
+        self.assertEqual(("a", "C", 3, 2.0), (j[0]["id"], j[0]["unit"], \
+                                                j[0]["count"], j[0]["mean"]))
+        self.assertIn("a mean 2C", a.get_text())
+        self.assertEqual(j, [json.loads(l) for l in \
+                                            a.get_json_lines().splitlines()])
+        a.detach()
+        store.register_records([{"id": "a", "value": 5}])
+        self.assertEqual(3, a.get_aggregate("a")[0].count)
+
+    def test_degenerate(self):
+        def strict(c):
+            raise ValueError(c)
+        # sliding, the values just added are in the window
+        a = aggregation.WindowAggregator(60, 10)
+        self.assertEqual("[]", a.get_json())
+        t = time.time()
+        a.add("a", t, 1)
+        self.assertFalse(a.add("b", t, float("inf")))
+        a.add("c", t, 1e308)
+        a.add("c", t, -1e308)
+        j = dict([(e["id"], e) for e in json.loads(a.get_json(), \
+                                                    parse_constant=strict)])
+        self.assertEqual((1, 1.0, 1.0, 0.0), (j["a"]["count"], \
+                    j["a"]["min"], j["a"]["mean"], j["a"]["variance"]))
+        self.assertAlmostEqual(1.0, j["a"]["p50"], delta=0.02)
+        self.assertNotIn("b", j)
+        # the variance overflows
+        self.assertIsNone(j["c"]["variance"])
+        self.assertEqual(j, dict([(e["id"], e) for e in json.loads( \
+                                a.get_json(True), parse_constant=strict)]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+import json
+
+from libardurep import alerting, datastore
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class TestAlertEvent(unittest.TestCase):
+    def test_to_json(self):
+        def strict(c):
+            raise ValueError(c)
+        e = alerting.AlertEvent("a", "rate", True, float("nan"), \
+                                                    float("inf"), 1000.0)
+        j = json.loads(e.to_json(), parse_constant=strict)
+        self.assertEqual(("a", None, None, 1000.0), (j["id"], j["value"], \
+                                                    j["limit"], j["time"]))
+        e = alerting.AlertEvent("a", "threshold", False, 21.5, 30, 1000.0)
+        self.assertEqual((21.5, 30), (e.to_dict()["value"], \
+                                                    e.to_dict()["limit"]))
+
+@unittest.skipIf(numpy is None, "numpy is not available")
+class TestAlertEngine(unittest.TestCase):
+    def setUp(self):
+        self.store = datastore.DataStore()
+        self.events = []
+
+    def register(self, t, **values):
+        records = []
+        for k in values:
+            v = values[k]
+            if isinstance(v, tuple):
+                records.append({"id": k, "value": v[0], "threshold": v[1]})
+            else:
+                records.append({"id": k, "value": v})
+        # as if they arrived at time t
+        self.store.register_records(records, t)
+
+    def states(self):
+        return [(e.sensor_id, e.kind, e.raised) for e in self.events]
+
+    def test_threshold(self):
+        engine = alerting.AlertEngine(self.store, self.events.append, \
+                            hysteresis={"a": 2}, thresholds={"c": 10})
+        self.register(0, a=(20, 25), b=(5, 3), c=11, d="x")
+        engine.evaluate()
+        self.assertEqual([("b", "threshold", True), \
+                                ("c", "threshold", True)], self.states())
+        self.assertEqual(["b", "c"], \
+                                sorted(engine.get_alerts()["threshold"]))
+        self.events[:] = []
+        self.register(1, a=(26, 25), b=(2, 3))
+        engine.evaluate()
+        self.assertEqual([("a", "threshold", True), \
+                                ("b", "threshold", False)], self.states())
+        e = self.events[0]
+        self.assertEqual((26, 25, 1), (e.value, e.limit, e.time))
+        self.events[:] = []
+        # within the hysteresis
+        self.register(2, a=(24, 25))
+        engine.evaluate()
+        self.assertEqual([], self.states())
+        self.register(3, a=(22.5, 25))
+        engine.evaluate()
+        self.assertEqual([("a", "threshold", False)], self.states())
+
+    def test_rate(self):
+        engine = alerting.AlertEngine(self.store, self.events.append, \
+                                max_rate={"a": 1.0}, default_max_rate=10)
+        self.register(0, a=0, b=0)
+        engine.evaluate()
+        self.register(2, a=3, b=15)
+        engine.evaluate()
+        self.assertEqual([("a", "rate", True)], self.states())
+        self.assertEqual(1.5, self.events[0].value)
+        self.register(4, a=4)
+        engine.evaluate()
+        self.assertEqual([("a", "rate", True), ("a", "rate", False)], \
+                                                            self.states())
+
+    def test_loop(self):
+        # the same events, in the same order, with or without the arrays
+        events = ([], [])
+        engines = [alerting.AlertEngine(self.store, events[0].append, \
+                hysteresis={"a": 2}, default_max_rate=3, max_loop=0), \
+            alerting.AlertEngine(self.store, events[1].append, \
+                hysteresis={"a": 2}, default_max_rate=3, max_loop=100)]
+        for t, values in ((0, dict(a=(20, 25), b=(5, 3), c="x")), \
+                            (1, dict(a=(26, 25), b=(2, 3), c=1)), \
+                            (1, dict(a=(24, 25), c=2)), \
+                            (3, dict(a=(22.5, 25), b=(2, None)))):
+            self.register(t, **values)
+            for e in engines:
+                e.evaluate()
+        self.assertEqual([e.to_dict() for e in events[0]], \
+                                        [e.to_dict() for e in events[1]])
+        self.assertEqual(7, len(events[0]))
+        self.assertEqual(engines[0].get_alerts(), engines[1].get_alerts())
+
+    def test_callback_error(self):
+        def fail(e):
+            raise RuntimeError("broken")
+        engine = alerting.AlertEngine(self.store, fail)
+        engine.add_callback(self.events.append)
+        engine.attach()
+        # the error does not get to the one registering the values
+        self.store.register_json('[ {"id":"a","value":5,"threshold":3} ]')
+        self.assertEqual([("a", "threshold", True)], self.states())
+
+    def test_copied(self):
+        thresholds = {"a": 10}
+        engine = alerting.AlertEngine(self.store, self.events.append, \
+                                                    thresholds=thresholds)
+        thresholds["a"] = 0
+        self.register(0, a=5)
+        engine.evaluate()
+        self.assertEqual([], self.states())
+        self.assertEqual({}, alerting.AlertEngine(self.store).thresholds)
+
+    def test_attach(self):
+        engine = alerting.AlertEngine(self.store, self.events.append)
+        engine.attach()
+        self.store.register_json('[ {"id":"a","value":5,"threshold":3} ]')
+        self.assertEqual([("a", "threshold", True)], self.states())
+        self.assertEqual("a", self.events[0].to_dict()["id"])
+        engine.detach()
+        self.store.register_json('[ {"id":"a","value":1,"threshold":3} ]')
+        self.assertEqual(1, len(self.events))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from libardurep import archive, datareporter, datastore
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+@unittest.skipIf(numpy is None, "numpy is not available")
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "archive")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_write_read(self):
+        w = archive.ArchiveWriter(self.path, chunk_size=3)
+        for i in range(7):
+            self.assertTrue(w.append("a", 1000.0 + i, i * 0.5))
+            w.append(u"b\u00b0", 1000.0 + i, -i)
+        # neither old samples nor text are archived
+        self.assertFalse(w.append("a", 1000.0, 3))
+        self.assertFalse(w.append("c", 2000.0, "high"))
+        w.close()
+        r = archive.ArchiveReader(self.path)
+        self.assertEqual(set(["a", u"b\u00b0"]), set(r.sensors()))
+        t, v = r.get("a")
+        self.assertEqual([i * 0.5 for i in range(7)], list(v))
+        self.assertEqual([1000000 + i * 1000 for i in range(7)], list(t))
+        self.assertEqual(3, len(r.chunks("a")))
+        # a single block is not copied
+        t, v = r.chunks(u"b\u00b0")[0]
+        self.assertFalse(v.flags.owndata)
+        self.assertEqual(-2, v[2])
+        del t, v
+        r.close()
+
+    def test_continue(self):
+        w = archive.ArchiveWriter(self.path)
+        w.append("a", 1.0, 1)
+        w.close()
+        # an interrupted write at the end is dropped
+        with open(self.path, "ab") as fh:
+            fh.write(b"COLS\x00")
+        w = archive.ArchiveWriter(self.path)
+        self.assertFalse(w.append("a", 1.0, 1))
+        w.append("b", 2.0, 2)
+        w.append("a", 2.0, 3)
+        w.close()
+        r = archive.ArchiveReader(self.path)
+        self.assertEqual([1.0, 3.0], list(r.get("a")[1]))
+        self.assertEqual([2.0], list(r.get("b")[1]))
+        # the open block was filled up
+        self.assertEqual(1, len(r.chunks("a")))
+        r.close()
+
+    def test_snapshot(self):
+        store = datastore.DataStore()
+        store.register_json('[ {"id":"a","value":1}, {"id":"b","value":2} ]')
+        w = archive.ArchiveWriter(self.path)
+        self.assertEqual(2, w.append_snapshot(store))
+        # written right away
+        r = archive.ArchiveReader(self.path)
+        self.assertEqual([2.0], list(r.get("b")[1]))
+        r.close()
+        self.assertEqual(0, w.append_snapshot(store))
+        store.register_records([{"id": "a", "value": 3}], \
+                                            store.data["a"].received + 1)
+        self.assertEqual(1, w.append_snapshot(store, flush=False))
+        self.assertEqual({0: 1}, dict([(i, len(c[0])) \
+                                            for i, c in w.pending.items()]))
+        w.close()
+        r = archive.ArchiveReader(self.path)
+        self.assertEqual([1.0, 3.0], list(r.get("a")[1]))
+        # the reports share a block
+        self.assertEqual(1, len(r.chunks("a")))
+        r.close()
+
+    def test_many_snapshots(self):
+        store = datastore.DataStore()
+        w = archive.ArchiveWriter(self.path, chunk_size=4)
+        for i in range(10):
+            store.register_records([{"id": "a", "value": i}], 1000.0 + i)
+            w.append_snapshot(store)
+            # the samples in use are readable in between
+            r = archive.ArchiveReader(self.path)
+            self.assertEqual(list(range(i + 1)), list(r.get("a")[1]))
+            r.close()
+        w.close()
+        r = archive.ArchiveReader(self.path)
+        self.assertEqual([1000000 + i * 1000 for i in range(10)], \
+                                                    list(r.get("a")[0]))
+        self.assertEqual([4, 4, 2], [len(v) for t, v in r.chunks("a")])
+        r.close()
+        # a block for every 'chunk_size' samples, not for every report
+        self.assertEqual(16 + 24 + 3 * (16 + 16 * 4), \
+                                                os.path.getsize(self.path))
+
+    def test_growing_blocks(self):
+        w = archive.ArchiveWriter(self.path, chunk_size=8, first_block=2)
+        for i in range(15):
+            w.append("a", 1000.0 + i, i)
+            w.flush()
+        w.append("b", 1000.0, 1)
+        w.close()
+        r = archive.ArchiveReader(self.path)
+        self.assertEqual(list(range(15)), list(r.get("a")[1]))
+        self.assertEqual([2, 4, 8, 1], [len(v) for t, v in r.chunks("a")])
+        r.close()
+        # a sensor logged once only takes up the first block
+        self.assertEqual(16 + 2 * 24 + 5 * 16 + 16 * (2 + 4 + 8 + 8 + 2), \
+                                                os.path.getsize(self.path))
+
+    def test_log_archive(self):
+        store = datastore.DataStore()
+        reporter = datareporter.DataReporter(store, "archive://" + self.path)
+        store.register_json('[ {"id":"a","value":1} ]')
+        reporter.log()
+        reporter.log()
+        # on disk without closing the reporter
+        r = archive.ArchiveReader(self.path)
+        self.assertEqual([1.0], list(r.get("a")[1]))
+        r.close()
+        reporter.close()
+
+    def test_broken(self):
+        with open(self.path, "wb") as fh:
+            fh.write(b"something else")
+        with self.assertRaises(ValueError):
+            archive.ArchiveReader(self.path)
@@ -0,0 +1,89 @@
+import unittest
+import os
+import serial
+import time
+
+from libardurep import datastore
+try:
+    from libardurep import asyncreader
+except SyntaxError:
+    # Python < 3.5
+    asyncreader = None
+
+@unittest.skipIf(asyncreader is None, "asyncio is not available")
+class TestAsyncReader(unittest.TestCase):
+    def setUp(self):
+        self.store = datastore.DataStore()
+        self.manager = asyncreader.AsyncReaderManager()
+        self.test_json = ' \n\n[ \n  {"id":"light_value","value":"777"} \n] \n'
+
+    def loop_reader(self, store, rounds=0):
+        reader = asyncreader.AsyncSerialReader(None, 9600, store, rounds, \
+                                                    poll_interval=0.01)
+        reader.device_name = "loop://"
+        reader.device = serial.serial_for_url("loop://", timeout=0)
+        return reader
+
+    def test_single_run(self):
+        reader = self.loop_reader(self.store, 1)
+        reader.device.write(self.test_json.encode())
+        self.manager.register_reader(reader)
+        # the only round is used up by the frame, so run() returns
+        self.manager.run()
+        self.assertEqual("777", self.store.data["light_value"]["value"])
+
+    def test_timeout(self):
+        reader = self.loop_reader(self.store, 3)
+        reader.timeout = 0.05
+        reader.device.write('df'.encode())
+        self.manager.register_reader(reader)
+        self.manager.run()
+        self.assertFalse(reader.do_run)
+
+    def test_no_timeout(self):
+        reader = self.loop_reader(self.store, 1)
+        reader.timeout = None
+        self.manager.register_reader(reader)
+        self.manager.start()
+        # polled a few times without input
+        time.sleep(0.1)
+        reader.device.write(self.test_json.encode())
+        self.manager.join(2)
+        self.assertEqual("777", self.store.data["light_value"]["value"])
+
+    def test_start_halt(self):
+        a = datastore.DataStore()
+        b = datastore.DataStore()
+        first_reader = self.manager.register_reader(self.loop_reader(a))
+        self.manager.start()
+        self.assertTrue(self.manager.is_alive())
+        # readers can join the running manager
+        second_reader = self.manager.register_reader(self.loop_reader(b))
+        first_reader.device.write(' \n[ \n  {"id":"foo","value":"1"} \n] \n'.encode())
+        second_reader.device.write(' \n[ \n  {"id":"foo","value":"2"} \n] \n'.encode())
+        time.sleep(0.5)
+        self.assertEqual("1", a.data["foo"]["value"])
+        self.assertEqual("2", b.data["foo"]["value"])
+        first_reader.halt()
+        time.sleep(0.5)
+        self.assertTrue(self.manager.is_alive())
+        self.manager.stop(2)
+        self.assertFalse(self.manager.is_alive())
+
+    @unittest.skipUnless(hasattr(os, "openpty"), "no pseudo terminals")
+    def test_file_descriptor(self):
+        master, slave = os.openpty()
+        try:
+            reader = self.manager.add_reader(os.ttyname(slave), 9600, \
+                                                                self.store, 0)
+            self.assertIsNot(reader.fileno(), None)
+            self.manager.start()
+            os.write(master, self.test_json.encode())
+            time.sleep(0.5)
+            self.assertEqual("777", self.store.data["light_value"]["value"])
+            self.manager.stop(2)
+            self.assertFalse(self.manager.is_alive())
+        finally:
+            self.manager.stop(2)
+            os.close(master)
+            os.close(slave)
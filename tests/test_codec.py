@@ -0,0 +1,71 @@
+import unittest
+import json
+
+from libardurep import codec, datastore, frameparser
+
+def available(name):
+    try:
+        codec.get_codec(name)
+        return True
+    except ImportError:
+        return False
+
+class TestCodec(unittest.TestCase):
+    def test_get_codec(self):
+        c = codec.get_codec()
+        self.assertIs(c, codec.get_codec("auto"))
+        self.assertIn(c.name, ("orjson", "ujson", "json"))
+        self.assertEqual("json", codec.get_codec("json").name)
+        with self.assertRaises(ValueError):
+            codec.get_codec("yaml")
+
+    def check(self, c):
+        self.assertEqual({"a": [1, 2.5, None]}, \
+                                        c.loads('{"a": [1, 2.5, null]}'))
+        self.assertEqual({"a": u"°"}, c.loads_bytes( \
+                                        u'{"a": "°"}'.encode("UTF-8")))
+        # what the faster libraries refuse is left to the standard one
+        self.assertEqual([2 ** 70], c.loads("[%d]" % 2 ** 70))
+        with self.assertRaises(ValueError):
+            c.loads("[1,")
+        with self.assertRaises(ValueError):
+            c.loads_bytes(b"\xff")
+        self.assertEqual({"a": 1}, c.loads_bytes(b' {"a": 1} '))
+        with self.assertRaises(ValueError):
+            c.loads_bytes(b'{"a": 1} x')
+
+    def test_codecs(self):
+        for name in ("json", "orjson", "ujson"):
+            if available(name):
+                self.check(codec.get_codec(name))
+                self.check(codec.get_codec(name, compatible=False))
+
+    def test_compatible(self):
+        data = '[ {"id":"a/b","value":1e-07,"unit":"\\u00b0C"}, ' \
+                                    '{"id":"b","value":[1, 2],"x":true} ]'
+        reference = datastore.DataStore(codec="json")
+        reference.register_json(data)
+        for name in ("orjson", "ujson"):
+            if not available(name):
+                continue
+            store = datastore.DataStore(codec=name)
+            store.register_json(data)
+            for p in (False, True):
+                self.assertEqual(reference.get_json(p), store.get_json(p))
+            fast = datastore.DataStore(codec=codec.get_codec(name, False))
+            fast.register_json(data)
+            self.assertEqual(json.loads(reference.get_json()), \
+                                                json.loads(fast.get_json()))
+
+    def test_frameparser(self):
+        for name in ("json", "orjson", "ujson"):
+            if not available(name):
+                continue
+            p = frameparser.FrameParser(codec=codec.get_codec(name))
+            frames = p.feed(b'[\n  {"id":"a","value":1},\n  {"id":\xff},\n' \
+                                                                    b']\n')
+            self.assertEqual([[{"id": "a", "value": 1}]], frames)
+            self.assertEqual(1, p.dropped)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,57 @@
 
 from base64 import b64encode
-import unittest2 as unittest
+import unittest
 import datetime
 import json
 import re
 import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
 
 from libardurep import datastore, datareporter
 
+class CollectorHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the collecting web server
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        if self.server.down:
+            # drop the connection kept alive by the client
+            self.close_connection = True
+            return
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(self.server.delay)
+        self.server.posts.append((self.headers, body.decode()))
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+class Collector(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def start_collector(port=0):
+    server = Collector(("127.0.0.1", port), CollectorHandler)
+    server.posts = []
+    server.status = 200
+    server.delay = 0
+    server.down = False
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return server, "http://127.0.0.1:%d/" % server.server_address[1]
+
+def stop_collector(server):
+    server.down = True
+    server.shutdown()
+    server.server_close()
+
 class TestDataReport(unittest.TestCase):
     def setUp(self):
         self.store = datastore.DataStore()
@@ -39,9 +83,83 @@ class TestDataReport(unittest.TestCase):
 
         self.assertEqual(sc + sc, fc)
 
+    def test_log_file_sink(self):
+        tf = tempfile.NamedTemporaryFile()
+        self.store.register_json('[{"id":"foo","value":1}]')
+        sink = self.reporter.open_file_sink("file://" + tf.name)
+        self.reporter.log("file://" + tf.name)
+        self.reporter.log("file://" + tf.name)
+        self.reporter.close()
+        self.assertIs(None, sink.fh)
+        with open(tf.name, "r") as fh:
+            lines = fh.readlines()
+        self.assertEqual(2, len(lines))
+        self.assertEqual(json.loads(self.store.get_json())[0], \
+                                                        json.loads(lines[0]))
+
     def test_log_post(self):
-        # Create a local http server? ...
-        pass
+        server, url = start_collector()
+        try:
+            self.store.register_json('[{"id":"foo","value":1}]')
+            self.reporter.register_credentials({"base64":"bWU6c2VjcmV0"})
+            self.reporter.log(url)
+            self.reporter.log(url)
+            self.assertEqual(2, len(server.posts))
+            h, b = server.posts[0]
+            self.assertEqual(self.store.get_json(), b)
+            self.assertEqual("Basic bWU6c2VjcmV0", h["Authorization"])
+            self.assertEqual("application/json", h["Content-Type"])
+            # a failure is reported, not raised
+            server.status = 404
+            self.assertFalse(self.reporter.send("[]", url))
+        finally:
+            server.shutdown()
+            server.server_close()
+            self.reporter.close()
+
+    def test_log_post_batch(self):
+        server, url = start_collector()
+        try:
+            reporter = datareporter.DataReporter(self.store, url, \
+                                                    pool_size=2, batch_size=3)
+            for i in range(4):
+                self.store.register_json('[{"id":"foo","value":%d}]' % i)
+                reporter.log()
+            self.assertEqual(1, len(server.posts))
+            self.assertEqual([0, 1, 2], [d["value"] for d in \
+                                            json.loads(server.posts[0][1])])
+            reporter.close()
+            self.assertEqual(2, len(server.posts))
+            self.assertEqual(3, json.loads(server.posts[1][1])[0]["value"])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_log_post_batch_url(self):
+        server, url = start_collector()
+        other, other_url = start_collector()
+        try:
+            reporter = datareporter.DataReporter(self.store, url, \
+                                                                batch_size=3)
+            self.store.register_json('[{"id":"foo","value":1}]')
+            reporter.log(other_url, {"base64":"bWU6c2VjcmV0"})
+            reporter.log()
+            reporter.close()
+            # every batch goes where it was collected for
+            self.assertEqual(1, len(server.posts))
+            self.assertEqual(1, len(other.posts))
+            self.assertNotIn("Authorization", server.posts[0][0])
+            self.assertEqual("Basic bWU6c2VjcmV0", \
+                                        other.posts[0][0]["Authorization"])
+            # the credentials set later on are used, too
+            reporter.credentials = {"base64":"dGhlbTpzZWNyZXQ="}
+            reporter.send("[]")
+            self.assertEqual("Basic dGhlbTpzZWNyZXQ=", \
+                                        server.posts[1][0]["Authorization"])
+        finally:
+            for s in (server, other):
+                s.shutdown()
+                s.server_close()
 
     def test_log_ssh(self):
         # not implemented yet
@@ -1,8 +1,9 @@
 
-import unittest2 as unittest
+import unittest
 import datetime
 import json
 import re
+import threading
 
 from libardurep import datastore
 
@@ -119,3 +120,121 @@ class TestDataStore(unittest.TestCase):
         self.assertEqual(j0[1:-1] + ",", jt0)
         self.assertEqual(len(j1), len(jt1) + 1)
 
+
+    def test_concurrent(self):
+        store = datastore.DataStore(concurrent=True)
+        errors = []
+        done = threading.Event()
+
+        def write(w):
+            try:
+                for i in range(300):
+                    store.register_json('[ {"id":"w%d_a","value":%d}, ' \
+                            '{"id":"w%d_b","value":%d}, {"id":"w%d_%d",' \
+                            '"value":%d} ]' % (w, i, w, i, w, i, i))
+            except Exception as e:
+                errors.append(e)
+
+        def read():
+            try:
+                while not done.is_set():
+                    d = json.loads(store.get_json())
+                    store.get_text()
+                    v = {}
+                    for r in d:
+                        self.assertTrue("time" in r)
+                        v[r["id"]] = r["value"]
+                    # the entries of a frame are published together
+                    for w in range(4):
+                        if "w%d_a" % w in v:
+                            self.assertEqual(v["w%d_a" % w], v["w%d_b" % w])
+            except Exception as e:
+                errors.append(e)
+
+        writers = [threading.Thread(target=write, args=(w,)) \
+                                                        for w in range(4)]
+        readers = [threading.Thread(target=read) for r in range(2)]
+        for t in readers + writers:
+            t.start()
+        for t in writers:
+            t.join()
+        done.set()
+        for t in readers:
+            t.join()
+        self.assertEqual([], errors)
+        self.assertEqual(4 * 302, len(store.data))
+        self.assertEqual(299, store.data["w3_b"]["value"])
+
+    def test_history(self):
+        store = datastore.DataStore(history_size=2)
+        self.assertIsNone(self.store.history)
+        self.assertEqual([], self.store.get_history("a"))
+        for i in range(3):
+            store.register_json('[ {"id":"a","value":%d}, ' \
+                                    '{"id":"b","value":"x"} ]' % i)
+        h = store.get_history("a")
+        self.assertEqual([1.0, 2.0], [v for t, v in h])
+        self.assertEqual([], store.get_history("b"))
+        self.assertEqual(h[1:], store.get_history("a", h[1][0]))
+        j = json.loads(store.get_history_json())
+        self.assertEqual([1.0, 2.0], [d["value"] for d in j])
+        self.assertEqual(store.data["a"]["time"], j[1]["time"])
+
+    def test_history_translated(self):
+        with open("./schemas/meta-schema.json", "r") as fh:
+            ma = fh.read()
+        with open("./schemas/default-schema.json", "r") as fh:
+            sa = fh.read()
+        with open("./examples/custom-output-meta-schema.json", "r") as fh:
+            mb = fh.read()
+        with open("./examples/custom-output-schema.json", "r") as fh:
+            sb = fh.read()
+        store = datastore.DataStore(sa, ma, sb, mb, history_size=10)
+        store.register_json('[ {"id":"a","value":8} ]')
+        j = json.loads(store.get_history_json(["a"], prettyprint=True))
+        self.assertEqual("a", j[0]["ourVeryCustomSensorName"])
+        self.assertEqual(8.0, j[0]["sensorValue"])
+
+    def test_compile_mapping(self):
+        with open("./schemas/meta-schema.json", "r") as fh:
+            ma = fh.read()
+        with open("./examples/extended-input-schema.json", "r") as fh:
+            sa = fh.read()
+        with open("./schemas/default-schema.json", "r") as fh:
+            sb = fh.read()
+        store = datastore.DataStore(sa, ma, sb, ma)
+        store.register_json('[ {"ourVeryCustomSensorName":"a",' \
+                '"sensorValue":8,"sensorValueUnit":"m","warnThreshold":5},' \
+                '{"ourVeryCustomSensorName":"b","sensorValue":9} ]')
+        self.assertEqual(8, store.data["a"]["sensorValue"])
+        self.assertEqual(5, store.data["a"]["warnThreshold"])
+        self.assertFalse("warnThreshold" in store.data["b"])
+        # the entries are translated by their meaning
+        d = store.get_translated_data()
+        self.assertEqual("a", d["a"]["id"])
+        self.assertEqual(8, d["a"]["value"])
+        self.assertEqual("m", d["a"]["unit"])
+        self.assertEqual(5, d["a"]["warnThreshold"])
+        self.assertEqual(["id", "value", "time"], list(d["b"].keys()))
+
+    def test_get_json_cache(self):
+        j = '[ {"id":"a","value":1,"unit":"m"}, {"id":"b","value":"x\\ny"} ]'
+        self.store.register_json(j)
+        for p in (False, True):
+            for t in (False, True):
+                d = [self.store.translate(r) if t else r.to_dict() \
+                                        for r in self.store.data.values()]
+                if p:
+                    e = json.dumps(d, indent=2, separators=(',',': '))
+                else:
+                    e = json.dumps(d)
+                self.assertEqual(e, self.store.get_json(p, t))
+                # and once more from the cache
+                self.assertEqual(e, self.store.get_json(p, t))
+        f = self.store.get_json_fragments()
+        self.store.register_json('[ {"id":"b","value":2} ]')
+        g = self.store.get_json_fragments()
+        self.assertIs(f[0], g[0])
+        self.assertEqual(2, json.loads(g[1])["value"])
+        self.assertEqual("[]", datastore.DataStore().get_json(True))
+        self.assertEqual("", datastore.DataStore().get_json_tuples(True))
@@ -0,0 +1,144 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+from libardurep import datastore, datareporter, delta
+from tests.test_datareporter import start_collector, stop_collector
+
+class TestDeltaReport(unittest.TestCase):
+    def setUp(self):
+        self.store = datastore.DataStore()
+
+    def register(self, **values):
+        self.store.register_records([{"id": k, "value": values[k]} \
+                                                        for k in values])
+
+    def ids(self, data):
+        return sorted(data.keys())
+
+    def test_get_changes(self):
+        self.register(a=1, b=2)
+        v, data = self.store.get_changes()
+        self.assertEqual(["a", "b"], self.ids(data))
+        self.register(b=3)
+        w, data = self.store.get_changes(v)
+        self.assertEqual(v + 1, w)
+        self.assertEqual(["b"], self.ids(data))
+        self.assertEqual({}, self.store.get_changes(w)[1])
+        self.assertEqual(w, data["b"].version)
+        # several registrations back
+        self.register(c=4)
+        self.register(c=5)
+        x, data = self.store.get_changes(v)
+        self.assertEqual(w + 2, x)
+        self.assertEqual(["b", "c"], self.ids(data))
+
+    def test_changes(self):
+        d = delta.DeltaReport(self.store)
+        self.register(a=1, b=2, c="on")
+        # the first report is a keyframe
+        self.assertEqual(["a", "b", "c"], self.ids(d.get_data(0)))
+        self.assertEqual({}, d.get_data(1))
+        # the same value again is no change
+        self.register(a=1, b=5, c="off")
+        self.assertEqual(["b", "c"], self.ids(d.get_data(2)))
+        self.assertEqual('[]', d.get_json(now=3))
+
+    def test_deadband(self):
+        d = delta.DeltaReport(self.store, deadband={"a": 0.5}, \
+                                                        default_deadband=1)
+        self.register(a=20.0, b=10, c="x")
+        d.get_data(0)
+        self.register(a=20.4, b=11, c="y")
+        self.assertEqual(["c"], self.ids(d.get_data(1)))
+        # compared to the value reported, not the last one registered
+        self.register(a=20.6, b=11.5)
+        self.assertEqual(["a", "b"], self.ids(d.get_data(2)))
+        # the deadbands are not shared
+        deadband = {"a": 5}
+        e = delta.DeltaReport(self.store, deadband)
+        deadband["a"] = 0
+        self.assertEqual({"a": 5}, e.deadband)
+        self.assertEqual({}, delta.DeltaReport(self.store).deadband)
+        self.assertIsNot(e.deadband, delta.DeltaReport(self.store).deadband)
+
+    def test_keyframes(self):
+        d = delta.DeltaReport(self.store, keyframe_every=2, \
+                                                        keyframe_interval=10)
+        self.register(a=1, b=2)
+        d.get_data(0)
+        self.assertEqual({}, d.get_data(1))
+        self.assertEqual({}, d.get_data(2))
+        self.assertEqual(["a", "b"], self.ids(d.get_data(3)))
+        self.assertEqual({}, d.get_data(4))
+        self.assertEqual(["a", "b"], self.ids(d.get_data(13)))
+        d.reset()
+        self.assertEqual(["a", "b"], self.ids(d.get_data(14)))
+
+    def test_log_post(self):
+        server, url = start_collector()
+        reporter = datareporter.DataReporter(self.store, url)
+        reporter.enable_delta()
+        try:
+            self.register(a=1, b=2)
+            reporter.log()
+            reporter.log()
+            self.register(a=1, b=3)
+            reporter.log()
+            self.assertEqual(2, len(server.posts))
+            self.assertEqual([("b", 3)], [(d["id"], d["value"]) \
+                                    for d in json.loads(server.posts[1][1])])
+            # a lost report is followed by a keyframe
+            server.status = 503
+            self.register(b=4)
+            reporter.log()
+            server.status = 200
+            reporter.log()
+            self.assertEqual(2, len(json.loads(server.posts[-1][1])))
+        finally:
+            stop_collector(server)
+            reporter.close()
+
+    def test_log_file(self):
+        tf = tempfile.NamedTemporaryFile()
+        reporter = datareporter.DataReporter(self.store, "file://" + tf.name)
+        reporter.enable_delta()
+        reporter.open_file_sink()
+        self.register(a=1, b=2)
+        reporter.log()
+        reporter.log()
+        self.register(b=3)
+        reporter.log()
+        reporter.close()
+        with open(tf.name) as fh:
+            lines = [json.loads(l) for l in fh]
+        self.assertEqual(["a", "b", "b"], [l["id"] for l in lines])
+
+    def test_log_file_failed(self):
+        d = tempfile.mkdtemp()
+        try:
+            path = os.path.join(d, "out.json")
+            reporter = datareporter.DataReporter(self.store, "file://" + path)
+            reporter.enable_delta()
+            self.register(a=1, b=2)
+            reporter.log()
+            self.register(b=3)
+            # the file can not be written for a while
+            os.rename(path, path + ".old")
+            os.mkdir(path)
+            reporter.log()
+            os.rmdir(path)
+            reporter.log()
+            with open(path) as fh:
+                # the change that could not be written is reported again
+                self.assertEqual([{"id": "b", "value": 3}], \
+                            [dict((k, e[k]) for k in ("id", "value")) \
+                                        for e in json.loads("[" + \
+                                        fh.read().strip().rstrip(",") + "]")])
+        finally:
+            shutil.rmtree(d)
+
+if __name__ == '__main__':
+    unittest.main()
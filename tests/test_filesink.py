@@ -0,0 +1,76 @@
+import unittest
+import glob
+import gzip
+import os
+import shutil
+import tempfile
+
+from libardurep import filesink
+
+class TestFileSink(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "log")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_write(self):
+        sink = filesink.FileSink(self.path)
+        sink.write('{"id": "a"}\n')
+        sink.write('{"id": "b"}\n')
+        sink.close()
+        sink = filesink.FileSink(self.path)
+        sink.write('{"id": "c"}\n')
+        sink.close()
+        with open(self.path, "r") as fh:
+            self.assertEqual(3, len(fh.readlines()))
+
+    def test_fsync(self):
+        sink = filesink.FileSink(self.path, fsync_every=2)
+        sink.write("a\n")
+        self.assertEqual(1, sink.unsynced)
+        sink.write("b\n")
+        self.assertEqual(0, sink.unsynced)
+        with open(self.path, "r") as fh:
+            self.assertEqual("a\nb\n", fh.read())
+        sink.close()
+
+    def test_rotate(self):
+        sink = filesink.FileSink(self.path, max_bytes=10)
+        for i in range(5):
+            sink.write("%d_________\n" % i)
+        sink.close()
+        rotated = sorted(glob.glob(self.path + ".*"))
+        self.assertEqual(5, len(rotated))
+        with open(rotated[0], "r") as fh:
+            self.assertEqual("0_________\n", fh.read())
+        self.assertEqual(0, os.path.getsize(self.path))
+
+    def test_compress(self):
+        with self.assertRaises(ValueError):
+            filesink.FileSink(self.path, compress="rar")
+        sink = filesink.FileSink(self.path, compress="gzip")
+        sink.write("a\n")
+        name = sink.rotate()
+        # compressed in the background, meanwhile the sink goes on
+        sink.write("b\n")
+        sink.wait()
+        self.assertFalse(sink.compressing)
+        sink.close()
+        self.assertTrue(name.endswith(".gz"))
+        self.assertEqual([name], glob.glob(self.path + ".*"))
+        with gzip.open(name, "rb") as fh:
+            self.assertEqual(b"a\n", fh.read())
+
+    def test_compress_failed(self):
+        sink = filesink.FileSink(self.path, compress="gzip")
+        with open(self.path + ".old", "w") as fh:
+            fh.write("a\n")
+        # the compressed file can not get its name
+        os.mkdir(self.path + ".old.gz")
+        self.assertEqual(self.path + ".old", \
+                                    sink.compress_file(self.path + ".old"))
+        self.assertEqual([self.path + ".old", self.path + ".old.gz"], \
+                                        sorted(glob.glob(self.path + ".*")))
+        sink.close()
@@ -0,0 +1,52 @@
+import unittest
+import io
+
+from libardurep import frameparser
+
+class TestFrameParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = frameparser.FrameParser()
+        self.frame = b'[\r\n  {"id":"a","value":1},\r\n' + \
+                        b'  {"id":"b","value":2}\r\n]\r\n'
+
+    def test_feed_line(self):
+        self.assertIs(self.parser.feed_line(b'  {"id":"a","value":1}\r\n'), \
+                                                                        None)
+        self.assertIs(self.parser.feed_line(b'[ \n'), None)
+        self.assertIs(self.parser.feed_line(b'  {"id":"a","value":1} \n'), \
+                                                                        None)
+        r = self.parser.feed_line(b'] \n')
+        self.assertEqual([{"id":"a","value":1}], r)
+        # an empty frame is no frame
+        self.parser.feed_line(b'[\n')
+        self.assertIs(self.parser.feed_line(b']\n'), None)
+
+    def test_feed(self):
+        frames = []
+        for i in range(len(self.frame)):
+            frames += self.parser.feed(self.frame[i:i + 1])
+        self.assertEqual(1, len(frames))
+        self.assertEqual(["a", "b"], [r["id"] for r in frames[0]])
+        frames = self.parser.feed(self.frame + self.frame)
+        self.assertEqual(2, len(frames))
+
+    def test_corrupt_line(self):
+        data = b'[\r\n  {"id":"a","value":1},\r\n  {"id":"b","val\r\n' + \
+                b'  {"id":"\xff","value":3},\r\n  {"id":"c","value":4}\r\n]\r\n'
+        frames = self.parser.feed(data)
+        self.assertEqual(1, len(frames))
+        self.assertEqual(["a", "c"], [r["id"] for r in frames[0]])
+        self.assertEqual(2, self.parser.dropped)
+
+    def test_iter_frames(self):
+        f = io.BytesIO(self.frame * 3)
+        frames = list(frameparser.iter_frames(f))
+        self.assertEqual(3, len(frames))
+
+    def test_iter_records(self):
+        f = io.BytesIO(self.frame * 3)
+        records = list(frameparser.iter_records(f))
+        self.assertEqual(["a", "b"] * 3, [r["id"] for r in records])
+        # records of an unfinished frame are returned as well
+        records = list(frameparser.iter_records([self.frame[0:-3]]))
+        self.assertEqual(["a", "b"], [r["id"] for r in records])
@@ -0,0 +1,67 @@
+import unittest
+
+from libardurep import history
+
+class TestRingBuffer(unittest.TestCase):
+    def setUp(self):
+        self.buffer = history.RingBuffer(4)
+
+    def test_append(self):
+        self.assertEqual(0, len(self.buffer))
+        for i in range(6):
+            self.buffer.append(float(i), i * 10.0)
+        self.assertEqual(4, len(self.buffer))
+        self.assertEqual([(2.0, 20.0), (3.0, 30.0), (4.0, 40.0), \
+                                            (5.0, 50.0)], self.buffer.get())
+
+    def test_clock_back(self):
+        for t in (1.0, 5.0, 3.0, 4.0, 6.0):
+            self.buffer.append(t, t * 10.0)
+        # kept in order, at the time of the newest sample
+        self.assertEqual([(5.0, 50.0), (5.0, 30.0), (5.0, 40.0), \
+                                            (6.0, 60.0)], self.buffer.get())
+        self.assertEqual([(6.0, 60.0)], self.buffer.get(5.5, None))
+        self.buffer.evict(5.5)
+        self.assertEqual(1, len(self.buffer))
+
+    def test_get(self):
+        for i in range(6):
+            self.buffer.append(float(i), i * 10.0)
+        self.assertEqual([(3.0, 30.0), (4.0, 40.0)], self.buffer.get(3, 4))
+        self.assertEqual([(4.0, 40.0), (5.0, 50.0)], \
+                                                self.buffer.get(3.5, None))
+        self.assertEqual([(2.0, 20.0)], self.buffer.get(None, 2.5))
+        self.assertEqual([], self.buffer.get(6, None))
+
+    def test_evict(self):
+        for i in range(6):
+            self.buffer.append(float(i), i * 10.0)
+        self.buffer.evict(4)
+        self.assertEqual([(4.0, 40.0), (5.0, 50.0)], self.buffer.get())
+        self.buffer.evict(10)
+        self.assertEqual(0, len(self.buffer))
+        self.buffer.append(11.0, 1.0)
+        self.assertEqual([(11.0, 1.0)], self.buffer.get())
+
+    def test_size(self):
+        with self.assertRaises(ValueError):
+            history.RingBuffer(0)
+
+class TestSensorHistory(unittest.TestCase):
+    def setUp(self):
+        self.history = history.SensorHistory(3, 10)
+
+    def test_add(self):
+        self.assertTrue(self.history.add("a", 1.0, "777"))
+        self.assertFalse(self.history.add("a", 2.0, "high"))
+        self.assertFalse(self.history.add("b", 2.0, None))
+        self.assertEqual(["a"], self.history.sensors())
+        self.assertEqual([(1.0, 777.0)], self.history.get("a"))
+        self.assertEqual([], self.history.get("b"))
+
+    def test_max_age(self):
+        for i in range(3):
+            self.history.add("a", float(i * 5), i)
+        self.assertEqual(3, len(self.history.get("a")))
+        self.assertEqual([(5.0, 1.0), (10.0, 2.0)], \
+                                        self.history.get("a", now=15.0))
@@ -0,0 +1,68 @@
+import unittest
+import subprocess
+import sys
+
+# imported only when the sink, validator or server using them is first
+# used, to keep the start of short-lived programs fast
+HEAVY = ("requests", "urllib3", "jsonschema", "numpy", "sqlite3", \
+                                                                "http.server")
+
+def import_times(statement):
+    """
+    Run 'statement' in a new interpreter, get the modules it imported
+    and their cumulative import times in microseconds (-X importtime)
+    """
+    p = subprocess.Popen([sys.executable, "-X", "importtime", "-c", \
+                    statement], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    if p.returncode:
+        raise AssertionError(err.decode("UTF-8", "replace"))
+    times = {}
+    for l in err.decode("UTF-8").splitlines():
+        if not l.startswith("import time:"):
+            continue
+        f = l[len("import time:"):].split("|")
+        try:
+            times[f[2].strip()] = int(f[1])
+        except ValueError:
+            # the header line
+            pass
+    return times
+
+class TestImports(unittest.TestCase):
+    def assertLight(self, statement):
+        times = import_times(statement)
+        self.assertIn("libardurep.datastore", times)
+        heavy = [m for m in times if m.split(".")[0] in HEAVY or m in HEAVY]
+        self.assertEqual([], heavy)
+
+    def test_reporter(self):
+        self.assertLight("from libardurep import datareporter, datastore")
+
+    def test_reader(self):
+        self.assertLight("from libardurep import datastore, serialreader")
+
+    def test_file_report(self):
+        self.assertLight("from libardurep import datareporter, datastore\n"
+                "import tempfile, os\n"
+                "d = tempfile.mkdtemp()\n"
+                "s = datastore.DataStore()\n"
+                "s.register_json('[{\"id\": \"a\", \"value\": 1}]')\n"
+                "datareporter.DataReporter(s).log('file://' + "
+                "os.path.join(d, 'out.json'))\n"
+                "os.remove(os.path.join(d, 'out.json'))\n"
+                "os.rmdir(d)")
+
+    def test_loaded_on_use(self):
+        times = import_times("from libardurep import datareporter, "
+                "datastore, metrics\n"
+                "s = datastore.DataStore()\n"
+                "datareporter.DataReporter(s).get_session()\n"
+                "datastore.DataStore(open('schemas/default-schema.json')"
+                ".read(), open('schemas/meta-schema.json').read())\n"
+                "metrics.start_http_server(0, '127.0.0.1').shutdown()")
+        for m in ("requests", "urllib3", "jsonschema", "http.server"):
+            self.assertIn(m, times)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+
+from libardurep import datastore, metrics
+from libardurep.ingest import IngestFilter, IngestPolicy
+
+class TestIngestFilter(unittest.TestCase):
+    def feed(self, f, samples):
+        """
+        Get the values let through of (time, value) samples of sensor "a"
+        """
+        out = []
+        for t, v in samples:
+            out.extend([e["value"] for e in f.filter([{"id": "a", \
+                                                        "value": v}], t)])
+        return out
+
+    def test_policy(self):
+        self.assertEqual(0.5, IngestPolicy(max_rate=2).interval)
+        self.assertEqual(3, IngestPolicy(coalesce=3).interval)
+        self.assertEqual(0, IngestPolicy(deadband=1).interval)
+        with self.assertRaises(ValueError):
+            IngestPolicy(max_rate=0)
+        with self.assertRaises(ValueError):
+            IngestPolicy(max_rate=1, coalesce=1)
+
+    def test_max_rate(self):
+        f = IngestFilter({"a": IngestPolicy(max_rate=1)})
+        self.assertEqual([1, 3, 6], self.feed(f, [(0, 1), (0.5, 2), \
+                                    (1.0, 3), (1.5, 4), (1.9, 5), (2.5, 6)]))
+        self.assertEqual(3, f.dropped)
+
+    def test_deadband(self):
+        f = IngestFilter({"a": IngestPolicy(deadband=0.5)})
+        self.assertEqual([1, 1.6, 1, "x"], self.feed(f, [(0, 1), (1, 1.4), \
+                    (2, 1.6), (3, 1.2), (4, 1), (5, "x"), (6, "x")]))
+        self.assertEqual(3, f.dropped)
+
+    def test_coalesce(self):
+        f = IngestFilter({"a": IngestPolicy(coalesce=1)})
+        # the latest sample of the interval is let through at its end
+        self.assertEqual([1], self.feed(f, [(0, 1), (0.2, 2), (0.4, 3)]))
+        self.assertEqual(1, f.coalesced)
+        self.assertEqual([{"id": "b", "value": 0}], \
+                                    f.filter([{"id": "b", "value": 0}], 0.9))
+        self.assertEqual([{"id": "a", "value": 3}], f.flush(1.0))
+        self.assertEqual({}, f.pending)
+        # or replaced by the next one let through
+        self.assertEqual([4], self.feed(f, [(1.5, 3.5), (2.0, 4)]))
+        self.assertEqual({}, f.pending)
+        self.assertEqual(2, f.coalesced)
+
+    def test_default(self):
+        f = IngestFilter({"b": IngestPolicy(max_rate=1)})
+        self.assertEqual([1, 2], self.feed(f, [(0, 1), (0.1, 2)]))
+        f.set_default(IngestPolicy(max_rate=1))
+        self.assertEqual([3], self.feed(f, [(0.2, 3), (0.3, 4)]))
+        f.set_policy("a", None)
+        self.assertEqual([5], self.feed(f, [(0.4, 5)]))
+        # no usable id, the store decides
+        j = [{"value": 1}, {"id": [1], "value": 2}, [1]]
+        self.assertEqual(j, f.filter(j, 1))
+
+class TestDataStoreIngest(unittest.TestCase):
+    def test_store(self):
+        store = datastore.DataStore(metrics=False, \
+                        ingest_policies={"fast": IngestPolicy(max_rate=10)})
+        store.register_records([{"id": "fast", "value": 1}, \
+                                        {"id": "slow", "value": 1}], 100.0)
+        version = store.version
+        timestamp = store.last_data_timestamp
+        store.register_records([{"id": "fast", "value": 2}], 100.05)
+        # nothing was registered at all
+        self.assertEqual(version, store.version)
+        self.assertEqual(1, store.data["fast"]["value"])
+        self.assertEqual(timestamp, store.last_data_timestamp)
+        store.register_records([{"id": "fast", "value": 3}, \
+                                        {"id": "slow", "value": 2}], 100.2)
+        self.assertEqual(3, store.data["fast"]["value"])
+        self.assertEqual(2, store.data["slow"]["value"])
+
+    def test_coalesce(self):
+        store = datastore.DataStore(metrics=False, concurrent=True)
+        store.set_ingest_policy(None, IngestPolicy(coalesce=1))
+        store.register_records([{"id": "a", "value": 1}], 100.0)
+        store.register_records([{"id": "a", "value": 2}], 100.5)
+        self.assertEqual(1, store.data["a"]["value"])
+        store.flush_ingest(100.9)
+        self.assertEqual(1, store.data["a"]["value"])
+        store.flush_ingest(101.0)
+        self.assertEqual(2, store.data["a"]["value"])
+        self.assertEqual(101.0, store.data["a"].received)
+        # only for a sensor without a policy of its own
+        store.set_ingest_policy("b", IngestPolicy())
+        store.register_records([{"id": "b", "value": 1}], 101.1)
+        store.register_records([{"id": "b", "value": 2}], 101.2)
+        self.assertEqual(2, store.data["b"]["value"])
+
+    def test_metrics(self):
+        m = metrics.MetricsRegistry()
+        first = datastore.DataStore(metrics=m, name="first", \
+                        ingest_policies={"a": IngestPolicy(max_rate=1)})
+        # gets its filter only later
+        second = datastore.DataStore(metrics=m)
+        second.set_ingest_policy(None, IngestPolicy(max_rate=1))
+        for t in (100.0, 100.1, 100.2):
+            first.register_records([{"id": "a", "value": t}], t)
+            second.register_records([{"id": "a", "value": t}], t)
+        second.register_records([{"id": "a", "value": 1}], 100.3)
+        self.assertEqual(2, m.get_value("ardu_store_samples_dropped_total", \
+                                        store="first", reason="dropped"))
+        self.assertEqual(3, m.get_value("ardu_store_samples_dropped_total", \
+                                        store=second.name, reason="dropped"))
+        self.assertEqual(0, m.get_value("ardu_store_samples_dropped_total", \
+                                        store=second.name, reason="coalesced"))
+        self.assertNotEqual(second.name, datastore.DataStore().name)
+        # a store of the same name goes on counting
+        del first
+        first = datastore.DataStore(metrics=m, name="first", \
+                        ingest_policies={"a": IngestPolicy(max_rate=1)})
+        for t in (200.0, 200.1):
+            first.register_records([{"id": "a", "value": t}], t)
+        self.assertEqual(3, m.get_value("ardu_store_samples_dropped_total", \
+                                        store="first", reason="dropped"))
+
+if __name__ == '__main__':
+    unittest.main()
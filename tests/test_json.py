@@ -1,5 +1,5 @@
 
-import unittest2 as unittest
+import unittest
 import json
 from jsonschema import Draft4Validator as Validator
 import os
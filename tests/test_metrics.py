@@ -0,0 +1,215 @@
+import unittest
+import gc
+import os
+import shutil
+import tempfile
+import weakref
+from urllib.request import urlopen
+
+from libardurep import datareporter, datastore, frameparser, metrics, \
+                                                                serialreader
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = metrics.MetricsRegistry()
+
+    def test_counter(self):
+        c = self.registry.counter("frames_total", "Frames", device="a")
+        c.inc()
+        c.inc(2)
+        self.assertIs(c, self.registry.counter("frames_total", device="a"))
+        self.assertIsNot(c, self.registry.counter("frames_total", device="b"))
+        self.assertEqual(3, self.registry.get_value("frames_total", \
+                                                                device="a"))
+        self.assertIsNone(self.registry.get_value("frames_total", \
+                                                                device="c"))
+        with self.assertRaises(ValueError):
+            self.registry.histogram("frames_total")
+
+    def test_histogram(self):
+        h = self.registry.histogram("wait_seconds", buckets=(0.1, 1.0))
+        for x in (0.05, 0.1, 0.5, 2.0):
+            h.observe(x)
+        v = h.get()
+        self.assertEqual(4, v["count"])
+        self.assertAlmostEqual(2.65, v["sum"])
+        self.assertEqual([(0.1, 2), (1.0, 3), (float("inf"), 4)], \
+                                                                v["buckets"])
+
+    def test_counter_function(self):
+        n = [5]
+        self.registry.counter_function("lines_dropped_total", \
+                                                lambda: n[0], device="a")
+        n[0] = 7
+        self.assertEqual({"lines_dropped_total": [({"device": "a"}, 7)]}, \
+                                                self.registry.get_metrics())
+
+    def test_counter_attribute(self):
+        parser = frameparser.FrameParser()
+        parser.dropped = 2
+        self.registry.counter_attribute("lines_dropped_total", parser, \
+                                                    "dropped", device="a")
+        parser.dropped = 3
+        self.assertEqual(3, self.registry.get_value("lines_dropped_total", \
+                                                                device="a"))
+        # only a weak reference is held, the value read last stays
+        parser.dropped = 4
+        del parser
+        gc.collect()
+        self.assertEqual(3, self.registry.get_value("lines_dropped_total", \
+                                                                device="a"))
+
+    def test_freeze(self):
+        first = frameparser.FrameParser()
+        second = frameparser.FrameParser()
+        self.registry.counter_attribute("lines_dropped_total", first, \
+                                                    "dropped", device="a")
+        first.dropped = 5
+        self.registry.counter_attribute("lines_dropped_total", second, \
+                                                    "dropped", device="a")
+        second.dropped = 1
+        # the first one is kept, but not read anymore
+        self.registry.freeze("lines_dropped_total", first, device="a")
+        first.dropped = 10
+        second.dropped = 2
+        self.assertEqual(7, self.registry.get_value("lines_dropped_total", \
+                                                                device="a"))
+        self.registry.freeze("lines_dropped_total", second, device="a")
+        second.dropped = 3
+        self.assertEqual(7, self.registry.get_value("lines_dropped_total", \
+                                                                device="a"))
+        # a new one goes on from there
+        third = frameparser.FrameParser()
+        self.registry.counter_attribute("lines_dropped_total", third, \
+                                                    "dropped", device="a")
+        third.dropped = 1
+        self.assertEqual(8, self.registry.get_value("lines_dropped_total", \
+                                                                device="a"))
+
+    def test_get_text(self):
+        self.registry.counter("frames_total", "Frames read", \
+                                                device='/dev/"a"').inc(2)
+        self.registry.histogram("wait_seconds", "Waiting", \
+                                    buckets=(0.5,)).observe(0.25)
+        self.assertEqual(
+            '# HELP frames_total Frames read\n'
+            '# TYPE frames_total counter\n'
+            'frames_total{device="/dev/\\"a\\""} 2\n'
+            '# HELP wait_seconds Waiting\n'
+            '# TYPE wait_seconds histogram\n'
+            'wait_seconds_bucket{le="0.5"} 1\n'
+            'wait_seconds_bucket{le="+Inf"} 1\n'
+            'wait_seconds_sum 0.25\n'
+            'wait_seconds_count 1\n', self.registry.get_text())
+
+    def test_get_registry(self):
+        self.assertIs(metrics.registry, metrics.get_registry(None))
+        self.assertIsNone(metrics.get_registry(False))
+        self.assertIs(self.registry, metrics.get_registry(self.registry))
+
+    def test_http_server(self):
+        self.registry.counter("frames_total").inc()
+        server = metrics.start_http_server(0, "127.0.0.1", self.registry)
+        try:
+            url = "http://127.0.0.1:%d/metrics" % server.server_address[1]
+            r = urlopen(url)
+            self.assertTrue(r.headers["Content-Type"].startswith( \
+                                                                "text/plain"))
+            self.assertIn(b"\nframes_total 1\n", r.read())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_store(self):
+        store = datastore.DataStore(metrics=self.registry)
+        store.register_json('[ {"id":"a","value":1}, {"id":"b","value":2} ]')
+        store.register_json('[ {"id":"a","value":3} ]')
+        store.register_json('[ {"id":"a",')
+        j = store.get_json()
+        m = self.registry
+        self.assertEqual(3, m.get_value("ardu_store_records_total"))
+        self.assertEqual(1, m.get_value("ardu_store_frames_invalid_total"))
+        # only the first one of every TIMING_SAMPLE frames is timed
+        self.assertEqual(1, m.get_value("ardu_store_parse_seconds")["count"])
+        self.assertEqual(1, \
+                    m.get_value("ardu_store_serialize_seconds")["count"])
+        self.assertEqual(len(j), \
+                    m.get_value("ardu_store_serialized_bytes_total"))
+        for i in range(metrics.TIMING_SAMPLE):
+            store.register_json('[ {"id":"a","value":4} ]')
+            store.get_json()
+        self.assertEqual(2, m.get_value("ardu_store_parse_seconds")["count"])
+        self.assertEqual(2, \
+                    m.get_value("ardu_store_serialize_seconds")["count"])
+        self.assertEqual(3 + metrics.TIMING_SAMPLE, \
+                    m.get_value("ardu_store_records_total"))
+        # nothing is counted without a registry
+        store = datastore.DataStore(metrics=False)
+        store.register_json('[ {"id":"a","value":1} ]')
+        self.assertEqual(3 + metrics.TIMING_SAMPLE, \
+                    m.get_value("ardu_store_records_total"))
+
+    def test_reader(self):
+        store = datastore.DataStore(metrics=False)
+        reader = serialreader.SerialReader(None, 9600, store, 0, \
+                                                    metrics=self.registry)
+        for l in (b"[\r\n", b'  {"id":"a","value":1},\r\n', \
+                            b'  {"id":"b",broken\r\n', b"]\r\n"):
+            reader.handle_line(l)
+        reader.drop_frame()
+        m = self.registry
+        self.assertEqual(1, m.get_value("ardu_reader_frames_total", \
+                                                            device="None"))
+        self.assertEqual(1, m.get_value("ardu_reader_lines_dropped_total", \
+                                                            device="None"))
+        # the frame with the broken line and the one thrown away
+        self.assertEqual(2, m.get_value("ardu_reader_frames_dropped_total", \
+                                                            device="None"))
+        # the registry does not keep the reader (and its store) alive
+        ref = weakref.ref(reader)
+        del reader
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertEqual(1, m.get_value("ardu_reader_lines_dropped_total", \
+                                                            device="None"))
+
+    def test_reader_frames(self):
+        store = datastore.DataStore(metrics=self.registry)
+        reader = serialreader.SerialReader(None, 9600, store, 0, \
+                                                    metrics=self.registry)
+        lines = [b"[\r\n", b'  {"id":"a","value":1},\r\n', b"]\r\n"]
+        for l in lines:
+            reader.handle_line(l)
+        m = self.registry
+        self.assertEqual(0, m.get_value("ardu_reader_frames_dropped_total", \
+                                                            device="None"))
+        # the decoding of the first frame is timed
+        self.assertEqual(1, m.get_value("ardu_store_parse_seconds")["count"])
+        # a corrupt line, then a frame that is cut off
+        for l in [b"[\r\n", b'  {"id":"a",\x00\r\n', b"]\r\n", \
+                    b"[\r\n", b'  {"id":"a","value":2},\r\n'] + lines:
+            reader.handle_line(l)
+        self.assertEqual(2, m.get_value("ardu_reader_frames_dropped_total", \
+                                                            device="None"))
+        for i in range(metrics.TIMING_SAMPLE):
+            for l in lines:
+                reader.handle_line(l)
+        self.assertEqual(2, m.get_value("ardu_store_parse_seconds")["count"])
+        self.assertEqual(2 + metrics.TIMING_SAMPLE, \
+                    m.get_value("ardu_reader_frames_total", device="None"))
+
+    def test_reporter(self):
+        d = tempfile.mkdtemp()
+        try:
+            store = datastore.DataStore(metrics=False)
+            store.register_json('[ {"id":"a","value":1} ]')
+            reporter = datareporter.DataReporter(store, metrics=self.registry)
+            reporter.log("file://" + os.path.join(d, "out.json"))
+            reporter.log("file://" + os.path.join(d, "out.json"))
+            self.assertEqual(2, self.registry.get_value( \
+                    "ardu_reporter_report_seconds", sink="file")["count"])
+        finally:
+            shutil.rmtree(d)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+
+from libardurep import record
+
+class TestSensorRecord(unittest.TestCase):
+    def setUp(self):
+        self.R = record.make_record_type("id", "value", "unit", \
+                        "threshold", ["warn", "note"], "sensor_time", "time")
+
+    def test_mapping(self):
+        r = self.R("a", 8, "m", record.MISSING, \
+                        (record.MISSING, "ok"), record.MISSING, "now")
+        self.assertEqual("a", r["id"])
+        self.assertEqual(8, r["value"])
+        self.assertEqual("ok", r["note"])
+        self.assertTrue("unit" in r)
+        self.assertFalse("threshold" in r)
+        self.assertFalse("warn" in r)
+        self.assertFalse("foo" in r)
+        self.assertIs(r.get("threshold"), None)
+        with self.assertRaises(KeyError):
+            r["threshold"]
+        self.assertEqual(["id", "value", "unit", "note", "time"], list(r))
+        self.assertEqual(5, len(r))
+        self.assertEqual({"id": "a", "value": 8, "unit": "m", "note": "ok", \
+                                                "time": "now"}, r.to_dict())
+        self.assertEqual(r.to_dict(), r)
+
+    def test_keys(self):
+        R = record.make_record_type("name", "v", "u", "t", [], "st", "ts")
+        r = R("a", 1)
+        self.assertEqual({"name": "a", "v": 1}, r.to_dict())
+        self.assertFalse("id" in r)
+
+    def test_slots(self):
+        r = self.R("a", 1)
+        with self.assertRaises(AttributeError):
+            r.foo = 1
@@ -0,0 +1,164 @@
+import unittest
+import json
+import shutil
+import tempfile
+import time
+
+from libardurep import datastore, datareporter, reportpipeline
+from tests.test_datareporter import start_collector
+
+class TestReportPipeline(unittest.TestCase):
+    def setUp(self):
+        self.store = datastore.DataStore()
+        self.server, self.url = start_collector()
+        self.reporter = datareporter.DataReporter(self.store, self.url)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.reporter.close()
+
+    def test_policy(self):
+        with self.assertRaises(ValueError):
+            reportpipeline.ReportPipeline(self.reporter, policy="foo")
+
+    def test_submit(self):
+        pipeline = reportpipeline.ReportPipeline(self.reporter, workers=2)
+        pipeline.start()
+        for i in range(5):
+            self.store.register_json('[{"id":"foo","value":%d}]' % i)
+            self.assertTrue(pipeline.submit())
+        pipeline.stop(5)
+        c = pipeline.get_counters()
+        self.assertEqual(5, c["queued"])
+        self.assertEqual(5, c["sent"])
+        self.assertEqual(0, c["waiting"])
+        self.assertEqual(5, len(self.server.posts))
+        values = sorted([json.loads(b)[0]["value"] \
+                                            for h, b in self.server.posts])
+        self.assertEqual([0, 1, 2, 3, 4], values)
+
+    def test_backpressure(self):
+        for policy, kept, result in (("drop_oldest", ["3", "4"], True), \
+                                    ("drop_newest", ["0", "1"], False), \
+                                    ("coalesce", ["0", "4"], True)):
+            pipeline = reportpipeline.ReportPipeline(self.reporter, \
+                                                maxsize=2, policy=policy)
+            for i in range(5):
+                r = pipeline.submit(str(i))
+            self.assertEqual(result, r)
+            self.assertEqual(kept, list(pipeline.queue))
+            self.assertEqual(3, pipeline.get_counters()["dropped"])
+
+    def test_block(self):
+        pipeline = reportpipeline.ReportPipeline(self.reporter, maxsize=1, \
+                                                            policy="block")
+        pipeline.submit("[]")
+        pipeline.start()
+        for i in range(3):
+            pipeline.submit("[]")
+        pipeline.stop(5)
+        self.assertEqual(4, pipeline.get_counters()["sent"])
+        self.assertEqual(0, pipeline.get_counters()["dropped"])
+
+    def test_block_stopped(self):
+        pipeline = reportpipeline.ReportPipeline(self.reporter, maxsize=1, \
+                                                            policy="block")
+        self.assertTrue(pipeline.submit("[1]"))
+        pipeline.stopping.set()
+        # not beyond maxsize, even though nobody takes the first one
+        self.assertFalse(pipeline.submit("[2]"))
+        self.assertEqual(["[1]"], list(pipeline.queue))
+        self.assertEqual(1, pipeline.get_counters()["dropped"])
+
+    def test_sessions(self):
+        sessions = []
+        send = self.reporter.send
+        def record(data, url=None, credentials=None, \
+                                    do_verify_certificate=True, session=None):
+            sessions.append(session)
+            return send(data, url, credentials, do_verify_certificate, \
+                                                                    session)
+        self.reporter.send = record
+        pipeline = reportpipeline.ReportPipeline(self.reporter, workers=2)
+        pipeline.start()
+        for i in range(4):
+            pipeline.submit("[%d]" % i)
+        pipeline.stop(5)
+        self.assertEqual(4, pipeline.get_counters()["sent"])
+        # every worker has a session of its own, not the reporter's
+        self.assertNotIn(None, sessions)
+        self.assertIsNone(self.reporter.session)
+
+    def test_retry(self):
+        self.server.status = 503
+        pipeline = reportpipeline.ReportPipeline(self.reporter, retries=2, \
+                                                                backoff=0.01)
+        pipeline.start()
+        pipeline.submit("[]")
+        time.sleep(0.5)
+        pipeline.stop(5)
+        c = pipeline.get_counters()
+        self.assertEqual(0, c["sent"])
+        self.assertEqual(1, c["failed"])
+        self.assertEqual(3, len(self.server.posts))
+        # and back again
+        self.server.status = 200
+        pipeline.start()
+        pipeline.submit("[]")
+        pipeline.stop(5)
+        self.assertEqual(1, pipeline.get_counters()["sent"])
+
+    def test_spool_first(self):
+        d = tempfile.mkdtemp()
+        try:
+            self.reporter.open_spool(d, replay_batch=1, replay_rate=0.001, \
+                                                            replay_burst=1)
+            self.reporter.spool.append("[1]")
+            self.reporter.spool.append("[2]")
+            pipeline = reportpipeline.ReportPipeline(self.reporter)
+            pipeline.start()
+            # only one of the spooled ones may be replayed now, the new
+            # one is spooled behind the other
+            pipeline.submit("[3]")
+            pipeline.stop(5)
+            self.assertEqual(["[1]"], [b for h, b in self.server.posts])
+            self.assertEqual(3, self.reporter.spool.get_counters()["spooled"])
+            self.reporter.spool.replay_burst = 3
+            self.reporter.spool.tokens = 3
+            pipeline.start()
+            pipeline.submit("[4]")
+            pipeline.stop(5)
+            self.assertEqual(["[1]", "[2]", "[3]", "[4]"], \
+                                        [b for h, b in self.server.posts])
+            self.assertEqual(0, len(self.reporter.spool))
+        finally:
+            self.reporter.close()
+            shutil.rmtree(d)
+
+    def test_submit_while_replaying(self):
+        d = tempfile.mkdtemp()
+        try:
+            self.reporter.enable_delta()
+            self.reporter.open_spool(d, replay_batch=1, replay_rate=100, \
+                                                            replay_burst=5)
+            for i in range(5):
+                self.reporter.spool.append("[%d]" % i)
+            self.server.delay = 0.5
+            pipeline = reportpipeline.ReportPipeline(self.reporter)
+            pipeline.start()
+            pipeline.submit("[5]")
+            # the worker is replaying the spool to the slow collector now
+            time.sleep(0.2)
+            for i in range(3):
+                self.store.register_json('[{"id":"foo","value":%d}]' % i)
+                start = time.time()
+                self.assertTrue(pipeline.submit())
+                self.assertLess(time.time() - start, 0.1)
+            self.server.delay = 0
+            pipeline.stop(10)
+            self.assertEqual(["[%d]" % i for i in range(6)], \
+                                    [b for h, b in self.server.posts][:6])
+        finally:
+            self.reporter.close()
+            shutil.rmtree(d)
@@ -0,0 +1,49 @@
+import unittest
+import json
+import jsonschema
+import subprocess
+import sys
+
+from libardurep import datastore, schemaregistry
+
+class TestSchemaRegistry(unittest.TestCase):
+    def setUp(self):
+        with open("./schemas/meta-schema.json", "r") as fh:
+            self.meta = fh.read()
+        with open("./examples/extended-input-schema.json", "r") as fh:
+            self.schema = fh.read()
+        self.registry = schemaregistry.SchemaRegistry()
+
+    def test_validate(self):
+        s = self.registry.validate(self.schema, self.meta)
+        self.assertIs(s, self.registry.validate(self.schema, self.meta))
+        self.assertEqual(1, len(self.registry.validated))
+        broken = json.dumps({"type": "list"})
+        with self.assertRaises(jsonschema.ValidationError):
+            self.registry.validate(broken, self.meta)
+        self.assertEqual(1, len(self.registry.validated))
+
+    def test_shared(self):
+        a = datastore.DataStore(self.schema, self.meta, \
+                                                registry=self.registry)
+        b = datastore.DataStore(self.schema, self.meta, \
+                                                registry=self.registry)
+        c = datastore.DataStore(registry=self.registry)
+        self.assertIs(a.extract, b.extract)
+        self.assertIs(a.record_type, b.record_type)
+        self.assertIsNot(a.extract, c.extract)
+        self.assertEqual(2, len(self.registry.mappings))
+        # but not the data
+        a.register_json('[ {"ourVeryCustomSensorName":"a","sensorValue":1} ]')
+        self.assertEqual(["a"], list(a.data.keys()))
+        self.assertEqual({}, b.data)
+
+    def test_lazy_import(self):
+        code = "import sys; from libardurep import datastore; " \
+                "datastore.DataStore().register_json('[]'); " \
+                "print('jsonschema' in sys.modules)"
+        out = subprocess.check_output([sys.executable, "-c", code])
+        self.assertEqual(b"False", out.strip())
+
+if __name__ == '__main__':
+    unittest.main()
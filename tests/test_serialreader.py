@@ -1,5 +1,5 @@
 
-import unittest2 as unittest
+import unittest
 import json
 import serial
 import time
@@ -77,3 +77,49 @@ class TestSerialReader(unittest.TestCase):
         self.assertEqual("777", a.data["bar"]["value"])
         self.assertEqual("888", a.data["foo"]["value"])
         self.assertEqual("666", b.data["foo"]["value"])
+
+    def test_blocking_single_run(self):
+        self.reader = serialreader.SerialReader(None, 9600, self.store, 1, \
+                                                            blocking=True)
+        self.reader.device = serial.serial_for_url("loop://", timeout=5)
+        self.reader.device.write(self.test_json.encode())
+        self.reader.run()
+        self.assertEqual("777", self.store.data["light_value"]["value"])
+
+    def test_blocking_partial_line(self):
+        self.reader = serialreader.SerialReader(None, 9600, self.store, 2, \
+                                                            blocking=True)
+        self.reader.device = serial.serial_for_url("loop://", timeout=1)
+        self.reader.device.write(' \n[ \n  {"id":"light_va'.encode())
+        self.reader.run()
+        self.assertFalse("light_value" in self.store.data)
+        # the rest of the line arrives later on
+        self.reader.rounds = 1
+        self.reader.do_run = True
+        self.reader.device.write('lue","value":"777"} \n] \n'.encode())
+        self.reader.run()
+        self.assertEqual("777", self.store.data["light_value"]["value"])
+
+    def test_blocking_thread(self):
+        self.reader = serialreader.SerialReader(None, 9600, self.store, 0, \
+                                                            blocking=True)
+        self.reader.device = serial.serial_for_url("loop://", timeout=300)
+        self.reader.start()
+        self.assertTrue(self.reader.is_alive())
+        self.reader.device.write(self.test_json.encode())
+        time.sleep(0.5)
+        self.assertEqual("777", self.store.data["light_value"]["value"])
+        self.reader.halt()
+        self.reader.join(2)
+        self.assertFalse(self.reader.is_alive())
+
+    def test_corrupt_line(self):
+        self.reader = serialreader.SerialReader(None, 9600, self.store, 1, \
+                                                            blocking=True)
+        self.reader.device = serial.serial_for_url("loop://", timeout=5)
+        self.reader.device.write(b'[ \n  {"id":"a","value":"1"} \n' + \
+                                    b'  {"id":"\xff",broken \n' + \
+                                    b'  {"id":"b","value":"2"} \n] \n')
+        self.reader.run()
+        self.assertEqual("1", self.store.data["a"]["value"])
+        self.assertEqual("2", self.store.data["b"]["value"])
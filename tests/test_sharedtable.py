@@ -0,0 +1,144 @@
+import unittest
+import json
+import os
+import time
+import tty
+
+from libardurep import datastore, metrics, sharedtable
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8
+    shared_memory = None
+
+@unittest.skipIf(shared_memory is None, "shared memory is not available")
+class TestSharedTable(unittest.TestCase):
+    def setUp(self):
+        self.table = sharedtable.SharedSensorTable(2, 4, 64)
+        self.store = datastore.DataStore(metrics=False)
+        self.reader = sharedtable.TableReader(self.table, self.store)
+
+    def tearDown(self):
+        self.table.close()
+        self.table.unlink()
+
+    def test_update(self):
+        a = self.table.get_writer(0)
+        b = self.table.get_writer(1)
+        a.register_records([{"id": "a", "value": 1}, \
+                                        {"id": "b", "value": 2, "unit": "C"}])
+        b.register_records([{"id": "c", "value": 3}], 1000.0)
+        self.assertEqual(3, self.reader.update())
+        self.assertEqual(1, self.store.data["a"]["value"])
+        self.assertEqual("C", self.store.data["b"]["unit"])
+        self.assertEqual(3, self.store.data["c"]["value"])
+        # only what changed is taken over
+        self.assertEqual(0, self.reader.update())
+        a.register_records([{"id": "b", "value": 4}])
+        version = self.store.version
+        self.assertEqual(1, self.reader.update())
+        self.assertEqual({"b"}, set(self.store.get_changes(version)[1]))
+        self.assertEqual(4, self.store.data["b"]["value"])
+        self.assertNotIn("unit", self.store.data["b"])
+
+    def test_entries(self):
+        entries = [{"id": "a", "value": 1.5, "unit": "C", "threshold": 3}, \
+                {"id": u"b\u00b0", "value": -2, "threshold": 2.5}, \
+                {"id": "c", "value": 2 ** 70}, {"id": "d", "value": True}, \
+                {"id": "e", "value": 1.0, "unit": None}, \
+                {"id": "f", "value": float("nan")}, \
+                {"id": "g", "value": 1, "other": "x"}]
+        keys = sharedtable.KEYS
+        encoded = [sharedtable.encode_entry(v, keys, json.dumps) \
+                                                            for v in entries]
+        self.assertEqual([sharedtable.PACKED | sharedtable.UNIT | \
+                sharedtable.THRESHOLD | sharedtable.INT_THRESHOLD, \
+                sharedtable.PACKED | sharedtable.INT_VALUE | \
+                sharedtable.THRESHOLD] + [sharedtable.JSON] * 5, \
+                                                [k for k, e in encoded])
+        decoded = sharedtable.decode_entries(encoded, keys, \
+                                    lambda b: json.loads(b.decode("UTF-8")))
+        self.assertEqual(entries[:5], decoded[:5])
+        self.assertIs(int, type(decoded[0]["threshold"]))
+        self.assertIs(True, decoded[3]["value"])
+        self.assertEqual(entries[6], decoded[6])
+
+    def test_received(self):
+        a = self.table.get_writer(0)
+        b = self.table.get_writer(1)
+        a.register_records([{"id": "a", "value": 1}], 1000.0)
+        b.register_records([{"id": "b", "value": 2}], 999.0)
+        a.register_records([{"id": "c", "value": 3}], 1001.0)
+        self.assertEqual(3, self.reader.update())
+        # every entry keeps its time of arrival
+        self.assertEqual([999.0, 1000.0, 1001.0], [self.store.data[k]. \
+                                            received for k in ("b", "a", "c")])
+
+    def test_dropped(self):
+        a = self.table.get_writer(0)
+        a.register_records([{"value": 1}, {"id": ["x"], "value": 1}, \
+                            {"id": "long", "value": "x" * 64}] + \
+                            [{"id": str(i), "value": i} for i in range(5)])
+        self.assertEqual(4, a.dropped)
+        self.assertEqual(4, self.reader.update())
+        self.assertEqual(["0", "1", "2", "3"], sorted(self.store.data))
+        # published in the table, and taken over by a new writer
+        self.assertEqual((4, 0, 4), (self.table.get_dropped(0), \
+                        self.table.get_dropped(1), self.table.get_dropped()))
+        self.assertEqual(4, self.table.get_writer(0).dropped)
+
+    def test_attach(self):
+        self.table.get_writer(0).register_records([{"id": "a", "value": 1}])
+        other = sharedtable.SharedSensorTable.attach(self.table.name, \
+                                                            self.table.locks)
+        try:
+            self.assertEqual((2, 4, 64), (other.partitions, other.slots, \
+                                                            other.entry_size))
+            # a new writer takes over the slots
+            w = other.get_writer(0)
+            w.register_records([{"id": "b", "value": 2}, \
+                                                    {"id": "a", "value": 3}])
+            self.assertEqual({"a": 0, "b": 1}, w.slot_of)
+        finally:
+            other.close()
+        self.assertEqual(2, self.reader.update())
+        self.assertEqual(3, self.store.data["a"]["value"])
+
+@unittest.skipIf(shared_memory is None, "shared memory is not available")
+class TestIngestPool(unittest.TestCase):
+    @unittest.skipUnless(hasattr(os, "openpty"), "no pseudo terminals")
+    def test_pool(self):
+        ptys = [os.openpty(), os.openpty()]
+        for master, slave in ptys:
+            tty.setraw(slave)
+        store = datastore.DataStore(metrics=False)
+        registry = metrics.MetricsRegistry()
+        pool = sharedtable.IngestPool([os.ttyname(s) for m, s in ptys], \
+                            9600, store, 2, timeout=0.2, metrics=registry)
+        try:
+            pool.start()
+            time.sleep(0.5)
+            for i, (master, slave) in enumerate(ptys):
+                os.write(master, ('[\r\n  {"id":"s%d","value":%d}\r\n' \
+                            '  {"value":%d}\r\n]\r\n' % (i, i, i)).encode())
+            for i in range(50):
+                pool.update()
+                if len(store.data) == 2:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(0, store.data["s0"]["value"])
+            self.assertEqual(1, store.data["s1"]["value"])
+            # the entries without an id are counted by the workers
+            self.assertEqual(2, pool.dropped)
+        finally:
+            pool.stop()
+            for master, slave in ptys:
+                os.close(master)
+                os.close(slave)
+        self.assertEqual([], pool.processes)
+        self.assertEqual(2, pool.dropped)
+        self.assertEqual(2, registry.get_value( \
+                "ardu_ingest_entries_dropped_total", store=store.name))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+from libardurep import datastore, datareporter, spool
+from tests.test_datareporter import start_collector, stop_collector
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_segments(self):
+        s = spool.Spool(self.dir, segment_size=20, max_bytes=1000)
+        for i in range(5):
+            s.append("[%d, 0000000]" % i)
+        self.assertEqual(3, len(s.segments))
+        sent = []
+        self.assertEqual(5, s.replay(lambda d: sent.append(d) or True, \
+                                                                    ",".join))
+        self.assertEqual(["[0, 0000000],[1, 0000000]", \
+                    "[2, 0000000],[3, 0000000]", "[4, 0000000]"], sent)
+        self.assertEqual(0, len(s))
+        # the replayed segments are gone
+        self.assertEqual(1, len(s.segments))
+        s.close()
+
+    def test_evict(self):
+        s = spool.Spool(self.dir, segment_size=30, max_bytes=60)
+        for i in range(10):
+            s.append("%020d" % i)
+        self.assertEqual(8, s.get_counters()["dropped"])
+        sent = []
+        s.replay(lambda d: sent.append(d) or True)
+        self.assertEqual(["%020d" % 8, "%020d" % 9], sent)
+        s.close()
+
+    def test_rate(self):
+        s = spool.Spool(self.dir, replay_batch=1, replay_rate=0.001, \
+                                                            replay_burst=2)
+        for i in range(5):
+            s.append(str(i))
+        self.assertEqual(2, s.replay(lambda d: True))
+        self.assertEqual(0, s.replay(lambda d: True))
+        s.close()
+
+    def test_failure(self):
+        s = spool.Spool(self.dir)
+        s.append("a")
+        s.append("b")
+        self.assertEqual(0, s.replay(lambda d: False))
+        s.close()
+        # the spool and the cursor survive a restart
+        s = spool.Spool(self.dir)
+        sent = []
+        self.assertEqual(1, s.replay(lambda d: d == "a" and \
+                                                        not sent.append(d)))
+        s.close()
+        # as does an incomplete payload at the end
+        with open(os.path.join(self.dir, s.segments[-1]), "ab") as fh:
+            fh.write(b"\x10\x00\x00\x00abc")
+        s = spool.Spool(self.dir)
+        s.append("c")
+        s.replay(lambda d: sent.append(d) or True)
+        self.assertEqual(["a", "b", "c"], sent)
+        s.close()
+
+    def test_behind_backlog(self):
+        store = datastore.DataStore()
+        server, url = start_collector()
+        reporter = datareporter.DataReporter(store, url)
+        reporter.open_spool(self.dir, replay_batch=1, replay_rate=0.001, \
+                                                            replay_burst=1)
+        try:
+            reporter.spool.append('[{"id":"foo","value":1}]')
+            reporter.spool.append('[{"id":"foo","value":2}]')
+            store.register_json('[{"id":"foo","value":3}]')
+            # only one of the spooled ones may be replayed now, the new
+            # one waits behind the other
+            self.assertFalse(reporter.deliver(reporter.get_report_json()))
+            self.assertEqual([[1]], [[d["value"] for d in json.loads(p)] \
+                                                for u, p in server.posts])
+            reporter.spool.replay_burst = reporter.spool.tokens = 2
+            reporter.replay()
+            self.assertEqual([[1], [2], [3]], [[d["value"] for d in \
+                                    json.loads(p)] for u, p in server.posts])
+        finally:
+            stop_collector(server)
+            reporter.close()
+
+    def test_store_and_forward(self):
+        store = datastore.DataStore()
+        server, url = start_collector()
+        port = server.server_address[1]
+        reporter = datareporter.DataReporter(store, url)
+        reporter.open_spool(self.dir, replay_batch=10)
+        try:
+            store.register_json('[{"id":"foo","value":0}]')
+            reporter.log()
+            # the uplink drops
+            stop_collector(server)
+            for i in range(1, 4):
+                store.register_json('[{"id":"foo","value":%d}]' % i)
+                reporter.log()
+            self.assertEqual(3, reporter.spool.get_counters()["spooled"])
+            # and is back again
+            server, url = start_collector(port)
+            store.register_json('[{"id":"foo","value":4}]')
+            reporter.log()
+            self.assertEqual(2, len(server.posts))
+            # the older ones first
+            self.assertEqual([1, 2, 3], [d["value"] for d in \
+                                            json.loads(server.posts[0][1])])
+            self.assertEqual([4], [d["value"] for d in \
+                                            json.loads(server.posts[1][1])])
+            self.assertEqual(0, len(reporter.spool))
+        finally:
+            stop_collector(server)
+            reporter.close()
+
+if __name__ == '__main__':
+    unittest.main()
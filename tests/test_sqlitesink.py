@@ -0,0 +1,129 @@
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from libardurep import datareporter, datastore, sqlitesink
+
+class TestSQLiteSink(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "db.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_batches(self):
+        s = sqlitesink.SQLiteSink(self.path, batch_size=3)
+        s.append("a", 1.0, 1)
+        s.append("a", 2.0, 2)
+        self.assertEqual([], s.get_range("a"))
+        s.append("b", 2.0, "high")
+        self.assertEqual([(1.0, 1), (2.0, 2)], s.get_range("a"))
+        # old samples are skipped
+        self.assertFalse(s.append("a", 2.0, 5))
+        s.close()
+
+    def test_not_scalar(self):
+        s = sqlitesink.SQLiteSink(self.path, batch_size=2)
+        s.append("a", 1.0, 1)
+        s.append("b", 1.0, [1, 2], {"x": 1})
+        self.assertEqual((1.0, None), s.latest("b"))
+        self.assertEqual("[1, 2]", s.db.execute("SELECT entry FROM samples " \
+                                        "WHERE sensor = 'b'").fetchone()[0])
+        self.assertEqual((1.0, 1), s.latest("a"))
+        s.close()
+
+    def test_failed_flush(self):
+        s = sqlitesink.SQLiteSink(self.path, batch_size=10)
+        s.append("a", 1.0, 1)
+        s.db.execute("DROP TABLE samples")
+        with self.assertRaises(sqlite3.Error):
+            s.flush()
+        # nothing is lost
+        self.assertEqual(1, len(s.pending))
+        for q in sqlitesink.SCHEMA:
+            s.db.execute(q)
+        s.flush()
+        self.assertEqual((1.0, 1), s.latest("a"))
+        s.close()
+
+    def test_max_pending(self):
+        s = sqlitesink.SQLiteSink(self.path, batch_size=1, max_pending=3)
+        s.db.execute("DROP TABLE samples")
+        for i in range(1, 10):
+            with self.assertRaises(sqlite3.Error):
+                s.append("a", float(i), i)
+        # only the newest are kept
+        self.assertEqual([7.0, 8.0, 9.0], [r[1] for r in s.pending])
+        self.assertEqual(6, s.dropped)
+        for q in sqlitesink.SCHEMA:
+            s.db.execute(q)
+        s.flush()
+        self.assertEqual([(7.0, 7), (8.0, 8), (9.0, 9)], s.get_range("a"))
+        s.close()
+
+    def test_synchronous(self):
+        sqlitesink.SQLiteSink(self.path, synchronous="full").close()
+        with self.assertRaises(ValueError):
+            sqlitesink.SQLiteSink(self.path, synchronous="OFF; DROP TABLE x")
+
+    def test_queries(self):
+        s = sqlitesink.SQLiteSink(self.path, batch_size=1000)
+        for i in range(20):
+            s.append("a", 100.0 + i, i)
+            s.append("b", 100.0 + i, "x")
+        s.flush()
+        self.assertEqual((119.0, 19), s.latest("a"))
+        self.assertIsNone(s.latest("c"))
+        self.assertEqual([(105.0, 5), (106.0, 6)], s.get_range("a", 105, 106))
+        self.assertEqual([(100, 10, 0, 9, 4.5), (110, 10, 10, 19, 14.5)], \
+                                                    s.get_aggregates("a", 10))
+        self.assertEqual([(110, 5, 10, 14, 12.0)], \
+                                    s.get_aggregates("a", 10, 110, 114.5))
+        # text values are not aggregated
+        self.assertEqual([], s.get_aggregates("b", 10))
+        self.assertEqual(["a", "b"], sorted(s.sensors()))
+        s.close()
+
+    def test_indexes(self):
+        s = sqlitesink.SQLiteSink(self.path)
+        for q, args in (("SELECT time, value FROM samples WHERE sensor = ? " \
+                            "AND time BETWEEN ? AND ?", ("a", 0, 1)), \
+                        ("SELECT * FROM samples WHERE time > ?", (0,))):
+            plan = " ".join([str(r[-1]) for r in \
+                        s.db.execute("EXPLAIN QUERY PLAN " + q, args)])
+            self.assertIn("INDEX", plan)
+        self.assertEqual("wal", s.db.execute( \
+                                        "PRAGMA journal_mode").fetchone()[0])
+        s.close()
+
+    def test_log_sqlite(self):
+        store = datastore.DataStore()
+        reporter = datareporter.DataReporter(store, "sqlite://" + self.path)
+        store.register_json('[ {"id":"a","value":1,"unit":"C"} ]')
+        reporter.log()
+        # in the database without closing the reporter
+        db = sqlite3.connect(self.path)
+        self.assertEqual(1, db.execute("SELECT COUNT(*) FROM samples" \
+                                                        ).fetchone()[0])
+        db.close()
+        reporter.log()
+        store.register_json('[ {"id":"a","value":2,"unit":"C"} ]')
+        reporter.log()
+        reporter.close()
+        db = sqlite3.connect(self.path)
+        rows = db.execute("SELECT value, unit, entry FROM samples " \
+                                                    "ORDER BY time").fetchall()
+        db.close()
+        self.assertEqual(2, len(rows))
+        self.assertEqual((2, "C"), rows[1][0:2])
+        self.assertIn('"value": 2', rows[1][2])
+        # continue where it stopped
+        s = sqlitesink.SQLiteSink(self.path)
+        self.assertEqual(0, s.append_snapshot(store))
+        s.close()
+
+if __name__ == '__main__':
+    unittest.main()
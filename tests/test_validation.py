@@ -0,0 +1,95 @@
+import unittest
+import json
+
+from libardurep import datastore, schemaregistry, validation
+
+class TestValidation(unittest.TestCase):
+    def setUp(self):
+        with open("./schemas/meta-schema.json", "r") as fh:
+            self.meta = fh.read()
+        with open("./examples/extended-input-schema.json", "r") as fh:
+            self.schema = fh.read()
+
+    def test_compile_validator(self):
+        check = validation.compile_validator(validation.DEFAULT_ITEMS)
+        self.assertIsNone(check({"id": "a", "value": 1.5, "unit": "C"}))
+        self.assertIsNone(check({"id": "a", "value": 1, "other": [1]}))
+        self.assertEqual("not an object", check(["a", 1]))
+        self.assertEqual("missing value", check({"id": "a"}))
+        self.assertEqual("wrong type of value", \
+                                            check({"id": "a", "value": "1"}))
+        self.assertEqual("wrong type of value", \
+                                            check({"id": "a", "value": True}))
+        self.assertEqual("wrong type of unit", \
+                                check({"id": "a", "value": 1, "unit": 2}))
+
+    def test_checked_extract(self):
+        plain = datastore.DataStore(self.schema, self.meta)
+        checked = datastore.DataStore(self.schema, self.meta, \
+                                                    validation="reject")
+        self.assertIsNot(plain.extract, checked.extract)
+        for v in ({"ourVeryCustomSensorName": "a", "sensorValue": 1}, \
+                    {"ourVeryCustomSensorName": "a", "sensorValue": 1.5, \
+                    "sensorValueUnit": "C", "criticalThreshold": 3, \
+                    "measurementTimestamp": "2017-01-01T00:00:00"}, \
+                    {"ourVeryCustomSensorName": "a", "sensorValue": 1, \
+                    "warnThreshold": 2, "ignored": [1]}):
+            self.assertEqual(plain.extract(v, "t", 1.0), \
+                                            checked.extract(v, "t", 1.0))
+        for v in ({"ourVeryCustomSensorName": 1, "sensorValue": 1}, \
+                    {"ourVeryCustomSensorName": "a", "sensorValue": "1"}, \
+                    {"ourVeryCustomSensorName": "a", "sensorValue": 1, \
+                    "warnThreshold": "2"}):
+            self.assertIsNone(checked.extract(v, "t", 1.0))
+
+    def test_reject(self):
+        store = datastore.DataStore(validation="reject")
+        store.register_json(json.dumps([
+            {"id": "a", "value": 1},
+            {"id": "b", "value": "broken"},
+            {"value": 3},
+            "c",
+            {"id": "d", "value": 4, "unit": "C"}
+        ]))
+        # the rest of the frame is registered
+        self.assertEqual(["a", "d"], sorted(store.data.keys()))
+        self.assertEqual({"b": 1, None: 2}, store.get_rejected())
+        self.assertEqual([], store.get_quarantine("b"))
+        self.assertEqual(1, store.version)
+
+    def test_quarantine(self):
+        store = datastore.DataStore(self.schema, self.meta, \
+                            validation="quarantine", quarantine_size=2)
+        for i in range(3):
+            store.register_json(json.dumps([
+                {"ourVeryCustomSensorName": "a", "sensorValue": i},
+                {"ourVeryCustomSensorName": "b", "sensorValue": i, \
+                                                "criticalThreshold": "x%d" % i}
+            ]))
+        self.assertEqual(2, store.data["a"].value)
+        self.assertNotIn("b", store.data)
+        self.assertEqual({"b": 3}, store.get_rejected())
+        q = store.get_quarantine("b")
+        self.assertEqual(2, len(q))
+        self.assertEqual("wrong type of criticalThreshold", q[0][1])
+        self.assertEqual("x1", q[0][2]["criticalThreshold"])
+        self.assertEqual("x2", q[1][2]["criticalThreshold"])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            datastore.DataStore(validation="strict")
+
+    def test_shared(self):
+        registry = schemaregistry.SchemaRegistry()
+        a = datastore.DataStore(self.schema, self.meta, registry=registry, \
+                                                        validation="reject")
+        b = datastore.DataStore(self.schema, self.meta, registry=registry, \
+                                                    validation="quarantine")
+        c = datastore.DataStore(self.schema, self.meta, registry=registry)
+        self.assertIs(a.extract, b.extract)
+        self.assertIs(a.check, b.check)
+        self.assertIsNot(a.extract, c.extract)
+        self.assertIsNone(c.check)
+
+if __name__ == '__main__':
+    unittest.main()